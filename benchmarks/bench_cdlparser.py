@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for cdlparser. A set of synthetic CDL files is generated at a controlled scale and
+each one is then lexed, parsed into an in-memory netCDF dataset, and converted to a netCDF file on
+disk, with the time taken by each phase being recorded. The reported metrics are:
+
+* tokens/sec and MB/sec for the lexing phase, in which the token stream is simply drained
+* MB/sec for the parsing phase, i.e. lexing plus grammar actions plus in-memory netCDF writes
+* MB/sec for the end-to-end conversion of the CDL file to a netCDF file on disk
+* a breakdown of the end-to-end conversion time into lexing, grammar actions, and netCDF define
+  and write calls, as reported by the parser's collect_stats option
+* peak memory allocated by python code during the end-to-end conversion, as measured by the
+  tracemalloc module (where available - it isn't on python 2)
+
+The best of several repeats is reported for each phase. Results can be saved to a JSON file and,
+on a later run, compared against such a file in order to catch performance regressions, e.g.
+
+    python bench_cdlparser.py --save baseline.json
+    ... upgrade cdlparser ...
+    python bench_cdlparser.py --compare baseline.json
+
+The comparison fails, with exit status 1, if any phase is slower than the baseline by more than
+the tolerance specified via the --tolerance option (20% by default).
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+try :
+   import tracemalloc
+except ImportError :
+   tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import cdlparser
+import netCDF4 as nc4
+import numpy as np
+
+# default number of times that each phase is repeated
+DEFAULT_REPEATS = 3
+
+# default fractional slowdown, relative to a baseline, that is reported as a regression
+DEFAULT_TOLERANCE = 0.2
+
+# phases whose throughput is compared against a baseline
+PHASES = ('lex', 'parse', 'convert')
+
+#---------------------------------------------------------------------------------------------------
+def generate_cdl(name, nvars=1, natts=0, nvalues=0, nchars=0, nrecs=0, seed=0) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Generate synthetic CDL text. The dataset contains nvars float and double variables, each of
+   which has natts attributes of mixed type and nvalues data values, plus a character variable
+   holding nchars strings. If nrecs is non-zero then an unlimited dimension is added, along with
+   an int and a float record variable holding nrecs records of data values.
+   """
+   rng = np.random.RandomState(seed)
+   lines = ["netcdf %s {" % name]
+   dims = []
+   if nvalues : dims.append("   x = %d ;" % nvalues)
+   if nchars : dims += ["   nstrings = %d ;" % nchars, "   strlen = 16 ;"]
+   if nrecs : dims += ["   y = 4 ;", "   time = unlimited ;"]
+   if dims : lines += ["dimensions:"] + dims
+
+   lines.append("variables:")
+   dims = "(x)" if nvalues else ""
+   for i in range(nvars) :
+      lines.append("   %s var%d%s ;" % ("double" if i % 2 else "float", i, dims))
+      for j in range(natts) :
+         if j % 3 == 0 :
+            lines.append('      var%d:text%d = "attribute %d of variable %d" ;' % (i, j, j, i))
+         elif j % 3 == 1 :
+            lines.append("      var%d:ints%d = %s ;" % (i, j, ", ".join(map(str, range(j)))))
+         else :
+            lines.append("      var%d:real%d = %sf ;" % (i, j, rng.uniform()))
+   if nchars :
+      lines += ["   char names(nstrings, strlen) ;", '      names:long_name = "names" ;']
+   if nrecs :
+      lines += ["   int time(time) ;", "   float rvar(time, y) ;", "      rvar:_FillValue = -1.f ;"]
+   lines.append("   :title = \"synthetic CDL benchmark dataset\" ;")
+
+   lines.append("data:")
+   for i in range(nvars) :
+      if not nvalues : break
+      values = rng.uniform(-1000, 1000, nvalues)
+      lines.append(" var%d = %s ;" % (i, format_values(values, "%.9g")))
+   if nchars :
+      names = ['"name_%08d"' % i for i in range(nchars)]
+      lines.append(" names = %s ;" % format_values(names, "%s"))
+   if nrecs :
+      lines.append(" time = %s ;" % format_values(np.arange(nrecs), "%d"))
+      lines.append(" rvar = %s ;" % format_values(rng.uniform(0, 100, nrecs*4), "%.4f"))
+   lines.append("}")
+   return "\n".join(lines) + "\n"
+
+#---------------------------------------------------------------------------------------------------
+def format_values(values, fmt, per_line=8) :
+#---------------------------------------------------------------------------------------------------
+   """Format a sequence of data values as comma-separated CDL constants, per_line to a line."""
+   items = [fmt % v for v in values]
+   rows = [", ".join(items[i:i+per_line]) for i in range(0, len(items), per_line)]
+   return ",\n    ".join(rows)
+
+#---------------------------------------------------------------------------------------------------
+def scenarios(scale=1.0) :
+#---------------------------------------------------------------------------------------------------
+   """Return a dictionary of keyword arguments to generate_cdl, keyed by scenario name."""
+   n = lambda x: max(1, int(x * scale))
+   return {
+      'attributes': dict(nvars=n(200), natts=20),
+      'numeric':    dict(nvars=4, natts=2, nvalues=n(250000)),
+      'char':       dict(nvars=1, nchars=n(100000)),
+      'records':    dict(nvars=1, natts=2, nrecs=n(100000)),
+   }
+
+#---------------------------------------------------------------------------------------------------
+def best_time(func, repeats) :
+#---------------------------------------------------------------------------------------------------
+   """Call func repeats times and return the shortest elapsed time, plus func's last result."""
+   times = []
+   for i in range(repeats) :
+      start = time.time()
+      result = func()
+      times.append(time.time() - start)
+   return min(times), result
+
+#---------------------------------------------------------------------------------------------------
+def drain_tokens(parser, cdltext) :
+#---------------------------------------------------------------------------------------------------
+   """Lex cdltext without parsing it and return a dictionary of token counts keyed by type."""
+   lexer = parser.new_context().lexer
+   lexer.input(cdltext)
+   counts = {}
+   for tok in iter(lexer.token, None) :
+      counts[tok.type] = counts.get(tok.type, 0) + 1
+   return counts
+
+#---------------------------------------------------------------------------------------------------
+def run_scenario(name, kwargs, workdir, repeats=DEFAULT_REPEATS, lexer_backend='ply') :
+#---------------------------------------------------------------------------------------------------
+   """
+   Generate the CDL file for one scenario, benchmark each phase using parsers built with the given
+   lexer backend, and return the metrics.
+   """
+   cdltext = generate_cdl(name, **kwargs)
+   cdlfile = os.path.join(workdir, name + '.cdl')
+   ncfile = os.path.join(workdir, name + '.nc')
+   with open(cdlfile, 'w') as f :
+      f.write(cdltext)
+   mbytes = os.path.getsize(cdlfile) / 1e6
+   parser = cdlparser.CDL3Parser(close_on_completion=True, log_level=logging.ERROR,
+      lexer_backend=lexer_backend)
+   memparser = cdlparser.CDL3Parser(in_memory=True, log_level=logging.ERROR,
+      lexer_backend=lexer_backend)
+
+   lex_time, counts = best_time(lambda: drain_tokens(parser, cdltext), repeats)
+   ntokens = sum(counts.values())
+   parse_time, ncbuffer = best_time(lambda: memparser.parse_text(cdltext), repeats)
+   convert_time, ncdataset = best_time(lambda: parser.parse_file(cdlfile, ncfile=ncfile), repeats)
+
+   # break the end-to-end conversion time down further using the parser's own statistics
+   statsparser = cdlparser.CDL3Parser(close_on_completion=True, collect_stats=True,
+      log_level=logging.ERROR, lexer_backend=lexer_backend)
+   statsparser.parse_file(cdlfile, ncfile=ncfile)
+   stats = statsparser.stats
+
+   peak = None
+   if tracemalloc :
+      tracemalloc.start()
+      parser.parse_file(cdlfile, ncfile=ncfile)
+      peak = tracemalloc.get_traced_memory()[1] / 1e6
+      tracemalloc.stop()
+
+   return {
+      'cdl_mbytes': round(mbytes, 3),
+      'nc_mbytes': round(os.path.getsize(ncfile) / 1e6, 3),
+      'tokens': ntokens,
+      'token_counts': counts,
+      'lex_secs': lex_time,
+      'parse_secs': parse_time,
+      'convert_secs': convert_time,
+      'lex_tokens_per_sec': ntokens / lex_time,
+      'lex_mbytes_per_sec': mbytes / lex_time,
+      'parse_mbytes_per_sec': mbytes / parse_time,
+      'convert_mbytes_per_sec': mbytes / convert_time,
+      'peak_python_mbytes': peak,
+      'breakdown_secs': {
+         'lex': stats.lex_secs,
+         'grammar': stats.grammar_secs,
+         'netcdf_define': stats.netcdf_define_secs,
+         'netcdf_write': stats.netcdf_write_secs,
+      },
+   }
+
+#---------------------------------------------------------------------------------------------------
+def environment() :
+#---------------------------------------------------------------------------------------------------
+   """Return a dictionary describing the software environment in which the benchmarks were run."""
+   return {
+      'cdlparser': cdlparser.__version__,
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'numpy': np.__version__,
+      'netCDF4': nc4.__version__,
+      'netcdf_library': nc4.__netcdf4libversion__,
+      'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+   }
+
+#---------------------------------------------------------------------------------------------------
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Compare the results of a benchmark run with those of a baseline run, printing the percentage
+   change in the time taken by each phase. Returns the list of (scenario, phase) pairs for which
+   the time taken has increased by more than the specified fractional tolerance.
+   """
+   regressions = []
+   for name, metrics in sorted(results['scenarios'].items()) :
+      base = baseline['scenarios'].get(name)
+      if not base : continue
+      for phase in PHASES :
+         key = phase + '_secs'
+         change = metrics[key] / base[key] - 1
+         flag = ""
+         if change > tolerance :
+            regressions.append((name, phase))
+            flag = "  REGRESSION"
+         print("%-12s %-8s %8.3fs -> %8.3fs  %+7.1f%%%s" % (name, phase, base[key], metrics[key],
+            change*100, flag))
+   return regressions
+
+#---------------------------------------------------------------------------------------------------
+def main(argv=None) :
+#---------------------------------------------------------------------------------------------------
+   argparser = argparse.ArgumentParser(description="Run the cdlparser benchmark suite.")
+   argparser.add_argument('-s', '--scale', type=float, default=1.0,
+      help="factor by which to scale the size of the generated CDL files [default: 1.0]")
+   argparser.add_argument('-r', '--repeats', type=int, default=DEFAULT_REPEATS,
+      help="number of times to repeat each phase [default: %d]" % DEFAULT_REPEATS)
+   argparser.add_argument('-k', '--scenario', action='append',
+      help="name of a scenario to run, may be repeated [default: all scenarios]")
+   argparser.add_argument('-l', '--lexer-backend', choices=cdlparser.LEXER_BACKENDS, default='ply',
+      help="lexer implementation used by the parsers [default: ply]")
+   argparser.add_argument('--save', metavar='FILE', help="save the results to a JSON file")
+   argparser.add_argument('--compare', metavar='FILE',
+      help="compare the results with those in a JSON file saved by an earlier run")
+   argparser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+      help="fractional slowdown reported as a regression [default: %s]" % DEFAULT_TOLERANCE)
+   opts = argparser.parse_args(argv)
+
+   results = {'environment': environment(), 'scale': opts.scale,
+      'lexer_backend': opts.lexer_backend, 'scenarios': {}}
+   workdir = tempfile.mkdtemp()
+   try :
+      for name, kwargs in sorted(scenarios(opts.scale).items()) :
+         if opts.scenario and name not in opts.scenario : continue
+         metrics = run_scenario(name, kwargs, workdir, opts.repeats, opts.lexer_backend)
+         results['scenarios'][name] = metrics
+         peak = metrics['peak_python_mbytes']
+         print("%-12s %7.2f MB  lex %9.0f tokens/s %7.2f MB/s  parse %7.2f MB/s  "
+            "convert %7.2f MB/s  peak %s MB" % (name, metrics['cdl_mbytes'],
+            metrics['lex_tokens_per_sec'], metrics['lex_mbytes_per_sec'],
+            metrics['parse_mbytes_per_sec'], metrics['convert_mbytes_per_sec'],
+            "n/a" if peak is None else "%.1f" % peak))
+   finally :
+      shutil.rmtree(workdir)
+
+   if opts.save :
+      with open(opts.save, 'w') as f :
+         json.dump(results, f, indent=2, sort_keys=True)
+   if opts.compare :
+      with open(opts.compare) as f :
+         baseline = json.load(f)
+      if baseline.get('scale') != opts.scale :
+         print("Warning: baseline was run at scale %s" % baseline.get('scale'))
+      if compare_results(results, baseline, opts.tolerance) : return 1
+   return 0
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   sys.exit(main())
@@ -47,6 +47,85 @@ You can control the format of the netCDF output file using the 'file_format' key
 CDL3Parser constructor. For a description of this and other keyword arguments, read the docstring
 for the CDLParser.__init__ method.
 
+Batch Conversion
+----------------
+When run as a script, the cdlparser module converts one or more CDL files, specified as pathnames
+or glob patterns, to netCDF files. Trailing keyword=value arguments are passed to the CDL3Parser
+constructor. The -j option spreads the files across a pool of worker processes, each of which
+builds its parser just once, while the -o option specifies the output directory, e.g.:
+
+    python cdlparser.py -j 8 -o /my/nc/folder '/my/cdl/folder/*.cdl' file_format=NETCDF4_CLASSIC
+
+A summary of the time taken to convert each file, and of any failures, is printed on completion.
+The exit status is 1 if any of the files could not be converted.
+
+Conversion Cache
+----------------
+If the same CDL files are converted repeatedly then the netCDF output can be cached by passing a
+ConversionCache object to the CDL3Parser constructor via the cache keyword argument, e.g.:
+
+    myparser = CDL3Parser(cache=ConversionCache('/my/cache/folder', max_bytes=10**9))
+
+The parse_file() and parse_text() methods then look up the CDL input, together with the parser
+options that affect the output, in the cache. On a hit the cached netCDF file is copied (or, with
+hardlink=True, hard-linked) to the output file without the CDL being parsed. The least recently
+used files are evicted once the cache exceeds its size limits. The --cache-dir option enables the
+cache for batch conversions.
+
+Updating Existing Files
+-----------------------
+When a large CDL file is edited and converted again, only a few of its variables may have changed.
+Setting the update keyword argument to True makes the parser update an existing output file in
+place rather than recreate it, provided that the file's dimensions, variables and attributes match
+those in the CDL header:
+
+    myparser = CDL3Parser(update=True)
+    ncdataset = myparser.parse_file(cdlfilename, ncfile="/my/nc/folder/stuff.nc")
+    print(myparser.update_report.changed)
+
+The data for each variable is compared with that in the file one block at a time, and only those
+blocks that differ are written. If the header doesn't match, or the data section holds fewer
+records than the file, then the file is rebuilt from scratch as usual. Either way the outcome is
+described by the UpdateReport object held in the parser's update_report attribute.
+
+Appending Records
+-----------------
+Where new records arrive continuously, e.g. one time step at a time, they can be appended to an
+existing netCDF file without regenerating it. The append_text() and append_stream() methods parse
+a fragment of CDL holding just the declarations of a data section, optionally preceded by the
+'data:' keyword, and write the data for each record variable as new records following those
+already in the file:
+
+    myparser = CDL3Parser(close_on_completion=True)
+    myparser.append_text("time = 42 ; tas = 280.1, 281.5, 279.8 ;", "/my/nc/folder/stuff.nc")
+
+The dataset may be given as the pathname of a netCDF file, which is opened in append mode, or as a
+netCDF4.Dataset object open for writing, which is left open. Since the header isn't parsed again,
+the time taken by each append depends only on the amount of new data.
+
+Asynchronous Parsing
+--------------------
+Services built on asyncio can use an AsyncCDLParser, whose parse methods return futures rather
+than blocking the event loop while parsing and writing the netCDF output, e.g.:
+
+    aparser = AsyncCDLParser(CDL3Parser(close_on_completion=True), max_concurrency=4)
+    ncdataset = await aparser.parse_text(cdltext, ncfile="/my/nc/folder/stuff.nc")
+
+Parsing operations run on an executor, at most max_concurrency at a time, and stop at the end of
+the current declaration if their future is cancelled. Each operation runs on a copy of the parser,
+available as the future's parser attribute, from which its stats and update_report are read.
+
+Dumping netCDF Files
+--------------------
+The CDLDumper class does the reverse of the parser, writing a netCDF dataset, or the netCDF file at
+a given pathname, as CDL text in the manner of the ncdump command, e.g.:
+
+    with open("stuff.cdl", "w") as f :
+       CDLDumper().dump("/my/nc/folder/stuff.nc", f)
+
+Parsing the resulting CDL text reproduces the original dataset. The data values are formatted in
+blocks, so large variables can be dumped without holding them in memory.
+
 Error-handling
 --------------
 Error-handling is fairly simple in the current version of cdlparser. A CDLSyntaxError exception is
@@ -72,12 +151,30 @@ from __future__ import print_function
 __version_info__ = (0, 0, 8, 'beta', 0)
 __version__ = "%d.%d.%d-%s" % __version_info__[0:4]
 
+import argparse
+import ast
 import codecs
-import sys, os, logging, types
+import contextlib
+import copy
+import fnmatch
+import glob
+import hashlib
+import io
+import mmap
+import multiprocessing
+import shutil
+import sys, os, logging, time, types
+import threading
+import ctypes
+import unicodedata
+import warnings
 import six
 import re
+import string
+from collections import OrderedDict
+from six.moves import queue
 import ply.lex as lex
-from ply.lex import TOKEN
+from ply.lex import TOKEN, LexToken
 import ply.yacc as yacc
 import netCDF4 as nc4
 import numpy as np
@@ -112,6 +209,83 @@ NC_NP_DATA_TYPE_MAP = {
    'double':  'd'
 }
 
+# CDL type name for each numpy data type code, i.e. the inverse of NC_NP_DATA_TYPE_MAP
+CDL_TYPE_NAMES = dict([(code, name) for name, code in NC_NP_DATA_TYPE_MAP.items()
+   if name in ('byte', 'char', 'short', 'int', 'float', 'double')])
+
+# suffix identifying the type of numeric attribute values written by CDLDumper
+CDL_TYPE_SUFFIXES = {'byte': 'b', 'short': 's', 'int': '', 'float': 'f', 'double': ''}
+
+# numpy data type and descriptive name for each type of numeric constant token
+# (see convert_literals)
+LITERAL_TYPES = {
+   'BYTE_CONST':   (np.int8,    'byte'),
+   'SHORT_CONST':  (np.int16,   'short'),
+   'INT_CONST':    (np.int32,   'integer'),
+   'FLOAT_CONST':  (np.float32, 'float'),
+   'DOUBLE_CONST': (np.float64, 'double')
+}
+
+# initial capacity of the data buffer used for record variables whose length is not yet known
+DEFAULT_BUFFER_SIZE = 1024
+
+# default number of characters read at a time when streaming a CDL file through the lexer
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# minimum number of unread characters that must follow a token lexed from a partial input buffer
+# for that token to be accepted as complete
+STREAM_LOOKAHEAD = 256
+
+# names of the available lexer implementations (see the lexer_backend option of CDLParser)
+LEXER_BACKENDS = ('ply', 'fast')
+
+# netCDF file formats that use the classic (netCDF-3) file layout
+NC3_FILE_FORMATS = ('NETCDF3_CLASSIC', 'NETCDF3_64BIT', 'NETCDF3_64BIT_OFFSET')
+
+# name of the temporary global attribute used to reserve netCDF-3 header space if nc__enddef can't
+# be called (see reserve_header_space)
+HEADER_PAD_ATTNAME = '_cdlparser_header_pad'
+
+# createVariable keyword arguments that may be given via the storage option of CDLParser
+STORAGE_OPTIONS = ('zlib', 'complevel', 'shuffle', 'contiguous', 'chunksizes')
+
+# approximate size in bytes of the chunks chosen by auto_chunksizes, and the maximum number of
+# records per chunk for record variables (so that appending a record touches only small chunks)
+CHUNK_TARGET_BYTES = 1024 * 1024
+RECORD_CHUNK_LEN = 1024
+
+# directory in which the LALR parsing tables are cached between processes
+TABLE_CACHE_DIR = os.environ.get('CDLPARSER_CACHE_DIR',
+   os.path.join(os.path.expanduser('~'), '.cache', 'cdlparser'))
+
+# default directory and maximum total size of the netCDF files held by a ConversionCache
+CONVERSION_CACHE_DIR = os.path.join(TABLE_CACHE_DIR, 'conversions')
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+
+# number of bytes read at a time when hashing a CDL file for the conversion cache
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# approximate number of bytes of variable data compared at a time when updating an existing file
+UPDATE_BLOCK_SIZE = 1024 * 1024
+
+# default approximate number of bytes of variable data, and number of values per line, written at a
+# time by CDLDumper
+DUMP_BLOCK_SIZE = 1024 * 1024
+DUMP_LINE_VALUES = 10
+
+# lock guarding the one-off construction of the lexer and parser shared by each parser class
+TABLES_LOCK = threading.Lock()
+
+# lock guarding the one-off attachment of a console handler to the cdlparser logger
+LOGGER_LOCK = threading.Lock()
+
+# lock serializing the calls made to the netCDF library, which is not thread-safe, by concurrent
+# parsing operations; netCDF4 releases the GIL while creating, closing, reading and writing files
+NETCDF_LOCK = threading.RLock()
+
+# lock serializing the temporary changes made to the process-wide warning filters
+WARNINGS_LOCK = threading.Lock()
+
 # default logging options
 DEFAULT_LOG_LEVEL  = logging.WARNING
 DEFAULT_LOG_FORMAT = "[%(levelname)s] %(funcName)s: %(message)s"
@@ -124,6 +298,14 @@ class CDLSyntaxError(Exception) :
 class CDLContentError(Exception) :
    pass
 
+# Exception raised when parsing is stopped via the parser's cancel_event
+class CDLParseCancelled(Exception) :
+   pass
+
+# Exception raised when an existing netCDF file cannot be updated in place after all
+class RebuildRequired(Exception) :
+   pass
+
 #---------------------------------------------------------------------------------------------------
 class CDLParser(object) :
 #---------------------------------------------------------------------------------------------------
@@ -135,7 +317,9 @@ class CDLParser(object) :
    precedence = []
 
    def __init__(self, close_on_completion=False, file_format='NETCDF3_CLASSIC', log_level=None,
-      **kwargs) :
+      chunk_size=DEFAULT_CHUNK_SIZE, stream_records=False, header_only=False, in_memory=False,
+      header_pad=0, writer=None, collect_stats=False, lexer_backend='ply', cache=None, update=False,
+      storage=None, cancel_event=None, write_queue_size=0, memory_map=False, **kwargs) :
       """
       The currently supported keyword arguments, with their default values, are described below. Any
       other keyword argments are passed through as-is to the PLY parser (via the yacc.yacc function).
@@ -150,18 +334,155 @@ class CDLParser(object) :
          'NETCDF4_CLASSIC' or 'NETCDF4' [default: 'NETCDF3_CLASSIC']
       :param log_level: Sets the logging level to one of the constants defined in the Python logging
          module [default: logging.WARNING]
+      :param chunk_size: The number of characters read at a time by the parse_file() method, which
+         streams the CDL file through the lexer rather than reading it into memory in one go. Set
+         to 0 or None to read the whole file before parsing it. [default: 1048576]
+      :param stream_records: If set to true, the data values for record variables, i.e. those
+         defined with an unlimited dimension, are written to the netCDF file a batch of complete
+         records at a time as they are parsed, rather than once the whole data array has been
+         read. This keeps memory use constant regardless of the number of records. [default: False]
+      :param header_only: If set to true, only the dimensions and variables sections of the CDL
+         input are parsed, and the parse methods return a CDLDataset object describing the
+         dimensions, variables and attributes defined therein. No netCDF file is created, and all
+         input following the 'data:' keyword is skipped without being lexed. [default: False]
+      :param in_memory: If set to true, the netCDF dataset is built in memory rather than in a file
+         on disk. Once parsing is complete the dataset is closed and the parse methods return a
+         memoryview object holding the serialized contents of the netCDF file, which may be
+         converted to a bytes object, written to a socket, and so on. In this case the ncfile
+         argument to the parse methods, if specified, is used only as the dataset name. Requires
+         netCDF library version 4.6.2 or later. [default: False]
+      :param header_pad: The number of bytes of free space to reserve at the end of the header of
+         netCDF-3 files, so that attributes or variables can later be added to the file without the
+         netCDF library having to move the data. [default: 0]
+      :param writer: The output backend used to create the netCDF dataset once the CDL header has
+         been parsed. This should be an object with a define() method having the same signature as
+         the NetCDFWriter.define method. [default: a NetCDFWriter instance]
+      :param collect_stats: If set to true, counters and timings are collected while parsing and
+         are made available, once parsing is complete, as a ParseStats object via the parser's
+         stats attribute. This adds a small overhead to the lexing of each token. [default: False]
+      :param lexer_backend: The lexer implementation to use, either 'ply' for the standard PLY lexer
+         or 'fast' for a FastLexer, which applies the same token rules but only tries those that
+         can match the next input character. Both produce the same token stream. [default: 'ply']
+      :param cache: A ConversionCache in which to look up the netCDF output for the CDL input to
+         the parse_file() and parse_text() methods. If the same input has been converted before,
+         with the same output options, the cached netCDF file is copied to the output file without
+         any parsing. Otherwise the input is parsed as usual and the output is added to the cache.
+         The header_only option, and writers other than NetCDFWriter, bypass the cache.
+         [default: None]
+      :param update: If set to true, and the output file already exists, then the file is updated
+         in place rather than being recreated. The dimensions, variables and attributes in the file
+         must match those in the CDL header; if not, the file is rebuilt from scratch as usual. The
+         data for each variable is compared with that in the file, a block at a time, and only the
+         blocks that differ are written. A summary of the changes is made available as an
+         UpdateReport object via the parser's update_report attribute. Ignored if the in_memory or
+         header_only option is enabled. [default: False]
+      :param storage: Compression and chunking options for the variables in netCDF-4 output files;
+         these are ignored for the netCDF-3 file formats. Either a dictionary of options applying to
+         every variable, or a list of (pattern, dictionary) pairs, where pattern is a shell-style
+         wildcard matched against variable names. The options for all matching patterns are
+         combined in order, later ones taking precedence. The options are passed to createVariable
+         and may be any of zlib, complevel, shuffle, contiguous and chunksizes. Setting chunksizes
+         to 'auto' selects chunks of about CHUNK_TARGET_BYTES bytes from the variable's dimensions.
+         Record variables are chunked in this way, with up to RECORD_CHUNK_LEN records per chunk,
+         unless chunksizes are given. Scalar variables are always stored as is. [default: None]
+      :param cancel_event: A threading.Event object which, once set, causes any parsing operation in
+         progress to stop with a CDLParseCancelled exception after the current declaration. The
+         partially written netCDF dataset is closed but not deleted. [default: None]
+      :param write_queue_size: If set to a positive number, data values are written to the netCDF
+         dataset by a separate writer thread, which is fed the data arrays for complete variables,
+         or batches of records, via a queue holding up to this many arrays. Parsing of the next
+         variable then overlaps with the writing of the previous ones. Any error raised by the
+         writer thread is reported as a CDLContentError. Ignored if the update option is in
+         effect. [default: 0]
+      :param memory_map: If set to true, the parse_file() method maps the CDL file into memory
+         instead of reading it through a text decoder. The CDL structure is lexed from a window of
+         the mapped bytes, decoding as UTF-8 only those names and strings that contain non-ASCII
+         characters, while runs of numeric data values are converted to numpy arrays directly from
+         the mapped bytes. The window size is set by the chunk_size option. [default: False]
       """
+      if lexer_backend not in LEXER_BACKENDS :
+         raise ValueError("Unrecognised lexer backend: '%s'" % lexer_backend)
       self.close_on_completion = close_on_completion
       self.file_format = file_format
       self.log_level = DEFAULT_LOG_LEVEL if log_level is None else log_level
+      self.chunk_size = chunk_size
+      self.stream_records = stream_records
+      self.header_only = header_only
+      self.in_memory = in_memory
+      self.header_pad = header_pad
+      self.writer = writer or NetCDFWriter()
+      self.collect_stats = collect_stats
+      self.cache = cache
+      self.update = update
+      self.storage = storage_rules(storage)
+      self.cancel_event = cancel_event
+      self.write_queue_size = write_queue_size
+      self.memory_map = memory_map
+      self.stats = None
+      self.update_report = None
       self.cdlfile = None
       self.ncdataset = None
-      #self.dryrun = kwargs.pop('dryrun', False)   # TODO: enable dry-run option
       self.init_logger()
 
-      # Build the lexer and parser
-      self.lexer = lex.lex(module=self, debug=kwargs.get('debug', 0))
-      self.parser = yacc.yacc(module=self, **kwargs)
+      # Build the lexer and parser. Unless PLY options have been passed in, these are cloned from
+      # the lexer and parser built just once for this class, and rebound to this instance.
+      if kwargs :
+         self.lexer = lex.lex(module=self, debug=kwargs.get('debug', 0))
+         if lexer_backend == 'fast' : self.lexer = FastLexer(self.lexer, self)
+         self.parser = yacc.yacc(module=self, **kwargs)
+      else :
+         lexer, parser = self.build_tables()
+         if lexer_backend == 'fast' : lexer = self.build_fast_lexer()
+         self.lexer = clone_lexer(lexer, self)
+         self.lexer.begin('INITIAL')
+         self.parser = clone_parser(parser, self)
+
+   @classmethod
+   def build_tables(cls) :
+      """
+      Return the prototype lexer and parser shared by all instances of this class, building them
+      on first use. The LALR parsing tables are cached in a pickle file in TABLE_CACHE_DIR whose
+      name includes the class name and cdlparser version. PLY checks the grammar signature stored
+      in that file and only regenerates the tables if it doesn't match the current grammar.
+      """
+      with TABLES_LOCK :
+         if '_tables' not in cls.__dict__ :
+            # the prototypes are built against a bare instance; clients only ever get clones
+            module = cls.__new__(cls)
+            lexer = lex.lex(module=module)
+            picklefile = os.path.join(TABLE_CACHE_DIR, "%s-%s.pickle" \
+               % (cls.__name__.lower(), __version__))
+            try :
+               if not os.path.isdir(TABLE_CACHE_DIR) : os.makedirs(TABLE_CACHE_DIR)
+            except OSError :
+               picklefile = None
+            if picklefile and os.path.exists(picklefile) :
+               parser = yacc.yacc(module=module, debug=False, write_tables=False,
+                  picklefile=picklefile)
+            else :
+               # write new tables to a private file first so that other processes never see a
+               # partially written cache file
+               tmpfile = picklefile and "%s.%d.tmp" % (picklefile, os.getpid())
+               parser = yacc.yacc(module=module, debug=False, write_tables=False,
+                  picklefile=tmpfile)
+               try :
+                  if tmpfile : os.rename(tmpfile, picklefile)
+               except OSError :
+                  pass
+            cls._tables = (lexer, parser)
+      return cls._tables
+
+   @classmethod
+   def build_fast_lexer(cls) :
+      """
+      Return the prototype FastLexer shared by all instances of this class, building it from the
+      prototype PLY lexer on first use.
+      """
+      lexer = cls.build_tables()[0]
+      with TABLES_LOCK :
+         if '_fast_lexer' not in cls.__dict__ :
+            cls._fast_lexer = FastLexer(lexer, cls.__new__(cls))
+      return cls._fast_lexer
 
    def parse_file(self, cdlfile, ncfile=None) :
       """
@@ -175,14 +496,72 @@ class CDLParser(object) :
       Alternatively, this can be done immediately upon completion of parsing by setting the
       close_on_completion keyword argument to True when instantiating the CDLParser instance.
 
+      Unless the chunk_size keyword argument was set to 0 or None, the file is streamed through
+      the lexer in chunks of that many characters, so the whole file is never held in memory. If
+      the memory_map option is enabled then the file is instead mapped into memory and lexed, a
+      chunk at a time, from the mapped bytes.
+
+      Each call to this method, or to parse_text() or parse_stream(), runs in its own parse
+      context, so a single parser instance may be used to parse several files concurrently,
+      e.g. from the worker threads of a concurrent.futures.ThreadPoolExecutor.
+
       :param cdlfile: Pathname of the CDL file to parse.
       :param ncfile: Optional pathname of the netCDF file to receive output.
-      :returns: A handle to a netCDF4.Dataset object.
+      :returns: A handle to a netCDF4.Dataset object, or a memoryview if the in_memory option is
+         enabled.
       """
-      self.cdlfile = cdlfile
-      with codecs.open(cdlfile, encoding="utf-8") as f:
-         data = f.read()   # FIXME: can we parse input w/o reading entire CDL file into memory?
-      return self.parse_text(data, ncfile=ncfile)
+      ctx = self.new_context(ncfile, cdlfile)
+      parse = lambda ctx: self.parse_file_contents(ctx, cdlfile)
+      if self.use_cache() :
+         with io.open(cdlfile, encoding="utf-8") as f:
+            head = f.read(HASH_BLOCK_SIZE)
+         key = self.cache.make_key(self.cache_options(), path=cdlfile)
+         return self.run_cached(ctx, key, head, lambda: self.run_update(ctx, parse))
+      return self.run_update(ctx, parse)
+
+   def parse_file_contents(self, ctx, cdlfile) :
+      """Parse the specified CDL file within parse context ctx (see parse_file)."""
+      if self.memory_map :
+         with io.open(cdlfile, 'rb') as f :
+            # empty files can't be mapped, but then there's nothing to decode either
+            if os.fstat(f.fileno()).st_size == 0 :
+               return self.run_parser(ctx, cdltext=u'')
+            with contextlib.closing(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)) as mapped :
+               return self.run_parser(ctx, mapped=mapped)
+      if not self.chunk_size :
+         with codecs.open(cdlfile, encoding="utf-8") as f:
+            data = f.read()
+         return self.run_parser(ctx, cdltext=data)
+      with io.open(cdlfile, encoding="utf-8") as f:
+         return self.run_parser(ctx, stream=f)
+
+   def parse_stream(self, stream, ncfile=None) :
+      """
+      Parse CDL text read incrementally from stream, a file-like object opened in text mode, writing
+      the output to the netCDF file specified via the optional ncfile argument. The stream is read
+      in chunks of chunk_size characters (as set when instantiating the CDLParser instance). Only
+      the current chunk, plus any token spanning its end, is held in memory at any one time.
+
+      If the update option is enabled then the stream must be seekable, since it may need to be
+      read a second time should the existing netCDF file turn out not to be updatable in place.
+      Otherwise the output file is always recreated.
+
+      :param stream: File-like object from which to read the CDL text.
+      :param ncfile: Optional pathname of the netCDF file to receive output.
+      :returns: A handle to a netCDF4.Dataset object, or a memoryview if the in_memory option is
+         enabled.
+      """
+      ctx = self.new_context(ncfile)
+      if not self.update :
+         return self.run_parser(ctx, stream=stream)
+      offset = stream.tell() if getattr(stream, 'seekable', lambda: False)() else None
+      if offset is None :
+         self.logger.warning("Unable to update netCDF output from an unseekable stream")
+         ctx.update = False
+      def parse(ctx) :
+         if offset is not None : stream.seek(offset)
+         return self.run_parser(ctx, stream=stream)
+      return self.run_update(ctx, parse)
 
    def parse_text(self, cdltext, ncfile=None) :
       """
@@ -199,28 +578,254 @@ class CDLParser(object) :
       :param cdltext: String containing the CDL text to parse. Must be unicode str if containing
                       unicode.
       :param ncfile: Optional pathname of the netCDF file to receive output.
-      :returns: A handle to a netCDF4.Dataset object.
+      :returns: A handle to a netCDF4.Dataset object, or a memoryview if the in_memory option is
+         enabled.
+      """
+      ctx = self.new_context(ncfile)
+      parse = lambda ctx: self.run_parser(ctx, cdltext=cdltext)
+      if self.use_cache() :
+         key = self.cache.make_key(self.cache_options(), text=cdltext)
+         return self.run_cached(ctx, key, cdltext, lambda: self.run_update(ctx, parse))
+      return self.run_update(ctx, parse)
+
+   def append_text(self, cdltext, dataset) :
+      """
+      Parse a fragment of CDL text holding just the declarations of a data section, optionally
+      preceded by the 'data:' keyword, and write the data to an existing netCDF dataset, without
+      parsing or redefining the dataset's header. The data for each record variable is written as
+      new records following the records already in the dataset, with the record length worked out
+      as for a newly created file. Record variables given fewer records than others in the fragment
+      are padded with fill values, as usual. The data for any other variables replaces their
+      current values.
+
+      The header_only, in_memory, update, cache and write_queue_size options don't apply to the
+      append methods.
+
+      :param cdltext: String containing the CDL data fragment to parse.
+      :param dataset: Either a netCDF4.Dataset object open for writing, which is left open even if
+         parsing fails, or the pathname of an existing netCDF file, which is opened in append mode
+         and, if the close_on_completion option is enabled, closed again afterwards.
+      :returns: A handle to the netCDF4.Dataset object.
+      """
+      ctx = self.new_append_context(dataset)
+      return self.run_parser(ctx, cdltext=cdltext)
+
+   def append_stream(self, stream, dataset) :
+      """
+      Parse a fragment of CDL text read incrementally from stream, a file-like object opened in
+      text mode, and append the data to an existing netCDF dataset, as for the append_text method.
+
+      :param stream: File-like object from which to read the CDL data fragment.
+      :param dataset: Either a netCDF4.Dataset object open for writing or the pathname of an
+         existing netCDF file (see append_text).
+      :returns: A handle to the netCDF4.Dataset object.
+      """
+      ctx = self.new_append_context(dataset)
+      return self.run_parser(ctx, stream=stream)
+
+   def use_cache(self) :
+      """Return true if the output of the parse methods can be looked up in the conversion cache."""
+      return self.cache is not None and not self.header_only and type(self.writer) is NetCDFWriter
+
+   def cache_options(self) :
+      """Return a dictionary of those parser options that affect the netCDF output."""
+      return {
+         'parser': self.__class__.__name__,
+         'version': __version__,
+         'file_format': self.file_format,
+         'header_pad': self.header_pad,
+         'storage': [(pattern, sorted(options.items())) for pattern, options in self.storage],
+      }
+
+   def run_cached(self, ctx, key, head, parse) :
+      """
+      Fetch the netCDF output for cache key from the conversion cache, returning it in the same way
+      as the run_parser method, or else call the function parse to generate the output and then add
+      it to the cache. The dataset name, and hence the default output filename, is read from head,
+      which holds the start of the CDL input.
+      """
+      if not self.in_memory and not ctx.ncfile :
+         name = self.dataset_name(head)
+         if name is None : return parse()
+         ctx.set_filename(name)
+      start = time.time()
+      if self.in_memory :
+         data = self.cache.fetch_bytes(key)
+         hit = data is not None
+         if hit : ctx.ncbuffer = memoryview(data)
+      else :
+         hit = self.cache.fetch(key, ctx.ncfile)
+         if hit :
+            # hard-linked files share storage with the cache so must not be opened for writing
+            with NETCDF_LOCK :
+               ctx.ncdataset = nc4.Dataset(ctx.ncfile, 'r' if self.cache.hardlink else 'a')
+               if self.close_on_completion : ctx.ncdataset.close()
+      if not hit :
+         result = parse()
+         if self.in_memory :
+            self.cache.store(key, data=bytes(result))
+         else :
+            with NETCDF_LOCK :
+               if ctx.ncdataset.isopen() : ctx.ncdataset.sync()
+            self.cache.store(key, ncfile=ctx.ncfile)
+         return result
+      self.logger.info("Fetched netCDF output from conversion cache entry %s" % key)
+      self.cdlfile, self.ncfile, self.ncdataset = ctx.cdlfile, ctx.ncfile, ctx.ncdataset
+      self.ncbuffer, self.update_report = ctx.ncbuffer, ctx.update_report
+      if ctx.stats : ctx.stats.total_secs = time.time() - start
+      self.stats = ctx.stats
+      return ctx.ncbuffer if ctx.ncbuffer is not None else ctx.ncdataset
+
+   def run_update(self, ctx, parse) :
+      """
+      Call the function parse to parse the CDL input within parse context ctx, first with the update
+      option as set and then, if the existing netCDF file turns out not to be updatable in place,
+      once more with the update option disabled so that the file is rebuilt from scratch.
+      """
+      if not ctx.update : return parse(ctx)
+      ncfile = ctx.ncfile
+      try :
+         return parse(ctx)
+      except RebuildRequired as exc :
+         report = ctx.update_report
+         report.rebuilt, report.reason = True, str(exc)
+         # forget the variables compared by the abandoned attempt to update the file in place
+         report.variables.clear()
+         self.logger.info("Rebuilding netCDF file %s: %s" % (report.ncfile, exc))
+      ctx.update = False
+      ctx.reset(ncfile)
+      result = parse(ctx)
+      self.update_report = report
+      return result
+
+   def dataset_name(self, head) :
+      """Return the dataset name given at the start of CDL text head, or None if there isn't one."""
+      lexer = self.new_context().lexer
+      lexer.input(head)
+      try :
+         tok = lexer.token()
+      except CDLSyntaxError :
+         return None
+      return tok.value if tok and tok.type == 'NETCDF' else None
+
+   def new_context(self, ncfile=None, cdlfile=None) :
+      """
+      Return a new parse context for a single parsing operation. The context is a shallow copy of
+      this parser with its own lexer and parser objects bound to it. These share the read-only
+      lexer and parser tables but hold all of the state accumulated while parsing, so that no
+      parsing operation can interfere with another one running concurrently.
+      """
+      ctx = copy.copy(self)
+      ctx.lexer = clone_lexer(self.lexer, ctx)
+      ctx.parser = clone_parser(self.parser, ctx)
+      ctx.cdlfile = cdlfile
+      ctx.reset(ncfile)
+      return ctx
+
+   def new_append_context(self, dataset) :
+      """
+      Return a new parse context, as for the new_context method, for appending a CDL data fragment
+      to dataset, a netCDF4.Dataset object or the pathname of a netCDF file (see append_text).
+      """
+      ctx = self.new_context()
+      ctx.header_only = ctx.in_memory = ctx.update = False
+      ctx.write_queue_size = 0
+      ctx.appending = True
+      if isinstance(dataset, six.string_types) :
+         ctx.ncfile = dataset
+         with NETCDF_LOCK : ctx.ncdataset = nc4.Dataset(dataset, 'a')
+      else :
+         with NETCDF_LOCK : ctx.ncfile = dataset.filepath()
+         ctx.ncdataset = dataset
+         ctx.keep_open = True
+      with NETCDF_LOCK :
+         unlimited = [name for name, dim in ctx.ncdataset.dimensions.items() if dim.isunlimited()]
+      if len(unlimited) > 1 :
+         if not ctx.keep_open :
+            with NETCDF_LOCK : ctx.ncdataset.close()
+         raise CDLContentError("Only one UNLIMITED dimension is allowed.")
+      if unlimited :
+         ctx.rec_dimname = unlimited[0]
+         ctx.first_record = ctx.record_count()
+      # the fragment consists of data section declarations only
+      ctx.lexer.begin('data')
+      return ctx
+
+   def run_parser(self, ctx, cdltext=None, stream=None, mapped=None) :
+      """
+      Parse CDL text, the contents of a text stream, or a memory-mapped CDL file, within parse
+      context ctx. The resulting netCDF dataset is returned and is also recorded, as the outcome
+      of the most recent parsing operation, in this parser's ncdataset attribute. If parsing fails
+      then the partially written netCDF dataset is closed, unless it was supplied by the caller of
+      an append method, before the exception is propagated. For in-memory datasets the serialized
+      netCDF content is returned instead, and recorded in the ncbuffer attribute.
+      """
+      start = time.time()
+      try :
+         if mapped is not None :
+            lexer = MappedLexer(ctx.lexer, mapped, self.chunk_size or DEFAULT_CHUNK_SIZE, ctx.stats)
+         elif stream is not None :
+            lexer = StreamLexer(ctx.lexer, stream, self.chunk_size or DEFAULT_CHUNK_SIZE, ctx.stats)
+         else :
+            lexer = ctx.lexer
+            lexer.input(cdltext)
+            if ctx.stats : ctx.stats.bytes_read = len(encode_text(cdltext))
+         if ctx.appending : lexer = FragmentLexer(lexer)
+         tokenfunc = ctx.stats.count_tokens(lexer.token) if ctx.stats else None
+         ctx.parser.parse(lexer=lexer, tokenfunc=tokenfunc)
+      except :
+         if ctx.write_thread : ctx.write_thread.stop()
+         if ctx.ncdataset and not ctx.keep_open :
+            try :
+               with NETCDF_LOCK : ctx.ncdataset.close()
+            except :
+               pass
+         raise
+      self.cdlfile, self.ncfile, self.ncdataset = ctx.cdlfile, ctx.ncfile, ctx.ncdataset
+      self.ncbuffer, self.update_report = ctx.ncbuffer, ctx.update_report
+      if ctx.stats : ctx.stats.total_secs = time.time() - start
+      self.stats = ctx.stats
+      return ctx.ncbuffer if ctx.ncbuffer is not None else ctx.ncdataset
+
+   def reset(self, ncfile=None) :
+      """
+      Reset the parser state ready for a new parsing operation. Any netCDF dataset produced by a
+      previous operation is left untouched since it belongs to the caller of that operation.
       """
       self.ncfile = ncfile
-      # if netcdf dataset handle exists, e.g. from previous parsing operation, try to close it
-      if self.ncdataset :
-         try :    self.ncdataset.close()
-         except : pass
+      self.header = None
       self.ncdataset = None
+      self.ncbuffer = None
+      self.stats = ParseStats() if self.collect_stats else None
+      self.update_report = None
+      self.updating = False
+      self.nrecs_before = self.nrecs_parsed = 0
+      self.appending = False
+      self.keep_open = False
+      self.first_record = 0
+      self.write_thread = None
       self.curr_var = None
       self.curr_dim = None
       self.rec_dimname = None
-      self.parser.parse(input=cdltext, lexer=self.lexer)
-      return self.ncdataset
+      self.lexer.begin('INITIAL')
+      self.lexer.lineno = 1
+      self.lexer.lexoffset = 0
+      self.lexer.needs_input = False
+      self.lexer.pending_input = False
+      self.lexer.data_skipped = False
 
    def init_logger(self) :
-      """Configure a logger object for the parser."""
-      console = logging.StreamHandler(stream=sys.stderr)
-      console.setLevel(self.log_level)
-      fmtr = logging.Formatter(DEFAULT_LOG_FORMAT)
-      console.setFormatter(fmtr)
+      """
+      Configure a logger object for the parser. The console handler is attached to the shared
+      cdlparser logger only once, however many parser instances get created.
+      """
       self.logger = logging.getLogger('cdlparser')
-      self.logger.addHandler(console)
+      with LOGGER_LOCK :
+         if not [h for h in self.logger.handlers if getattr(h, 'cdlparser_console', False)] :
+            console = logging.StreamHandler(stream=sys.stderr)
+            console.setFormatter(logging.Formatter(DEFAULT_LOG_FORMAT))
+            console.cdlparser_console = True
+            self.logger.addHandler(console)
       self.logger.setLevel(self.log_level)
 
 #---------------------------------------------------------------------------------------------------
@@ -266,16 +871,22 @@ class CDL3Parser(CDLParser) :
    tokens = [
       'NETCDF', 'DIMENSIONS', 'VARIABLES', 'DATA', 'IDENT', 'TERMSTRING',
       'BYTE_CONST', 'CHAR_CONST', 'SHORT_CONST', 'INT_CONST', 'FLOAT_CONST', 'DOUBLE_CONST',
-      'FILLVALUE', 'COMMENT', 'EQUALS', 'LBRACE', 'RBRACE', 'LPAREN', 'RPAREN', 'EOL'
+      'FILLVALUE', 'COMMENT', 'EQUALS', 'LBRACE', 'RBRACE', 'LPAREN', 'RPAREN', 'EOL',
+      'NUMERIC_RUN', 'STRING_RUN', 'FRAGMENT'
    ] + list(set(reserved_words.values()))
 
+   # lexer states - the inclusive 'data' state is entered at the start of the data section
+   states = (
+      ('data', 'inclusive'),
+   )
+
    # literal characters
    literals = [',',':']
 
-   # Partially relaxed version of the UTF8 character set, and the one used in the ncgen3.l flex file.
-   UTF8 = r'([\xC0-\xD6][\x80-\xBF])|' + \
-          r'([\xE0-\xEF][\x80-\xBF][\x80-\xBF])|' + \
-          r'([\xF0-\xF7][\x80-\xBF][\x80-\xBF][\x80-\xBF])'
+   # Any non-ASCII character. The ncgen3.l flex file matches the bytes of UTF-8 sequences instead,
+   # but the lexer sees decoded characters when parsing text and one character per byte when parsing
+   # a memory-mapped file, so a single character class is used to accept the same names in both.
+   UTF8 = r'[^\x00-\x7f]'
 
    # Following comment copied verbatim from ncgen.l file:
    # Don't permit control characters or '/' in names, but other special
@@ -296,6 +907,49 @@ class CDL3Parser(CDLParser) :
                 r"(\'[^\\]\')|(\'\\.\')|" + \
                 r"(\'\\[0-7][0-7]?[0-7]?\')|" + \
                 r"(\'\\[xX][0-9a-fA-F][0-9a-fA-F]?\')"
+   short_const = r'[+-]?([0-9]+|0[xX][0-9a-fA-F]+)[sS]'
+   int_const = r'[+-]?([1-9][0-9]*|0[xX]?[0-9a-fA-F]+|0)'   # [Ll] suffix has been deprecated
+
+   # Comma-separated runs of numeric constants and fill values in the data section. The lexer rule
+   # matches a candidate run using a cheap character class, and runs must be followed by a comma or
+   # semicolon so that they can't swallow the leading part of a constant of some other kind. Each
+   # candidate is then split into constants using the literal_item regex, which tries the constant
+   # types in the same order as the lexer rules below, and cut back to the valid ones, if need be.
+   numeric_run = r'[-+.0-9_][-+.0-9a-fA-FsSxX_,\s]*[0-9.a-fA-FsS_](?=\s*[,;])'
+   literal_item = r'\s*(?:(?P<FILLVALUE>_)|(?P<FLOAT_CONST>' + float_const + \
+                  r')|(?P<DOUBLE_CONST>' + double_const + r')|(?P<SHORT_CONST>' + short_const + \
+                  r')|(?P<BYTE_CONST>' + byte_const + r')|(?P<INT_CONST>' + int_const + \
+                  r'))\s*(?:,|$)'
+
+   # Comma-separated runs of two or more strings in the data section. Only strings without escapes
+   # or newlines are included, so that their values need no further processing, and runs must be
+   # followed by a comma or semicolon, like runs of numeric constants.
+   string_run = r'"[^"\\\n]*"(?:\s*,\s*"[^"\\\n]*")+(?=\s*[,;])'
+
+   # The characters with which each type of token can start. These are used by the FastLexer to
+   # decide which rules to try at each position. Tokens not listed here are tried at any position,
+   # as are all tokens at non-ASCII characters, such as the start of a UTF-8 identifier.
+   lexer_first_chars = {
+      'NETCDF':       'nN',
+      'SECTION':      'dDvV',
+      'NUMERIC_RUN':  '+-.0123456789_',
+      'STRING_RUN':   '"',
+      'TERMSTRING':   '"',
+      'COMMENT':      '/',
+      'IDENT':        string.ascii_letters + '_\\',
+      'FLOAT_CONST':  '+-.0123456789eE',
+      'DOUBLE_CONST': '+-.0123456789eE',
+      'SHORT_CONST':  '+-0123456789',
+      'BYTE_CONST':   "+-0123456789'",
+      'INT_CONST':    '+-0123456789',
+      'newline':      '\n',
+      'EQUALS':       '=',
+      'LBRACE':       '{',
+      'RBRACE':       '}',
+      'LPAREN':       '(',
+      'RPAREN':       ')',
+      'EOL':          ';'
+   }
 
    ### TOKEN DEFINITIONS
    ### Note that the t_xxx naming convention used below is a requirement of the ply package.
@@ -325,12 +979,47 @@ class CDL3Parser(CDLParser) :
    def t_SECTION(self, t) :
       r'dimensions:|DIMENSIONS:|variables:|VARIABLES:|data:|DATA:'
       t.type = t.value[:-1].upper()
+      if t.type == 'DATA' :
+         t.lexer.begin('data')
+         if self.header_only :
+            # discard the data section, leaving just the closing brace for the parser to consume
+            t.lexer.input('}')
+            t.lexer.data_skipped = True
+      return t
+
+   # runs of numeric constants in the data section are returned as a single token, so that no token
+   # objects are created for the individual values
+   @TOKEN(numeric_run)
+   def t_data_NUMERIC_RUN(self, t) :
+      values = parse_numeric_run(t.value)
+      if values is None :
+         values = split_literal_run(t.value)
+         if values is None :
+            errmsg  = "Syntax error at line number %d, lexical position %d\n" \
+               % (t.lineno, t.lexpos + getattr(t.lexer, 'lexoffset', 0))
+            errmsg += "Invalid numeric constant(s) in '%s'" % t.value.split(',')[0]
+            self.logger.error(errmsg)
+            raise CDLSyntaxError(errmsg)
+         if values.end < len(t.value) :
+            t.value = t.value[:values.end]
+            t.lexer.lexpos = t.lexpos + values.end
+      t.lexer.lineno += t.value.count('\n')
+      t.value = values
+      return t
+
+   # runs of strings in the data section are likewise returned as a single token, whose value is the
+   # list of strings
+   @TOKEN(string_run)
+   def t_data_STRING_RUN(self, t) :
+      t.lexer.lineno += t.value.count('\n')
+      t.value = STRING_ITEM_RE.findall(t.value)
       return t
 
    # character strings
    @TOKEN(termstring)
    def t_TERMSTRING(self, t) :
-      tstring = expand_escapes(t.value)
+      # most strings contain no escapes, so only search those with a backslash for them
+      tstring = expand_escapes(t.value) if '\\' in t.value else t.value
       i = 0 ; j = len(tstring)
       if tstring[0]  == '"' : i = 1
       if tstring[-1] == '"' : j = -1
@@ -356,84 +1045,39 @@ class CDL3Parser(CDLParser) :
       return t
 
    # numeric constants (order of appearance is extremely important and differs from ncgen3.l file)
+   # The token value is left as the raw text of the constant, with the token type serving as its
+   # type tag. Conversion, octal/hex handling and range checking are done in bulk by
+   # convert_literals once the target attribute or variable is known.
    @TOKEN(float_const)
    def t_FLOAT_CONST(self, t) :
       #r'[+-]?[0-9]*\.[0-9]*' + exp + r'?[Ff]|[+-]?[0-9]*' + exp + r'[Ff]'
-      try :
-         float_val = float(t.value[:-1])
-      except :
-         errmsg = "Bad float constant: %s" % t.value
-         raise CDLContentError(errmsg)
-      t.value = np.float32(float_val)
       return t
 
    @TOKEN(double_const)
    def t_DOUBLE_CONST(self, t) :
       # Original regex in ncgen3.l file. Since the [Ll] suffix is now deprecated, it's not used here.
       #r'[+-]?[0-9]*\.[0-9]*' + exp + r'?[LlDd]?|[+-]?[0-9]*' + exp + r'[LlDd]?'
-      try :
-         if t.value[-1] in "dD" :
-            double_val = float(t.value[:-1])
-         else :
-            double_val = float(t.value)
-      except :
-         errmsg = "Bad double constant: %s" % t.value
-         raise CDLContentError(errmsg)
-      t.value = np.float64(double_val)
       return t
 
+   @TOKEN(short_const)
    def t_SHORT_CONST(self, t) :
-      r'[+-]?([0-9]+|0[xX][0-9a-fA-F]+)[sS]'
+      #r'[+-]?([0-9]+|0[xX][0-9a-fA-F]+)[sS]'
       #r'[+-]?[0-9]+[sS]|0[xX][0-9a-fA-F]+[sS]'   # original regex in ncgen3.l file
-      t.value = fix_octal(t.value)
-      try :
-         int_val = int(eval(t.value[:-1]))
-      except :
-         errmsg = "Bad short constant: %s" % t.value
-         raise CDLContentError(errmsg)
-      if int_val < -32768 or int_val > 32767 :
-         errmsg = "Short constant is outside valid range (-32768 -> 32767): %s" % int_val
-         raise CDLContentError(errmsg)
-      t.value = np.int16(int_val)
       return t
 
    @TOKEN(byte_const)
    def t_BYTE_CONST(self, t) :
       #r'[+-]?[0-9]+[Bb]'        # modified regex
       #r'[+-]?[0-9]*[0-9][Bb]'   # original regex in ncgen3.l file
-      t.value = fix_octal(t.value)
-      try :
-         if t.value[0] == "'" :
-            int_val = ord(eval(t.value))
-         else :
-            int_val = int(t.value[:-1])
-      except :
-         errmsg = "Bad byte constant: %s" % t.value
-         raise CDLContentError(errmsg)
-      if int_val < -128 or int_val > 127 :
-         errmsg = "Byte constant outside valid range (-128 -> 127): %s" % int_val
-         raise CDLContentError(errmsg)
-      t.value = np.int8(int_val)
       return t
 
    # The following implementation for handling integer constants is a conflation of the separate
    # mechanisms defined in ncgen3.l for decimal, octal and hex integer constants.
+   @TOKEN(int_const)
    def t_INT_CONST(self, t) :
-      r'[+-]?([1-9][0-9]*|0[xX]?[0-9a-fA-F]+|0)'   # [Ll] suffix has been deprecated
+      #r'[+-]?([1-9][0-9]*|0[xX]?[0-9a-fA-F]+|0)'   # [Ll] suffix has been deprecated
       #r'[+-]?([1-9][0-9]*|0)[lL]?' # original regex for decimal integers in ncgen3.l file
       #r'0[xX]?[0-9a-fA-F]+[lL]?'   # original regex for octal or hex integers in ncgen3.l file
-      t.value = fix_octal(t.value)
-      try :
-         long_val = long(eval(t.value))
-      except :
-         errmsg = "Bad integer constant: %s" %  t.value
-         raise CDLContentError(errmsg)
-      if long_val < XDR_INT_MIN or long_val > XDR_INT_MAX :
-         errmsg = "Integer constant outside valid range (%d -> %d): %s" \
-            % (XDR_INT_MIN, XDR_INT_MAX, long_val)
-         raise CDLContentError(errmsg)
-      else :
-         t.value = np.int32(long_val)
       return t
 
    # newlines
@@ -443,8 +1087,14 @@ class CDL3Parser(CDLParser) :
 
    def t_error(self, t):
       """Handles token errors."""
+      # an unmatched quote may just mean that a string constant spans the end of a partial input
+      # buffer, in which case the streaming lexer needs to read more input and try again
+      if t.value[0] in "\"'" and getattr(t.lexer, 'pending_input', False) :
+         t.lexer.needs_input = True
+         t.lexer.skip(1)
+         return
       msg  = "Illegal character(s) encountered at line number %d, lexical position %d\n" \
-         % (t.lineno, t.lexpos)
+         % (t.lineno, t.lexpos + getattr(t.lexer, 'lexoffset', 0))
       msg += "Token value = '%s'" % t.value
       self.logger.warning(msg)
       t.lexer.skip(1)
@@ -455,17 +1105,65 @@ class CDL3Parser(CDLParser) :
    ### requirement.
 
    def p_ncdesc(self, p) :
-      """ncdesc : NETCDF init_netcdf LBRACE dimsection vasection datasection RBRACE"""
-      if self.ncdataset :
-         if self.close_on_completion : self.ncdataset.close()
+      """ncdesc : NETCDF init_netcdf LBRACE dimsection vasection define_netcdf datasection RBRACE"""
+      start = time.time()
+      # wait for any writes still queued, which the netCDF write time then includes
+      if self.write_thread : self.write_thread.finish()
+      if self.ncdataset and self.in_memory and not self.header_only :
+         with NETCDF_LOCK : self.ncbuffer = self.ncdataset.close()
+         self.logger.info("Closed in-memory netCDF dataset (%d bytes)" % len(self.ncbuffer))
+      elif self.ncdataset and not self.header_only :
+         with NETCDF_LOCK :
+            if self.updating : self.finish_update()
+            if self.close_on_completion : self.ncdataset.close()
+         self.logger.info("Closed netCDF file " + self.ncfile)
+      if self.stats : self.stats.netcdf_write_secs += time.time() - start
+      self.logger.info("Finished parsing")
+
+   # A data fragment, as parsed by the append methods, stands in for a complete dataset description.
+   # Its FRAGMENT token is supplied by a FragmentLexer rather than lexed from the CDL input.
+   def p_ncfragment(self, p) :
+      """ncdesc : FRAGMENT datasection
+                | FRAGMENT datadecls"""
+      start = time.time()
+      if self.close_on_completion and not self.keep_open :
+         with NETCDF_LOCK : self.ncdataset.close()
          self.logger.info("Closed netCDF file " + self.ncfile)
+      if self.stats : self.stats.netcdf_write_secs += time.time() - start
       self.logger.info("Finished parsing")
 
+   # The dimensions, variables and attributes declared in the CDL header are first collected in a
+   # CDLDataset object. The netCDF dataset is then created from that description in one go, just
+   # before the data section, by the define_netcdf rule.
    def p_init_netcdf(self, p) :
       """init_netcdf :"""
-      if not self.ncfile : self.set_filename(p[-1])
-      self.ncdataset = nc4.Dataset(self.ncfile, 'w', format=self.file_format)
-      self.logger.info("Initialised netCDF file " + self.ncfile)
+      self.header = CDLDataset(p[-1])
+      self.logger.info("Initialised description of dataset " + p[-1])
+
+   def p_define_netcdf(self, p) :
+      """define_netcdf :"""
+      if self.header_only :
+         self.ncdataset = self.header
+         return
+      if self.in_memory :
+         # netCDF4 treats the filename merely as a name when the dataset is created in memory
+         ncfile = self.ncfile or self.header.name + '.nc'
+      else :
+         if not self.ncfile : self.set_filename(self.header.name)
+         ncfile = self.ncfile
+      start = time.time()
+      if self.update and not self.in_memory and os.path.exists(ncfile) \
+         and hasattr(self.writer, 'update') :
+         self.update_netcdf(ncfile)
+      if not self.updating :
+         self.ncdataset = self.writer.define(self.header, ncfile, self.file_format,
+            in_memory=self.in_memory, header_pad=self.header_pad)
+         if self.write_queue_size > 0 :
+            self.write_thread = WriterThread(self.write_queue_size)
+            self.write_thread.start()
+      if self.stats : self.stats.netcdf_define_secs += time.time() - start
+      self.logger.info("Defined netCDF dataset %s with %d dimension(s) and %d variable(s)" \
+         % (ncfile, len(self.header.dimensions), len(self.header.variables)))
 
    def p_dimsection(self, p) :
       """dimsection : DIMENSIONS dimdecls
@@ -483,8 +1181,9 @@ class CDL3Parser(CDLParser) :
       """dimdecl : dimd EQUALS INT_CONST
                  | dimd EQUALS DOUBLE_CONST
                  | dimd EQUALS NC_UNLIMITED_K"""
+      self.check_cancelled()
       dimname = ""
-      if isinstance(p[3], six.string_types) :
+      if p.slice[3].type == "NC_UNLIMITED_K" :
          if p[3] == "unlimited" :
             if self.rec_dimname :
                raise CDLContentError("Only one UNLIMITED dimension is allowed.")
@@ -495,17 +1194,17 @@ class CDL3Parser(CDLParser) :
             raise CDLContentError("Unrecognised dimension length specifier: '%s'." % p[3])
       else :
          dimname = p[1]
-         dimlen = int(p[3])
+         dimlen = int(convert_literal(p.slice[3].type, p[3]))
          if dimlen <= 0 :
             raise CDLContentError("Length of dimension '%s' must be positive." % dimname)
       if dimname :
-         self.curr_dim = self.ncdataset.createDimension(dimname, dimlen)
+         self.curr_dim = self.header.createDimension(dimname, dimlen)
          unlim = " (unlimited)" if dimlen == 0 else ""
          self.logger.info("Created dimension %s with length %s%s" % (dimname, dimlen, unlim))
 
    def p_dimd(self, p) :
       """dimd : dim"""
-      if p[1] in self.ncdataset.dimensions :
+      if p[1] in self.header.dimensions :
          raise CDLContentError("Duplicate declaration for dimension '%s'." % p[1])
       p[0] = p[1]
 
@@ -526,6 +1225,7 @@ class CDL3Parser(CDLParser) :
       """vadecl : vardecl
                 | attdecl
                 | gattdecl"""
+      self.check_cancelled()
 
    def p_vardecl(self, p) :
       """vardecl : type varlist"""
@@ -540,11 +1240,11 @@ class CDL3Parser(CDLParser) :
 
    def p_varspec(self, p) :
       """varspec : var dimspec"""
-      if p[1] in self.ncdataset.variables :
+      if p[1] in self.header.variables :
          raise CDLContentError("Duplicate declaration of variable %s." % p[1])
       dims = len(p)==3 and p[2] or ()
-      self.curr_var = self.ncdataset.createVariable(p[1], self.datatype, dimensions=dims,
-         shuffle=False)
+      self.curr_var = self.header.createVariable(p[1], self.datatype, dimensions=dims,
+         **self.storage_options(p[1], dims))
       self.logger.info("Created variable %s with data type '%s' and dimensions %s" \
          % (p[1], self.datatype, dims))
 
@@ -578,12 +1278,12 @@ class CDL3Parser(CDLParser) :
    # attribute value. They cannot be prefixed with a type declaration, as is possible at CDL v4.
    def p_gattdecl(self, p) :
       """gattdecl : gatt EQUALS attvallist"""
-      if self.ncdataset :
+      if self.header :
          self.set_attribute(':'+p[1], p[3])
 
    def p_attdecl(self, p) :
       """attdecl : att EQUALS attvallist"""
-      if self.ncdataset :
+      if self.header :
          self.set_attribute(p[1], p[3])
 
    def p_att(self, p) :
@@ -597,11 +1297,16 @@ class CDL3Parser(CDLParser) :
    def p_avar(self, p) :
       """avar : var"""
       varname = p[1]
-      if self.ncdataset :
-         if varname not in self.ncdataset.variables :
+      # variables are looked up in the header description until the netCDF dataset is defined
+      dataset = self.ncdataset or self.header
+      if dataset :
+         if varname not in dataset.variables :
             raise CDLContentError("Variable %s is not defined or reference precedes definition." \
                % varname)
-         self.curr_var = self.ncdataset.variables[varname]
+         if dataset is self.ncdataset :
+            self.curr_var = self.data_variable(varname)
+         else :
+            self.curr_var = dataset.variables[varname]
          self.logger.debug("Current variable set to '%s'" % varname)
       p[0] = varname
 
@@ -630,7 +1335,9 @@ class CDL3Parser(CDLParser) :
                   | FLOAT_CONST
                   | DOUBLE_CONST
                   | TERMSTRING"""
-      p[0] = p[1]
+      # numeric constants are passed on as (type tag, raw text) pairs for conversion in bulk
+      tag = p.slice[1].type
+      p[0] = (tag, p[1]) if tag in LITERAL_TYPES else p[1]
 
    def p_datasection(self, p) :
       """datasection : DATA datadecls
@@ -643,13 +1350,22 @@ class CDL3Parser(CDLParser) :
 
    def p_datadecl(self, p) :
       """datadecl : avar EQUALS constlist"""
+      self.check_cancelled()
       if self.ncdataset :
          if p[1] not in self.ncdataset.variables :
             raise CDLContentError("Variable %s referenced in data section is not defined." % p[1])
-         var = self.ncdataset.variables[p[1]]
+         var = self.data_variable(p[1])
          arr = p[3]
          try :
+            nvalues = len(arr)
+            start = time.time()
             self.write_var_data(var, arr)
+            if self.stats :
+               self.stats.values_written[p[1]] = nvalues
+               if isinstance(arr, (RecordBuffer, CharRecordBuffer)) :
+                  self.stats.netcdf_write_secs += arr.write_secs
+               else :
+                  self.stats.netcdf_write_secs += time.time() - start
             self.logger.info("Wrote %d data value(s) for variable %s" % (len(arr), p[1]))
          except Exception as exc :
             self.logger.error(str(exc))
@@ -658,14 +1374,35 @@ class CDL3Parser(CDLParser) :
    def p_constlist(self, p) :
       """constlist : constlist ',' dconst
                    | dconst"""
-      # FIXME: repeatedly appending values to a list will be inefficient for large data arrays
+      # values are appended in place to a buffer created when the first value is reduced
       if len(p) == 2 :
-         p[0] = p[1:]
+         p[0] = self.new_data_buffer(self.curr_var)
+         value = p[1]
       else :
-         p[0] = p[1] + p[3:]
+         p[0] = p[1]
+         value = p[3]
+      try :
+         if isinstance(value, LiteralRun) :
+            self.append_literal_run(p[0], value)
+         elif isinstance(value, tuple) :
+            if isinstance(p[0], DataBuffer) :
+               p[0].append_literal(*value)
+            else :
+               p[0].append(convert_literal(*value))
+         elif isinstance(value, np.ndarray) :
+            p[0].extend(value)
+         elif isinstance(value, list) :
+            self.append_string_run(p[0], value)
+         else :
+            p[0].append(value)
+      except (ValueError, TypeError, OverflowError) :
+         errmsg = "Invalid data value %r for variable %s" % (value, self.curr_var._name)
+         raise CDLContentError(errmsg)
 
    def p_dconst(self, p) :
-      """dconst : const"""
+      """dconst : const
+                | NUMERIC_RUN
+                | STRING_RUN"""
       p[0] = p[1]
 
    def p_const(self, p) :
@@ -680,14 +1417,11 @@ class CDL3Parser(CDLParser) :
       # return the value of the constant, or the current variable's fill value if the specified
       # constant value is the string '_'.
       if p[1] == FILL_STRING :
-         if self.curr_var is not None and self.curr_var.dtype.kind != 'S' :   # numeric variables only
-            if '_FillValue' in self.curr_var.ncattrs() :
-               p[0] = self.curr_var._FillValue
-            else :
-               p[0] = get_default_fill_value(self.curr_var.dtype.char)
-         else :
-            self.logger.warn("Unable to replace fill value. Check CDL input for possible errors.")
-            p[0] = p[1]
+         p[0] = self.fill_value(self.curr_var)
+      elif p.slice[1].type in LITERAL_TYPES :
+         # numeric constants are converted in bulk by the data buffer
+         # (see DataBuffer.append_literal)
+         p[0] = (p.slice[1].type, p[1])
       else :
          p[0] = p[1]
 
@@ -719,6 +1453,11 @@ class CDL3Parser(CDLParser) :
    ### GENERAL SUPPORT METHODS
 
    # TODO: consider adding a '_' prefix to these methods to make them pseudo-private.
+   def check_cancelled(self) :
+      """Raise CDLParseCancelled if the cancel_event has been set."""
+      if self.cancel_event is not None and self.cancel_event.is_set() :
+         raise CDLParseCancelled("Parsing cancelled at line number %d" % self.lexer.lineno)
+
    def set_filename(self, ncname) :
       """Sets the netCDF filename based on the netCDF name token in the CDL input."""
       if self.cdlfile :
@@ -727,23 +1466,212 @@ class CDL3Parser(CDLParser) :
          basedir = os.path.abspath(".")
       self.ncfile = os.path.join(basedir, ncname+'.nc')
 
+   def update_netcdf(self, ncfile) :
+      """
+      Open the existing netCDF file ncfile for update in place, if its dimensions, variables and
+      attributes match the CDL header. Otherwise the update report records why the file must be
+      rebuilt instead.
+      """
+      self.update_report = UpdateReport(ncfile)
+      try :
+         self.ncdataset = self.writer.update(self.header, ncfile, self.file_format)
+      except (CDLContentError, IOError, OSError) as exc :
+         self.update_report.rebuilt, self.update_report.reason = True, str(exc)
+         self.logger.info("Rebuilding netCDF file %s: %s" % (ncfile, exc))
+         return
+      self.updating = True
+      if self.rec_dimname :
+         self.nrecs_before = self.record_count()
+      self.logger.info("Opened netCDF file %s for update" % ncfile)
+
+   def finish_update(self) :
+      """
+      Complete the update of an existing netCDF file by resetting any variables missing from the
+      data section to fill values, as they would be in a newly created file. RebuildRequired is
+      raised if the data section holds fewer records than the file, since the file can't shrink.
+      """
+      if self.nrecs_parsed < self.nrecs_before :
+         raise RebuildRequired("The CDL data has %d record(s) but the file has %d" \
+            % (self.nrecs_parsed, self.nrecs_before))
+      report = self.update_report
+      for varname in self.header.variables :
+         if varname not in report.variables :
+            VariableUpdater(self.ncdataset.variables[varname], report).fill()
+      self.logger.info("Updated netCDF file %s: rewrote %d of %d block(s), in variable(s) %s" \
+         % (self.ncfile, report.blocks_written, report.blocks_compared,
+         ', '.join(report.changed) or 'none'))
+
+   def storage_options(self, varname, dims) :
+      """
+      Return the createVariable storage keyword arguments for variable varname, with dimensions
+      dims, selected according to the storage option. Record variables are given automatic
+      chunk sizes even if no storage rule matches them.
+      """
+      options = {}
+      for pattern, opts in self.storage :
+         if fnmatch.fnmatchcase(varname, pattern) : options.update(opts)
+      if not dims or (not options and self.rec_dimname not in dims) : return {}
+      if 'complevel' in options : options.setdefault('zlib', True)
+      recdim = dims.index(self.rec_dimname) if self.rec_dimname in dims else None
+      if recdim is not None and options.get('contiguous') :
+         self.logger.warning("Record variable %s cannot be stored contiguously" % varname)
+         del options['contiguous']
+      chunksizes = options.get('chunksizes')
+      if chunksizes == 'auto' or (chunksizes is None and recdim is not None) :
+         shape = [len(self.header.dimensions[dimname]) for dimname in dims]
+         itemsize = np.dtype(self.datatype).itemsize
+         options['chunksizes'] = auto_chunksizes(shape, itemsize, recdim)
+      return options
+
+   def data_variable(self, varname) :
+      """
+      Return the netCDF variable varname ready for its data to be written, wrapped in a
+      VariableUpdater or PipelinedVariable as required by the update or write_queue_size options.
+      """
+      var = self.ncdataset.variables[varname]
+      if self.updating :
+         return VariableUpdater(var, self.update_report)
+      if self.write_thread :
+         return PipelinedVariable(var, self.header.variables[varname], self.write_thread)
+      return var
+
+   def record_count(self) :
+      """
+      Return the current length of the record dimension. While a writer thread is in use this is
+      tracked by the thread object, since no netCDF calls may be made by the parsing thread.
+      """
+      if self.write_thread : return self.write_thread.nrecs
+      with NETCDF_LOCK : return len(self.ncdataset.dimensions[self.rec_dimname])
+
+   def new_data_buffer(self, var) :
+      """
+      Create a container for the data values of variable var. Numeric variables get a DataBuffer
+      preallocated to the variable's size or, for record variables, to the records from first_record
+      onwards or, if there are none yet, to a multiple of the record length. Character variables get
+      a CharBuffer sized in the same way, in strings, unless they are scalar, in which case they get
+      a plain list. If the stream_records option is enabled then record variables get a
+      RecordBuffer or, for character variables, a CharRecordBuffer. Non-record buffers start at no
+      more than DEFAULT_BUFFER_SIZE values and grow as values arrive, so that memory use follows the
+      number of values given rather than the size of the variable, the remainder of which may be
+      left to the netCDF library's fill mode.
+      """
+      if var is None :
+         return []
+      is_charvar = var.dtype.kind == 'S'
+      dimnames, varshape = var_layout(var)
+      if self.stream_records and self.rec_dimname in dimnames :
+         shape = varshape[1:-1] if is_charvar else varshape[1:]
+         reclen = reduce(lambda x,y: x*y, shape, 1)
+         if is_charvar and var.ndim > 1 and varshape[-1] :
+            return CharRecordBuffer(var, reclen, self.first_record)
+         return RecordBuffer(var, reclen, self.first_record)
+      if is_charvar and not (var.ndim and varshape[-1]) :
+         return []
+      # character variables hold one string per row along their last dimension
+      shape = varshape[:-1] if is_charvar else varshape
+      if self.rec_dimname in dimnames :
+         reclen = reduce(lambda x,y: x*y,
+            [n for dimname, n in zip(dimnames, shape) if dimname != self.rec_dimname], 1)
+         nrecs = self.record_count() - self.first_record
+         size = nrecs * reclen if nrecs > 0 else max(reclen, DEFAULT_BUFFER_SIZE // reclen * reclen)
+      else :
+         size = min(reduce(lambda x,y: x*y, shape, 1), DEFAULT_BUFFER_SIZE)
+      if is_charvar :
+         return CharBuffer(varshape[-1], size)
+      return DataBuffer(var.dtype, size)
+
+   def fill_value(self, var) :
+      """
+      Return the value to use in place of the fill value constant '_' in the data for variable var.
+      This is only possible for numeric variables; for other variables '_' is returned as is.
+      """
+      if var is not None and var.dtype.kind != 'S' :   # numeric variables only
+         with write_lock(var) :
+            if '_FillValue' in var.ncattrs() :
+               return var._FillValue
+         return get_default_fill_value(var.dtype.char)
+      self.logger.warning("Unable to replace fill value. Check CDL input for possible errors.")
+      return FILL_STRING
+
+   def append_literal_run(self, arr, run) :
+      """
+      Append a run of numeric constants and fill values to the data buffer arr for the current
+      variable. Numeric buffers take the whole run as a single array, converted in bulk.
+      """
+      if isinstance(arr, DataBuffer) and arr.data.dtype != object :
+         fv = self.fill_value(self.curr_var) if 'FILLVALUE' in run.tags else None
+         arr.extend(run.values(arr.data.dtype, fv))
+      else :
+         for tag, text in run.items() :
+            if tag == 'FILLVALUE' :
+               arr.append(self.fill_value(self.curr_var))
+            else :
+               arr.append(convert_literal(tag, text))
+
+   def append_string_run(self, arr, strings) :
+      """
+      Append a run of strings to the data buffer arr for the current variable. A CharBuffer takes
+      the whole run at once. As for single strings, any "_" strings stand for the fill value.
+      """
+      if FILL_STRING in strings :
+         strings = [self.fill_value(self.curr_var) if x == FILL_STRING else x for x in strings]
+      if isinstance(arr, CharBuffer) :
+         arr.extend(strings)
+      else :
+         for value in strings : arr.append(value)
+
+   def pad_var_data(self, var, arr, varlen, reclen=1) :
+      """
+      Pad out data array arr for variable var with fill values if it contains fewer than the varlen
+      values required. Values after the last complete record of reclen values are left to the
+      netCDF library's fill mode, if that supplies the same values, so that the time and memory
+      taken scale with the number of values given rather than the size of the variable. Returns
+      true if the array was not padded out in full, i.e. only its values need be written.
+      """
+      arrlen = len(arr)
+      if self.stats : self.stats.values_padded[var._name] = varlen - arrlen
+      fill = padding_value(var)
+      # values already in a file being updated or appended to have to be overwritten, and appended
+      # records must be written after the existing ones rather than as a prefix of the variable
+      if self.updating or self.appending or not netcdf_fills(var) :
+         prefix_only = False
+      elif var.dtype.kind == 'S' :
+         # padded strings are null-filled, as for fill mode, unless the fill value is a character
+         prefix_only = isinstance(arr, CharBuffer) and not encode_text(fill).strip(b'\0')
+      else :
+         prefix_only = True
+      npad = -arrlen % reclen if prefix_only else varlen - arrlen
+      if isinstance(arr, CharBuffer) :
+         arr.pad(arrlen + npad, fill)
+      elif var.dtype.kind == 'S' :
+         pad_array(var, arrlen + npad, arr)
+      else :
+         arr.extend(np.full(npad, fill, dtype=var.dtype))
+      if prefix_only :
+         self.logger.info("Padded input data array with %d fill values, leaving %d to the netCDF "
+            "library's fill mode" % (npad, varlen - arrlen - npad))
+      else :
+         self.logger.info("Padded input data array with %d fill values" % npad)
+      return prefix_only
+
    def set_attribute(self, attid, attvallist) :
       """Set a global or variable-scope attribute value."""
-      if isinstance(attvallist, (list,tuple)) and len(attvallist) == 1 :
+      if isinstance(attvallist, list) : attvallist = convert_attribute_values(attvallist)
+      if isinstance(attvallist, (list,tuple,np.ndarray)) and len(attvallist) == 1 :
          attval = attvallist[0]
       else :
          attval = attvallist
       # global-scope attribute
       if attid[0] == ':' :
-         if attid[1:] in self.ncdataset.ncattrs() :
+         if attid[1:] in self.header.ncattrs() :
             raise CDLContentError("Duplicate global attribute: %s" % attid)
-         self.ncdataset.setncattr(attid[1:], attval)
+         self.header.setncattr(attid[1:], attval)
          self.logger.info("Created global attribute %s = %s" % (attid, repr(attval)))
       # variable-scope attribute
       else :
          try :
             (varname,attname) = attid.split(':')
-            var = self.ncdataset.variables[varname]
+            var = self.header.variables[varname]
             if attname in var.ncattrs() :
                raise CDLContentError("Duplicate attribute: %s" % attid)
             if attname == "_FillValue" :
@@ -766,12 +1694,16 @@ class CDL3Parser(CDLParser) :
 
       is_scalar = (var.ndim == 0)
       is_charvar = (var.dtype.kind == 'S')
-      is_recvar = self.rec_dimname in var.dimensions
+      dimnames, varshape = var_layout(var)
+      is_recvar = self.rec_dimname in dimnames
+
+      # convert any numeric constants still held as raw text, reporting any invalid ones as such
+      if isinstance(arr, DataBuffer) and arr.pending : arr.convert_pending()
 
       # scalar variables ought to be fairly straightforward      
       if is_scalar :
          try :
-            var.assignValue(arr[0])
+            with write_lock(var) : var.assignValue(arr[0])
             self.logger.debug("Assigned value %r to scalar variable %s" % (arr[0], var._name))
          except :
             errmsg = "Error attempting to assign data value to scalar variable %s" % var._name
@@ -779,45 +1711,66 @@ class CDL3Parser(CDLParser) :
             raise CDLContentError(errmsg)
          return
 
+      # record data is written to the variable as it is parsed, so just pad and flush the remainder
+      if isinstance(arr, (RecordBuffer, CharRecordBuffer)) :
+         arrlen = len(arr)
+         if self.updating : self.nrecs_parsed = max(self.nrecs_parsed, -(-arrlen // arr.reclen))
+         if arrlen < arr.varlen :
+            self.pad_var_data(var, arr, arr.varlen, arr.reclen)
+         elif arrlen % arr.reclen != 0 :
+            errmsg = "Record length %d is not a factor of variable length %d" % (arr.reclen, arrlen)
+            raise CDLContentError(errmsg)
+         arr.flush()
+         return
+
       # determine the expected number of data values for the current variable
       # for char-valued variables we need to divide by the length of the last dimension
       arrlen = len(arr)
-      varlen = var.size
+      varlen = reduce(lambda x,y: x*y, varshape, 1)
       if is_charvar and var.ndim > 0 :
-         varlen = varlen // var.shape[-1]
+         varlen = varlen // varshape[-1]
       reclen = 0
+      start = 0
       self.logger.debug("Length of passed-in data array = %d" % arrlen)
       if varlen : self.logger.debug("Expected length of variable = %d" % varlen)
 
       # see if we're dealing with a record variable; if so then work out the record length and, if
-      # length of record dimension is 0, assume that total variable length = length of input array
+      # length of record dimension is 0, assume that total variable length = length of input array.
+      # Only the records from first_record onwards, i.e. those being appended, are counted.
       if is_recvar :
-         rec_dimlen = len(self.ncdataset.dimensions[self.rec_dimname])
+         start = self.first_record
+         rec_dimlen = self.record_count() - start
          if rec_dimlen > 0 :   # record dimension has been set to non-zero
-            reclen = varlen // rec_dimlen
+            reclen = varlen // (start + rec_dimlen)
+            varlen = reclen * rec_dimlen
          else :                # record dimension is still equal to zero
             varlen = arrlen
-            reclen = 1
-            if var.ndim > 1 : reclen = reduce(lambda x,y: x*y, [x for x in var.shape if x > 0])
+            reclen = reduce(lambda x,y: x*y, [n for dimname, n in zip(dimnames, varshape)
+               if dimname != self.rec_dimname], 1)
+            # for char-valued variables the record length is a number of strings
+            if is_charvar and var.ndim > 1 : reclen //= varshape[-1]
             self.logger.debug("Expected length of variable = %d" % varlen)
          # check that reclen is integer factor of variable length
          if varlen % reclen != 0 :
             errmsg = "Record length %d is not a factor of variable length %d" % (reclen, varlen)
             raise CDLContentError(errmsg)
          self.logger.debug("Length of one data record = %d" % reclen)
+         if self.updating : self.nrecs_parsed = max(self.nrecs_parsed, -(-arrlen // reclen))
 
       # pad out data array with fill values if too few values were defined in the CDL source
+      prefix_only = False
       if arrlen < varlen :
-         pad_array(var, varlen, arr)
-         self.logger.info("Padded input data array with %d fill values" % (varlen-arrlen))
+         prefix_only = self.pad_var_data(var, arr, varlen, reclen or 1)
          arrlen = len(arr)
 
       # convert input data to suitably shaped numpy array
       try :
-         if is_charvar :
-            put_char_data(var, arr, reclen)
+         if prefix_only :
+            put_data_prefix(var, arr)
+         elif is_charvar :
+            put_char_data(var, arr, reclen, start)
          else :
-            put_numeric_data(var, arr, reclen)
+            put_numeric_data(var, arr, reclen, start)
       except Exception as exc :
          errmsg = "Error attempting to write data array for variable %s\n" % var._name
          errmsg += "Exception details are as follows:\n%s" % str(exc)
@@ -834,71 +1787,2018 @@ class CDL3Parser(CDLParser) :
       print("-----")
 
 #---------------------------------------------------------------------------------------------------
-def put_numeric_data(var, arr, reclen=0) :
+def clone_lexer(lexer, module) :
 #---------------------------------------------------------------------------------------------------
-   """Write numeric data array to netcdf variable."""
-   nparr = np.array(arr, dtype=var.dtype)
-   shape = list(var.shape)
-   if reclen : shape[0] = len(arr) // reclen
-   nparr.shape = shape
-   var[:] = nparr
+   """
+   Return a shallow copy of a PLY Lexer whose token functions are bound to the methods of the same
+   name on object module. This does the same job as the Lexer.clone method, which in PLY 3.11 keeps
+   only the last of the master regular expressions for each lexer state, and so drops any rules
+   specific to inclusive states. The compiled regular expressions are shared with lexer.
+   """
+   if isinstance(lexer, FastLexer) : return lexer.clone(module)
+   newlexer = copy.copy(lexer)
+   newlexer.lexstatere = {}
+   for state, ritems in lexer.lexstatere.items() :
+      newitems = []
+      for cre, findex in ritems :
+         newfindex = [(getattr(module, f[0].__name__), f[1]) if f and f[0] else f for f in findex]
+         newitems.append((cre, newfindex))
+      newlexer.lexstatere[state] = newitems
+   newlexer.lexstateerrorf = {}
+   for state, ef in lexer.lexstateerrorf.items() :
+      newlexer.lexstateerrorf[state] = getattr(module, ef.__name__)
+   newlexer.lexmodule = module
+   newlexer.begin(lexer.current_state())
+   return newlexer
 
 #---------------------------------------------------------------------------------------------------
-def put_char_data(var, arr, reclen=0) :
+def clone_parser(parser, module) :
 #---------------------------------------------------------------------------------------------------
-   """Write character data array to netcdf variable."""
-   maxlen = var.shape[-1] if var.ndim > 0 else 1
-   nparr = str_list_to_char_arr(arr, maxlen)
-   shape = list(var.shape)
-   if reclen : shape[0] = len(arr) // reclen
-   nparr.shape = shape
-   var[:] = nparr
+   """
+   Return a shallow copy of a PLY LRParser whose grammar rule callables, and error function, are
+   bound to the methods of the same name on object module. The parsing tables are not copied since
+   they are never modified once built.
+   """
+   newparser = copy.copy(parser)
+   newparser.productions = []
+   for p in parser.productions :
+      newp = yacc.MiniProduction(p.str, p.name, p.len, p.func, p.file, p.line)
+      if p.func : newp.callable = getattr(module, p.func)
+      newparser.productions.append(newp)
+   if parser.errorfunc : newparser.errorfunc = getattr(module, parser.errorfunc.__name__)
+   return newparser
 
 #---------------------------------------------------------------------------------------------------
-def str_list_to_char_arr(slist, maxlen) :
+class AsyncCDLParser(object) :
 #---------------------------------------------------------------------------------------------------
    """
-   Convert a list of regular python strings to a numpy character array of type '|S1', which is what
-   is required by the netCDF4 module. The maximum length of each string in the output netcdf array
-   is defined by maxlen. It's usually the last dimension in the variable declaration.
+   An asyncio front end to a CDLParser, for use by event-loop based services. The parse methods
+   have the same arguments as those of CDLParser but return asyncio futures, which resolve to the
+   same netCDF4.Dataset handle, or memoryview, as the synchronous methods would return. Parsing,
+   including all netCDF I/O, runs on an executor so the event loop is never blocked, e.g.:
+
+       aparser = AsyncCDLParser(CDL3Parser(close_on_completion=True), max_concurrency=4)
+       ncdataset = await aparser.parse_file(cdlfilename)
+
+   At most max_concurrency parsing operations run at once, on a ThreadPoolExecutor created for the
+   purpose, unless another executor is passed in, in which case its own limit applies; further
+   calls wait in the executor's queue. If a future is cancelled before its parsing operation starts
+   then it never runs; if the operation is already running then it stops at the end of the current
+   declaration, as for the cancel_event option of CDLParser.
+
+   Each operation runs on its own copy of the parser, which is attached to the future as its parser
+   attribute, so the stats and update_report of the operation are read from future.parser rather
+   than from the parser passed in.
    """
-   stype = 'S%d' % maxlen
-   tarr = np.array(slist, dtype=stype)
-   return nc4.stringtochar(tarr)
+   def __init__(self, parser=None, max_concurrency=None, executor=None) :
+      """
+      :param parser: The CDLParser used for each parsing operation. [default: a CDL3Parser]
+      :param max_concurrency: The maximum number of parsing operations to run at once.
+         [default: the number of CPUs]
+      :param executor: A concurrent.futures.Executor on which to run parsing operations, in place
+         of the ThreadPoolExecutor otherwise created. The number of operations run at once is
+         then up to the executor, so max_concurrency mustn't also be given. [default: None]
+      """
+      import concurrent.futures
+      if executor is not None and max_concurrency is not None :
+         raise ValueError("max_concurrency cannot be applied to an executor passed in")
+      self.parser = parser or CDL3Parser()
+      self.max_concurrency = max_concurrency or multiprocessing.cpu_count()
+      self.executor = executor or concurrent.futures.ThreadPoolExecutor(self.max_concurrency)
+      self.owns_executor = executor is None
+
+   def parse_file(self, cdlfile, ncfile=None) :
+      """Return a future for the result of CDLParser.parse_file."""
+      return self.submit('parse_file', cdlfile, ncfile)
+
+   def parse_stream(self, stream, ncfile=None) :
+      """Return a future for the result of CDLParser.parse_stream."""
+      return self.submit('parse_stream', stream, ncfile)
+
+   def parse_text(self, cdltext, ncfile=None) :
+      """Return a future for the result of CDLParser.parse_text."""
+      return self.submit('parse_text', cdltext, ncfile)
+
+   def submit(self, method, *args) :
+      """
+      Run the named parse method of a copy of the parser, with its own cancel event, on the
+      executor, and return an asyncio future for the result, with the parser copy attached as its
+      parser attribute. This must be called from a coroutine or callback running in the event loop.
+      """
+      import asyncio
+      parser = copy.copy(self.parser)
+      parser.cancel_event = threading.Event()
+      loop = asyncio.get_running_loop()
+      future = loop.run_in_executor(self.executor, getattr(parser, method), *args)
+      future.add_done_callback(lambda f: f.cancelled() and parser.cancel_event.set())
+      future.parser = parser
+      return future
+
+   def close(self, wait=True) :
+      """Shut down the executor, if it was created by this object."""
+      if self.owns_executor : self.executor.shutdown(wait=wait)
 
 #---------------------------------------------------------------------------------------------------
-def pad_array(var, varlen, arr) :
+class CDLDataset(object) :
 #---------------------------------------------------------------------------------------------------
    """
-   Pad out array arr with fill values if it contains fewer elements than are required by the host
-   variable.
+   In-memory description of the dimensions, variables and attributes defined in a CDL header. The
+   parser builds one of these while parsing the header, and then hands it to the output backend,
+   or returns it directly if the header_only option is enabled. The subset of the netCDF4.Dataset
+   interface used by the grammar actions is implemented, hence the camel-case method names.
    """
-   if '_FillValue' in var.ncattrs() :
-      fv = var._FillValue
-   elif 'missing_value' in var.ncattrs() :
-      fv = var.missing_value
-   else :
-      fv = get_default_fill_value(var.dtype.char)
-   arrlen = len(arr)
-   arr.extend([fv]*(varlen-arrlen))
+   def __init__(self, name) :
+      self.name = name
+      self.dimensions = OrderedDict()
+      self.variables = OrderedDict()
+      self.attributes = OrderedDict()
+
+   def createDimension(self, dimname, size=None) :
+      """Add a dimension of the given size, or an unlimited dimension if size is 0 or None."""
+      dim = CDLDimension(dimname, size)
+      self.dimensions[dimname] = dim
+      return dim
+
+   def createVariable(self, varname, datatype, dimensions=(), **kwargs) :
+      """
+      Add a variable of the given data type and dimensions. Other keywords are retained as the
+      variable's storage options, to be passed on to netCDF4 when the dataset is defined.
+      """
+      for dimname in dimensions :
+         if dimname not in self.dimensions :
+            raise CDLContentError("Variable %s references undefined dimension %s" \
+               % (varname, dimname))
+      var = CDLVariable(self, varname, datatype, dimensions)
+      var.storage = kwargs
+      self.variables[varname] = var
+      return var
+
+   def ncattrs(self) :
+      return list(self.attributes)
+
+   def getncattr(self, name) :
+      return self.attributes[name]
+
+   def setncattr(self, name, value) :
+      self.attributes[name] = value
+
+   def header_size(self, file_format='NETCDF3_CLASSIC') :
+      """
+      Return the size in bytes of the header of a netCDF-3 file holding this dataset, excluding any
+      reserved free space, or None for the netCDF-4 file formats. The calculation follows the layout
+      of the classic file format, in which lists of names and attribute values are padded to 4-byte
+      boundaries.
+      """
+      if file_format not in NC3_FILE_FORMATS : return None
+      offset_size = 4 if file_format == 'NETCDF3_CLASSIC' else 8
+      # magic number and number of records, followed by the dimension, attribute and variable lists
+      size = 8 + 8 + sum([nc3_name_size(dim.name) + 4 for dim in self.dimensions.values()])
+      size += nc3_attlist_size(self.attributes)
+      size += 8
+      for var in self.variables.values() :
+         size += nc3_name_size(var.name) + 4 + 4*len(var.dimensions)
+         size += nc3_attlist_size(var.attributes) + 8 + offset_size
+      return size
 
 #---------------------------------------------------------------------------------------------------
-def deescapify(name) :
+class CDLDimension(object) :
 #---------------------------------------------------------------------------------------------------
    """
-   A Python version of ncgen's deescapify() function (see genlib.c). The code here is a fairly
-   literal translation of that function. I expect this could be recoded in a more pythonic way
-   using, say, regular expressions.
+   Description of a dimension defined in a CDL header. A size of 0 denotes an unlimited dimension.
    """
-   if '\\' not in name : return name
-   newname = ''
-   i = 0
-   # delete '\' chars, except change '\\' to '\'
-   while i < len(name) :
-      if name[i] == '\\' :
-         if name[i+1] == '\\' :
-            newname += '\\'
-            i += 1
+   def __init__(self, name, size=None) :
+      self.name = name
+      self.size = size or 0
+
+   def __len__(self) :
+      return self.size
+
+   def isunlimited(self) :
+      return self.size == 0
+
+#---------------------------------------------------------------------------------------------------
+class CDLVariable(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Description of a variable defined in a CDL header. As for netCDF4.Variable objects, the data type
+   of character variables is reported as 'S1'.
+   """
+   def __init__(self, dataset, name, datatype, dimensions=()) :
+      self.dataset = dataset
+      self.name = self._name = name
+      self.datatype = datatype
+      self.dtype = np.dtype('S1' if datatype == 'c' else datatype)
+      self.dimensions = tuple(dimensions)
+      self.attributes = OrderedDict()
+      self.storage = {}
+
+   @property
+   def shape(self) :
+      return tuple([len(self.dataset.dimensions[dimname]) for dimname in self.dimensions])
+
+   @property
+   def ndim(self) :
+      return len(self.dimensions)
+
+   @property
+   def size(self) :
+      return reduce(lambda x,y: x*y, self.shape, 1)
+
+   def ncattrs(self) :
+      return list(self.attributes)
+
+   def getncattr(self, name) :
+      return self.attributes[name]
+
+   def setncattr(self, name, value) :
+      self.attributes[name] = value
+
+#---------------------------------------------------------------------------------------------------
+class NetCDFWriter(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   The default output backend, which creates a netCDF4.Dataset from the CDLDataset description of
+   a CDL header. All of the dimensions, variables and attributes are defined in a single pass
+   before any data is written, so the netCDF library never has to move data to make room for a
+   growing header. Fill values are passed to createVariable, as required by netCDF4, as are any
+   compression and chunking options for netCDF-4 files. The dataset is left in the netCDF library's
+   default fill mode, which the parser relies on to fill in values missing from the data section.
+
+   Alternative backends need only implement the define method, returning an object that supports
+   the same subset of the netCDF4.Dataset interface as is used to write the data section.
+   """
+   def define(self, header, ncfile, file_format='NETCDF3_CLASSIC', in_memory=False, header_pad=0) :
+      """
+      Create the netCDF dataset described by header, a CDLDataset object, and return it ready for
+      data to be written to its variables.
+
+      :param header: CDLDataset object describing the dataset.
+      :param ncfile: Pathname of the netCDF file to create, or the dataset name if in_memory is set.
+      :param file_format: The netCDF file format to use.
+      :param in_memory: If true, create the dataset in memory rather than on disk.
+      :param header_pad: Number of bytes of free space to reserve in the header of netCDF-3 files.
+      :returns: A handle to a netCDF4.Dataset object.
+      """
+      with NETCDF_LOCK :
+         if in_memory :
+            # the memory buffer is never shrunk, so start with zero size in order that the
+            # serialized dataset is no larger than the equivalent file
+            ncdataset = nc4.Dataset(ncfile, 'w', format=file_format, memory=0)
+         else :
+            ncdataset = nc4.Dataset(ncfile, 'w', format=file_format)
+         for dim in header.dimensions.values() :
+            ncdataset.createDimension(dim.name, dim.size or None)
+         if header.attributes : ncdataset.setncatts(header.attributes)
+         for var in header.variables.values() :
+            attrs = OrderedDict(var.attributes)
+            fill_value = attrs.pop('_FillValue', None)
+            storage = dict(shuffle=False)
+            if file_format not in NC3_FILE_FORMATS : storage.update(var.storage)
+            ncvar = ncdataset.createVariable(var.name, var.datatype, dimensions=var.dimensions,
+               fill_value=fill_value, **storage)
+            if attrs : ncvar.setncatts(attrs)
+         if header_pad and file_format in NC3_FILE_FORMATS :
+            reserve_header_space(ncdataset, header_pad)
+            logging.getLogger('cdlparser').info("Reserved %d bytes of free space after the %d-byte "
+               "netCDF header" % (header_pad, header.header_size(file_format)))
+      return ncdataset
+
+   def update(self, header, ncfile, file_format='NETCDF3_CLASSIC') :
+      """
+      Open the existing netCDF file ncfile for writing, having checked that its format, dimensions,
+      variables and attributes match those described by header. Otherwise CDLContentError is raised.
+      This method is optional for alternative backends; without it the update option has no effect.
+
+      :param header: CDLDataset object describing the dataset.
+      :param ncfile: Pathname of the netCDF file to update.
+      :param file_format: The netCDF file format expected.
+      :returns: A handle to a netCDF4.Dataset object.
+      """
+      with NETCDF_LOCK :
+         ncdataset = nc4.Dataset(ncfile, 'a')
+         mismatch = header_mismatch(header, ncdataset, file_format)
+         if mismatch : ncdataset.close()
+      if mismatch :
+         raise CDLContentError("Existing netCDF file %s does not match the CDL header: %s" \
+            % (ncfile, mismatch))
+      return ncdataset
+
+#---------------------------------------------------------------------------------------------------
+def reserve_header_space(ncdataset, nbytes) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Reserve nbytes of free space at the end of the header of netCDF-3 dataset ncdataset, which must
+   not yet contain any data. This is done by the netCDF library's nc__enddef function if possible
+   (see netcdf_enddef). Otherwise a placeholder global attribute is added and then deleted: since
+   the netCDF library never moves the start of the data back when the header shrinks, the space
+   taken by the attribute is left free. The placeholder needs at least a few bytes for its name.
+   """
+   try :
+      enddef = netcdf_enddef(ncdataset)
+   except (OSError, AttributeError) as exc :
+      logging.getLogger('cdlparser').info("Reserving netCDF header space with a placeholder "
+         "attribute: %s" % exc)
+      overhead = nc3_attlist_size({HEADER_PAD_ATTNAME: u''}) - nc3_attlist_size({})
+      ncdataset.setncattr(HEADER_PAD_ATTNAME, u' ' * max(0, nbytes - overhead))
+      ncdataset.delncattr(HEADER_PAD_ATTNAME)
+      return
+   status = enddef(nbytes)
+   if status != 0 :
+      raise CDLContentError("Unable to reserve %d bytes of netCDF header space (error code %d)" \
+         % (nbytes, status))
+
+#---------------------------------------------------------------------------------------------------
+def netcdf_enddef(ncdataset) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return a function which takes netCDF-3 dataset ncdataset out of define mode, with a given number
+   of bytes of free space at the end of its header, and returns the netCDF status code. The netCDF4
+   module doesn't expose the nc__enddef function needed for this, so it is called via ctypes from
+   the netCDF library linked into the netCDF4 extension, using the private _grpid and _redef
+   members of the Dataset class. AttributeError or OSError is raised if any of these is missing.
+   """
+   if not (hasattr(ncdataset, '_grpid') and hasattr(ncdataset, '_redef')) :
+      raise AttributeError("netCDF4.Dataset has no _grpid or _redef member")
+   nc__enddef = ctypes.CDLL(nc4._netCDF4.__file__).nc__enddef
+   def enddef(nbytes) :
+      ncdataset._redef()
+      return nc__enddef(ctypes.c_int(ncdataset._grpid), ctypes.c_size_t(nbytes),
+         ctypes.c_size_t(4), ctypes.c_size_t(0), ctypes.c_size_t(4))
+   return enddef
+
+#---------------------------------------------------------------------------------------------------
+def header_mismatch(header, ncdataset, file_format) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return a description of the first difference found between the file format, dimensions,
+   variables and attributes of netCDF dataset ncdataset and those described by CDLDataset header,
+   or None if there are no differences. The current length of the unlimited dimension is ignored.
+   """
+   fmt = file_format.replace('NETCDF3_64BIT_OFFSET', 'NETCDF3_64BIT')
+   if ncdataset.file_format.replace('NETCDF3_64BIT_OFFSET', 'NETCDF3_64BIT') != fmt :
+      return "file format is %s" % ncdataset.file_format
+   if list(ncdataset.dimensions) != list(header.dimensions) :
+      return "dimensions are %s" % ', '.join(ncdataset.dimensions)
+   for dim in header.dimensions.values() :
+      ncdim = ncdataset.dimensions[dim.name]
+      if ncdim.isunlimited() != dim.isunlimited() or \
+         (not dim.isunlimited() and len(ncdim) != len(dim)) :
+         return "dimension %s differs" % dim.name
+   if not attributes_match(header, ncdataset) :
+      return "global attributes differ"
+   if list(ncdataset.variables) != list(header.variables) :
+      return "variables are %s" % ', '.join(ncdataset.variables)
+   for var in header.variables.values() :
+      ncvar = ncdataset.variables[var.name]
+      if ncvar.dtype != var.dtype or ncvar.dimensions != var.dimensions :
+         return "variable %s differs" % var.name
+      if not attributes_match(var, ncvar) :
+         return "attributes of variable %s differ" % var.name
+      if var.storage and file_format not in NC3_FILE_FORMATS and not storage_matches(var, ncvar) :
+         return "storage of variable %s differs" % var.name
+   return None
+
+#---------------------------------------------------------------------------------------------------
+def storage_matches(var, ncvar) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return true if netCDF variable ncvar is stored with the compression and chunking options given
+   for CDLVariable var.
+   """
+   filters = ncvar.filters() or {}
+   for key in ('zlib', 'complevel', 'shuffle') :
+      if key in var.storage and filters.get(key) != var.storage[key] : return False
+   chunking = ncvar.chunking()
+   if var.storage.get('contiguous') and chunking != 'contiguous' : return False
+   if 'chunksizes' in var.storage and chunking != list(var.storage['chunksizes']) : return False
+   return True
+
+#---------------------------------------------------------------------------------------------------
+def attributes_match(obj1, obj2) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return true if objects obj1 and obj2, each a dataset or variable, have the same attributes, in
+   the same order, with values of the same type. Any _FillValue attribute is taken to come first,
+   since it is defined along with the variable.
+   """
+   names = sorted(obj1.ncattrs(), key=lambda name: name != '_FillValue')
+   if names != sorted(obj2.ncattrs(), key=lambda name: name != '_FillValue') : return False
+   for name in names :
+      val1, val2 = obj1.getncattr(name), obj2.getncattr(name)
+      if isinstance(val1, six.string_types) or isinstance(val2, six.string_types) :
+         if val1 != val2 : return False
+         continue
+      val1, val2 = np.atleast_1d(val1), np.atleast_1d(val2)
+      if val1.dtype != val2.dtype or val1.tobytes() != val2.tobytes() : return False
+   return True
+
+#---------------------------------------------------------------------------------------------------
+class ParseStats(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Counters and timings collected during a single parsing operation by a parser created with the
+   collect_stats option. The attributes are as follows:
+
+   * bytes_read - the number of bytes of CDL input read, as UTF-8 if passed in as unicode text
+   * token_counts - a dictionary of the number of tokens lexed, keyed by token type
+   * total_secs - the total time taken by the parsing operation
+   * lex_secs - the time spent lexing tokens, including converting runs of numeric constants
+   * netcdf_define_secs - the time spent defining the netCDF dataset's dimensions, variables and
+     attributes, i.e. in the writer's define method
+   * netcdf_write_secs - the time spent writing data values to netCDF variables, including the
+     final close of the dataset
+   * values_written - a dictionary of the number of data values parsed, keyed by variable name
+   * values_padded - a dictionary of the number of fill values used to pad data arrays that were
+     too short, keyed by variable name
+
+   The time spent in grammar actions, excluding netCDF calls, is given by the grammar_secs property.
+   """
+   def __init__(self) :
+      self.bytes_read = 0
+      self.token_counts = {}
+      self.total_secs = 0.0
+      self.lex_secs = 0.0
+      self.netcdf_define_secs = 0.0
+      self.netcdf_write_secs = 0.0
+      self.values_written = OrderedDict()
+      self.values_padded = OrderedDict()
+
+   @property
+   def grammar_secs(self) :
+      return self.total_secs - self.lex_secs - self.netcdf_define_secs - self.netcdf_write_secs
+
+   @property
+   def ntokens(self) :
+      return sum(self.token_counts.values())
+
+   def count_tokens(self, tokenfunc) :
+      """Return a wrapper for lexer token function tokenfunc which counts and times the tokens."""
+      counts = self.token_counts
+      def token() :
+         start = time.time()
+         tok = tokenfunc()
+         self.lex_secs += time.time() - start
+         if tok is not None : counts[tok.type] = counts.get(tok.type, 0) + 1
+         return tok
+      return token
+
+   def as_dict(self) :
+      """Return the statistics, including the derived quantities, as a dictionary."""
+      stats = dict(self.__dict__)
+      stats.update(grammar_secs=self.grammar_secs, ntokens=self.ntokens)
+      return stats
+
+#---------------------------------------------------------------------------------------------------
+class UpdateReport(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A summary of the changes made to an existing netCDF file by a parser created with the update
+   option. The attributes are as follows:
+
+   * ncfile - the pathname of the netCDF file
+   * rebuilt - true if the file had to be rebuilt from scratch rather than updated in place
+   * reason - the reason for rebuilding the file, or None
+   * variables - a dictionary, keyed by variable name, of the number of data blocks compared, the
+     number of those rewritten and the number of bytes rewritten for each variable
+
+   The names of the variables whose data changed, and of those whose data didn't, are given by the
+   changed and unchanged properties. These are empty if the file was rebuilt.
+   """
+   def __init__(self, ncfile) :
+      self.ncfile = ncfile
+      self.rebuilt = False
+      self.reason = None
+      self.variables = OrderedDict()
+
+   @property
+   def changed(self) :
+      return [name for name, counts in self.variables.items() if counts[1]]
+
+   @property
+   def unchanged(self) :
+      return [name for name, counts in self.variables.items() if not counts[1]]
+
+   @property
+   def blocks_compared(self) :
+      return sum([counts[0] for counts in self.variables.values()])
+
+   @property
+   def blocks_written(self) :
+      return sum([counts[1] for counts in self.variables.values()])
+
+   @property
+   def bytes_written(self) :
+      return sum([counts[2] for counts in self.variables.values()])
+
+   def count_block(self, varname, nbytes=0) :
+      """Count a block of data for variable varname, and the number of bytes rewritten if any."""
+      counts = self.variables.setdefault(varname, [0, 0, 0])
+      counts[0] += 1
+      if nbytes :
+         counts[1] += 1
+         counts[2] += nbytes
+
+   def as_dict(self) :
+      """Return the report, including the derived quantities, as a dictionary."""
+      report = dict(self.__dict__)
+      report.update(changed=self.changed, unchanged=self.unchanged,
+         blocks_compared=self.blocks_compared, blocks_written=self.blocks_written,
+         bytes_written=self.bytes_written)
+      return report
+
+#---------------------------------------------------------------------------------------------------
+class VariableUpdater(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A stand-in for a variable in a netCDF file being updated in place. Data assigned to the variable
+   is compared with that already in the file, a block of about UPDATE_BLOCK_SIZE bytes at a time,
+   and only those blocks which differ are written. The blocks are compared as raw bytes, which is
+   equivalent to comparing their hashes but doesn't need both sides to be hashed. All other
+   attributes are those of the wrapped netCDF4.Variable object.
+   """
+   def __init__(self, var, report) :
+      self.var = var
+      self.report = report
+
+   def __getattr__(self, name) :
+      return getattr(self.var, name)
+
+   def __setitem__(self, index, values) :
+      # the parser only ever assigns whole variables or runs of records
+      self.update(index.start or 0, np.asarray(values, dtype=self.var.dtype))
+
+   def assignValue(self, value) :
+      value = np.asarray(value, dtype=self.var.dtype)
+      if self.read_raw(Ellipsis).tobytes() == value.tobytes() :
+         self.report.count_block(self.var.name)
+      else :
+         self.var.assignValue(value)
+         self.report.count_block(self.var.name, value.nbytes)
+
+   def update(self, start, values) :
+      """Write those blocks of array values, starting at index start, which differ from the file."""
+      var = self.var
+      nexisting = len(var) if var.ndim else 0
+      # packed variables are scaled when written, so can't be compared with raw data in the file
+      packed = 'scale_factor' in var.ncattrs() or 'add_offset' in var.ncattrs()
+      step = max(1, UPDATE_BLOCK_SIZE // max(1, values[:1].nbytes))
+      for i in range(0, len(values), step) :
+         block = values[i:i+step]
+         lo, hi = start + i, start + i + len(block)
+         if not packed and hi <= nexisting and self.read_raw(slice(lo, hi)).tobytes() == \
+            np.ascontiguousarray(block).tobytes() :
+            self.report.count_block(var.name)
+         else :
+            var[lo:hi] = block
+            self.report.count_block(var.name, block.nbytes)
+
+   def fill(self) :
+      """Set the whole variable to its fill value, as for a variable not written at all."""
+      var = self.var
+      if '_FillValue' in var.ncattrs() :
+         fv = var._FillValue
+      else :
+         fv = nc4.default_fillvals[var.dtype.str[1:]]
+      if var.ndim == 0 :
+         self.assignValue(fv)
+         return
+      shape = var.shape
+      rowbytes = var.dtype.itemsize * reduce(lambda x,y: x*y, shape[1:], 1)
+      step = max(1, UPDATE_BLOCK_SIZE // rowbytes)
+      for lo in range(0, shape[0], step) :
+         hi = min(lo + step, shape[0])
+         self.update(lo, np.full((hi-lo,) + shape[1:], fv, dtype=var.dtype))
+      if not shape[0] : self.report.count_block(var.name)
+
+   def read_raw(self, index) :
+      """Read the data at index as stored in the file, i.e. without masking, scaling, etc."""
+      var = self.var
+      var.set_auto_maskandscale(False)
+      var.set_auto_chartostring(False)
+      try :
+         return np.ascontiguousarray(var[index])
+      finally :
+         var.set_auto_maskandscale(True)
+         var.set_auto_chartostring(True)
+
+#---------------------------------------------------------------------------------------------------
+class CDLDumper(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Writes the contents of a netCDF dataset as CDL text which CDL3Parser converts back to the same
+   dataset, in the manner of the ncdump command. Data values are formatted by numpy a block of
+   about block_size bytes at a time, so memory use doesn't grow with the size of the variables.
+   Floating-point values are written in the shortest form that converts back to the same value,
+   and values equal to a variable's fill value are written as '_'. Only the netCDF-3 data types
+   can be represented in CDL3, so a CDLContentError is raised for any other data types.
+   """
+   def __init__(self, block_size=DUMP_BLOCK_SIZE, values_per_line=DUMP_LINE_VALUES,
+      header_only=False) :
+      self.block_size = block_size
+      self.values_per_line = values_per_line
+      self.header_only = header_only
+
+   def dump(self, ncdataset, stream, name=None) :
+      """
+      Write the CDL for ncdataset, a netCDF4.Dataset or the pathname of a netCDF file, to stream, a
+      file-like object opened in text mode. By default the dataset name is taken from the filename.
+      """
+      if isinstance(ncdataset, six.string_types) :
+         with nc4.Dataset(ncdataset) as dataset :
+            return self.dump(dataset, stream, name)
+      if name is None :
+         try :
+            name = os.path.splitext(os.path.basename(ncdataset.filepath()))[0]
+         except ValueError :
+            name = 'dataset'
+      stream.write(u"netcdf %s {\n" % escapify(name))
+      self.write_header(ncdataset, stream)
+      if not self.header_only :
+         stream.write(u"data:\n")
+         for var in ncdataset.variables.values() :
+            self.write_data(var, stream)
+      stream.write(u"}\n")
+
+   def dumps(self, ncdataset, name=None) :
+      """Return the CDL for ncdataset, a netCDF4.Dataset or the pathname of a netCDF file."""
+      stream = io.StringIO()
+      self.dump(ncdataset, stream, name)
+      return stream.getvalue()
+
+   def write_header(self, ncdataset, stream) :
+      """Write the dimensions and variables sections of the CDL for ncdataset to stream."""
+      if ncdataset.dimensions :
+         stream.write(u"dimensions:\n")
+      for dim in ncdataset.dimensions.values() :
+         if dim.isunlimited() :
+            stream.write(u"\t%s = UNLIMITED ; // (%d currently)\n" % (cdl_name(dim.name), len(dim)))
+         else :
+            stream.write(u"\t%s = %d ;\n" % (cdl_name(dim.name), len(dim)))
+      if ncdataset.variables :
+         stream.write(u"variables:\n")
+      for var in ncdataset.variables.values() :
+         dims = u"(%s)" % u", ".join(map(cdl_name, var.dimensions)) if var.dimensions else u""
+         stream.write(u"\t%s %s%s ;\n" % (cdl_type_name(var.dtype), cdl_name(var.name), dims))
+         self.write_attributes(var, cdl_name(var.name), stream)
+      if ncdataset.ncattrs() :
+         stream.write(u"\n// global attributes:\n")
+         self.write_attributes(ncdataset, u"", stream)
+
+   def write_attributes(self, obj, prefix, stream) :
+      """Write the attributes of obj, a dataset or variable, prefixing their names with prefix."""
+      for attname in obj.ncattrs() :
+         value = obj.getncattr(attname)
+         if isinstance(value, (six.string_types, bytes)) :
+            if isinstance(value, bytes) : value = value.decode('utf-8')
+            text = u'"%s"' % escape_string(value)
+         else :
+            value = np.atleast_1d(value)
+            suffix = CDL_TYPE_SUFFIXES[cdl_type_name(value.dtype)]
+            text = u", ".join(format_numbers(value, suffix=suffix).tolist())
+         stream.write(u"\t\t%s:%s = %s ;\n" % (prefix, cdl_name(attname), text))
+
+   def write_data(self, var, stream) :
+      """Write the data values of netCDF variable var to stream, a block at a time."""
+      if var.ndim and not var.shape[0] : return
+      is_charvar = var.dtype.kind == 'S'
+      if '_FillValue' in var.ncattrs() :
+         fill_value = var._FillValue
+      else :
+         fill_value = get_default_fill_value(var.dtype.char)
+      stream.write(u"\n %s = " % cdl_name(var.name))
+      var.set_auto_maskandscale(False)
+      var.set_auto_chartostring(False)
+      try :
+         if var.ndim == 0 :
+            blocks = [np.atleast_1d(var.getValue())]
+         elif is_charvar and var.ndim == 1 :
+            blocks = [var[:]]
+         else :
+            rowbytes = var.dtype.itemsize * reduce(lambda x,y: x*y, var.shape[1:], 1)
+            step = max(1, self.block_size // max(1, rowbytes))
+            blocks = (var[i:i+step] for i in range(0, var.shape[0], step))
+         sep = u""
+         for block in blocks :
+            if is_charvar :
+               texts = char_array_to_strings(block)
+               per_line = 1
+            else :
+               texts = format_numbers(block.ravel(), fill_value).tolist()
+               per_line = self.values_per_line
+            lines = [u", ".join(texts[i:i+per_line]) for i in range(0, len(texts), per_line)]
+            stream.write(sep + u",\n    ".join(lines))
+            sep = u",\n    "
+      finally :
+         var.set_auto_maskandscale(True)
+         var.set_auto_chartostring(True)
+      stream.write(u" ;\n")
+
+#---------------------------------------------------------------------------------------------------
+class WriterThread(threading.Thread) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A thread which performs the netCDF writes queued by a parser created with the write_queue_size
+   option, so that parsing overlaps with netCDF I/O. Once started, the thread has sole use of the
+   netCDF library until the finish or stop method returns, since libnetcdf is not thread-safe. The
+   thread also tracks the length of the record dimension on behalf of the parser. The first error
+   raised by a write is reported to the parser, as a CDLContentError, on its next call to submit or
+   finish; any later writes are skipped.
+   """
+   def __init__(self, maxsize) :
+      super(WriterThread, self).__init__(name='cdlparser-writer')
+      self.daemon = True
+      self.queue = queue.Queue(maxsize)
+      self.error = None
+      self.nrecs = 0
+
+   def run(self) :
+      while True :
+         item = self.queue.get()
+         if item is None : break
+         if self.error is None :
+            func, args = item
+            try :
+               with NETCDF_LOCK : func(*args)
+            except Exception as exc :
+               self.error = exc
+
+   def submit(self, func, *args) :
+      """Queue a call to func with arguments args, waiting for space in the queue if need be."""
+      self.check()
+      self.queue.put((func, args))
+
+   def check(self) :
+      """Raise a CDLContentError if a queued write has failed."""
+      if self.error is not None :
+         raise CDLContentError("Error writing netCDF data in writer thread: %s" % self.error)
+
+   def finish(self) :
+      """Wait for the queued writes to complete, then check that they succeeded."""
+      self.stop()
+      self.check()
+
+   def stop(self) :
+      """Wait for the queued writes to complete and the thread to exit."""
+      if self.is_alive() :
+         self.queue.put(None)
+         self.join()
+
+#---------------------------------------------------------------------------------------------------
+class PipelinedVariable(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A stand-in for a netCDF variable whose data is written by a WriterThread. The variable's
+   metadata is taken from the CDLVariable describing it in the CDL header, with the length of the
+   record dimension as tracked by the thread, so the parser makes no netCDF calls of its own. Data
+   assigned to the variable is copied and queued for writing, since the parser may reuse its
+   buffers as soon as the assignment returns.
+   """
+   def __init__(self, var, header_var, thread) :
+      self.var = var
+      self.header_var = header_var
+      self.thread = thread
+      # queued writes are made by the thread with NETCDF_LOCK held, so need no lock of their own
+      self.lock = threading.Lock()
+      self._name = self.name = header_var.name
+      self.dtype = header_var.dtype
+      self.dimensions = header_var.dimensions
+      self.ndim = header_var.ndim
+
+   def __getattr__(self, name) :
+      # attributes such as _FillValue are looked up in the header description
+      try :
+         return self.header_var.attributes[name]
+      except KeyError :
+         raise AttributeError(name)
+
+   @property
+   def shape(self) :
+      dims = self.header_var.dataset.dimensions
+      return tuple([self.thread.nrecs if dims[dimname].isunlimited() else len(dims[dimname])
+         for dimname in self.dimensions])
+
+   @property
+   def size(self) :
+      return reduce(lambda x,y: x*y, self.shape, 1)
+
+   def ncattrs(self) :
+      return self.header_var.ncattrs()
+
+   def __setitem__(self, index, values) :
+      if self.ndim and self.header_var.dataset.dimensions[self.dimensions[0]].isunlimited() :
+         # records are written as slices, and parts of records by their index
+         first = index[0] if isinstance(index, tuple) else index
+         end = (first.start or 0) + len(values) if isinstance(first, slice) else first + 1
+         self.thread.nrecs = max(self.thread.nrecs, end)
+      self.thread.submit(self.var.__setitem__, index, np.array(values, dtype=self.dtype))
+
+   def assignValue(self, value) :
+      self.thread.submit(self.var.assignValue, np.array(value, dtype=self.dtype))
+
+#---------------------------------------------------------------------------------------------------
+class ConversionCache(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A content-addressed store of the netCDF files generated from CDL input, for use via the cache
+   option of CDLParser. Each file is keyed by a SHA-256 hash of the CDL text, encoded as UTF-8, and
+   of the parser options that affect the netCDF output. The cache directory may be shared by any
+   number of threads and processes.
+
+   The cache is bounded in size: once the total size of the cached files exceeds max_bytes, or the
+   number of files exceeds max_entries, the least recently used files are evicted. Counts of cache
+   hits, misses, stored files and evictions are kept for this cache object, and are returned,
+   along with the current size of the cache, by the stats method.
+   """
+   def __init__(self, cachedir=None, max_bytes=DEFAULT_CACHE_BYTES, max_entries=None,
+      hardlink=False) :
+      """
+      :param cachedir: The directory in which to store the netCDF files. This is created if need
+         be. [default: CONVERSION_CACHE_DIR]
+      :param max_bytes: The maximum total size in bytes of the cached files. [default: 1 GiB]
+      :param max_entries: The maximum number of cached files, or None for no limit. [default: None]
+      :param hardlink: If set to true, cache hits are hard-linked to the output file, where
+         possible, rather than copied. The output file then shares its storage with the cache
+         entry, so the parser opens it read-only and it must not be modified. [default: False]
+      """
+      self.cachedir = cachedir or CONVERSION_CACHE_DIR
+      self.max_bytes = max_bytes
+      self.max_entries = max_entries
+      self.hardlink = hardlink
+      self.hits = 0
+      self.misses = 0
+      self.stores = 0
+      self.evictions = 0
+      self.lock = threading.Lock()
+      if not os.path.isdir(self.cachedir) : os.makedirs(self.cachedir)
+
+   def make_key(self, options, text=None, path=None) :
+      """
+      Return the cache key for CDL input given either as a string of text or as the pathname of a
+      file, converted using the parser options in dictionary options.
+      """
+      sha = hashlib.sha256(encode_text(repr(sorted(options.items()))))
+      if path is None :
+         sha.update(b'\0' + encode_text(text))
+      else :
+         sha.update(b'\0')
+         with open(path, 'rb') as f :
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b'') :
+               sha.update(block)
+      return sha.hexdigest()
+
+   def entry_path(self, key) :
+      """Return the pathname of the cached netCDF file for key."""
+      return os.path.join(self.cachedir, key + '.nc')
+
+   def fetch(self, key, ncfile) :
+      """
+      Copy, or hard-link, the cached netCDF file for key to ncfile. Returns true if the file was
+      found in the cache, false otherwise.
+      """
+      path = self.entry_path(key)
+      try :
+         if not os.path.exists(path) : raise OSError("No cache entry for key %s" % key)
+         if os.path.exists(ncfile) : os.remove(ncfile)
+         try :
+            if not self.hardlink : raise OSError
+            os.link(path, ncfile)
+         except OSError :
+            shutil.copyfile(path, ncfile)
+         self.touch(path)
+      except (IOError, OSError) :
+         self.count('misses')
+         return False
+      self.count('hits')
+      return True
+
+   def fetch_bytes(self, key) :
+      """Return the contents of the cached netCDF file for key, or None if there isn't one."""
+      path = self.entry_path(key)
+      try :
+         with open(path, 'rb') as f :
+            data = f.read()
+         self.touch(path)
+      except (IOError, OSError) :
+         self.count('misses')
+         return None
+      self.count('hits')
+      return data
+
+   def store(self, key, ncfile=None, data=None) :
+      """
+      Add a netCDF file to the cache under key, either by copying the file ncfile or by writing the
+      bytes data, and then evict files as needed to keep the cache within its bounds.
+      """
+      path = self.entry_path(key)
+      # write to a private file first so that other processes never see a partially written entry
+      tmpfile = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+      try :
+         if data is None :
+            shutil.copyfile(ncfile, tmpfile)
+         else :
+            with open(tmpfile, 'wb') as f :
+               f.write(data)
+         os.rename(tmpfile, path)
+      except (IOError, OSError) :
+         if os.path.exists(tmpfile) : os.remove(tmpfile)
+         return
+      self.count('stores')
+      self.evict()
+
+   def touch(self, path) :
+      """Mark a cache entry as recently used by updating its modification time."""
+      os.utime(path, None)
+
+   def entries(self) :
+      """Return a list of (modification time, size, pathname) tuples, one per cached file."""
+      entries = []
+      for name in os.listdir(self.cachedir) :
+         if not name.endswith('.nc') : continue
+         path = os.path.join(self.cachedir, name)
+         try :
+            st = os.stat(path)
+         except OSError :
+            continue
+         entries.append((st.st_mtime, st.st_size, path))
+      return entries
+
+   def evict(self) :
+      """Remove the least recently used files until the cache is within its bounds."""
+      entries = sorted(self.entries())
+      nbytes = sum(entry[1] for entry in entries)
+      while entries and (nbytes > self.max_bytes or \
+         (self.max_entries is not None and len(entries) > self.max_entries)) :
+         mtime, size, path = entries.pop(0)
+         try :
+            os.remove(path)
+         except OSError :
+            continue
+         nbytes -= size
+         self.count('evictions')
+
+   def clear(self) :
+      """Remove all files from the cache."""
+      for mtime, size, path in self.entries() :
+         try :
+            os.remove(path)
+         except OSError :
+            pass
+
+   def count(self, counter) :
+      """Increment the named counter."""
+      with self.lock :
+         setattr(self, counter, getattr(self, counter) + 1)
+
+   def stats(self) :
+      """Return a dictionary of the cache counters and of the current number and size of entries."""
+      entries = self.entries()
+      return {
+         'hits': self.hits,
+         'misses': self.misses,
+         'stores': self.stores,
+         'evictions': self.evictions,
+         'entries': len(entries),
+         'nbytes': sum(entry[1] for entry in entries),
+      }
+
+#---------------------------------------------------------------------------------------------------
+class StreamLexer(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Wraps a PLY lexer so that its input is read incrementally from a text stream instead of being
+   supplied as a single string. The wrapped lexer only ever sees a buffer holding the unconsumed
+   tail of the input read so far. Before accepting a token the buffer must extend at least
+   STREAM_LOOKAHEAD characters beyond it; if not, or if the lexer ran out of input or flagged a
+   possibly truncated string, the lexer is rewound to the start of the token, another chunk is
+   appended to the buffer, and the token is lexed again. Runs of numeric constants and of strings
+   are exempt from the lookahead check since they always end at a delimiter and can be split safely.
+   """
+   def __init__(self, lexer, stream, chunk_size=DEFAULT_CHUNK_SIZE, stats=None) :
+      self.lexer = lexer
+      self.stream = stream
+      self.chunk_size = chunk_size
+      self.stats = stats
+      self.eof = False
+      lexer.input('')
+      lexer.pending_input = True
+
+   def token(self) :
+      """Return the next token from the input stream, or None at the end of the stream."""
+      lexer = self.lexer
+      while True :
+         lexpos, lineno, state = lexer.lexpos, lexer.lineno, lexer.current_state()
+         lexer.needs_input = False
+         tok = lexer.token()
+         if self.eof or lexer.data_skipped : break
+         if tok is None or lexer.needs_input :
+            pass
+         elif tok.type not in RUN_TOKENS and lexer.lexpos + STREAM_LOOKAHEAD > lexer.lexlen :
+            pass
+         else :
+            break
+         # token may be incomplete: rewind and read more input
+         lexer.lexpos, lexer.lineno = lexpos, lineno
+         lexer.begin(state)
+         self.fill()
+      if tok : tok.lexpos += lexer.lexoffset
+      return tok
+
+   def fill(self) :
+      """Discard consumed input from the lexer buffer and append the next chunk from the stream."""
+      lexer = self.lexer
+      tail = lexer.lexdata[lexer.lexpos:]
+      # read at least as much again as is left over so that a long token needs few retries
+      chunk = self.read(max(self.chunk_size, len(tail)))
+      if not chunk :
+         self.eof = True
+         lexer.pending_input = False
+      lexer.lexoffset += lexer.lexpos
+      lexer.input(tail + chunk)
+
+   def read(self, size) :
+      """Return the next size characters, or fewer at the end of the input, from the stream."""
+      chunk = self.stream.read(size)
+      if self.stats : self.stats.bytes_read += len(encode_text(chunk))
+      return chunk
+
+#---------------------------------------------------------------------------------------------------
+class MappedLexer(StreamLexer) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A StreamLexer whose input is read from a memory-mapped CDL file. The wrapped lexer is fed the
+   mapped bytes decoded as latin-1, i.e. one character per byte, so that no UTF-8 decoding is done
+   for the ASCII structure of the file, and the lexer's UTF8 pattern matches each raw byte of a
+   non-ASCII name. The values of identifier and string tokens containing non-ASCII characters are
+   then decoded as UTF-8. In the data section, each run of plain numeric constants is found by
+   matching against the mapped file itself and converted straight from its bytes, so the run is
+   never copied into the lexer's buffer. Other runs are left to the wrapped lexer. The
+   bytes read into the lexer's buffer and the bytes of the runs skipped over are counted as read.
+   """
+   def __init__(self, lexer, mapped, chunk_size=DEFAULT_CHUNK_SIZE, stats=None) :
+      super(MappedLexer, self).__init__(lexer, None, chunk_size, stats)
+      self.mapped = mapped
+
+   def token(self) :
+      """Return the next token from the mapped file, or None at the end of the file."""
+      lexer = self.lexer
+      if lexer.current_state() == 'data' and not lexer.data_skipped :
+         tok = self.numeric_run()
+         if tok : return tok
+      tok = super(MappedLexer, self).token()
+      if tok and tok.type in MAPPED_TEXT_TOKENS and NON_ASCII_RE.search(tok.value) :
+         tok.value = decode_mapped_text(tok.value)
+      elif tok and tok.type == 'STRING_RUN' and NON_ASCII_RE.search(u''.join(tok.value)) :
+         tok.value = [decode_mapped_text(x) for x in tok.value]
+      return tok
+
+   def numeric_run(self) :
+      """
+      If a run of plain numeric constants starts at the current position then return it as a
+      NUMERIC_RUN token and move past it, otherwise return None without consuming any input.
+      """
+      lexer = self.lexer
+      pos = lexer.lexoffset + lexer.lexpos
+      m = MAPPED_RUN_RE.match(self.mapped, pos)
+      if not m : return None
+      data = self.mapped[m.start(1):m.end(1)]
+      values = parse_numeric_bytes(data)
+      if values is None : return None
+      tok = LexToken()
+      tok.type = 'NUMERIC_RUN'
+      tok.value = values
+      tok.lineno = lexer.lineno + self.mapped[pos:m.start(1)].count(b'\n')
+      tok.lexpos = m.start(1)
+      lexer.lineno = tok.lineno + data.count(b'\n')
+      self.seek(m.end(1))
+      return tok
+
+   def seek(self, offset) :
+      """Move the wrapped lexer to byte offset offset in the mapped file."""
+      lexer = self.lexer
+      if offset <= lexer.lexoffset + lexer.lexlen :
+         lexer.lexpos = offset - lexer.lexoffset
+      else :
+         if self.stats : self.stats.bytes_read += offset - (lexer.lexoffset + lexer.lexlen)
+         lexer.lexoffset = offset
+         lexer.input('')
+
+   def read(self, size) :
+      """Return the next size bytes following the lexer's buffer, decoded as latin-1."""
+      start = self.lexer.lexoffset + self.lexer.lexlen
+      chunk = self.mapped[start:start+size]
+      if self.stats : self.stats.bytes_read += len(chunk)
+      return chunk.decode('latin-1')
+
+#---------------------------------------------------------------------------------------------------
+class FragmentLexer(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Wraps a lexer, or a StreamLexer, so that the token stream starts with a FRAGMENT token. This
+   tells the parser to expect a CDL data fragment, as parsed by the append methods of CDLParser,
+   rather than a complete dataset description.
+   """
+   def __init__(self, lexer) :
+      self.lexer = lexer
+      self.started = False
+
+   def token(self) :
+      """Return the FRAGMENT token on the first call, and then the tokens from the wrapped lexer."""
+      if self.started : return self.lexer.token()
+      self.started = True
+      tok = LexToken()
+      tok.type = 'FRAGMENT'
+      tok.value = None
+      tok.lineno = 1
+      tok.lexpos = 0
+      return tok
+
+#---------------------------------------------------------------------------------------------------
+class FastLexer(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   An alternative to the PLY lexer which produces the same token stream using the same token rules,
+   actions, states, ignored characters and literals. The PLY lexer tries a single alternation of
+   all of the rules at each input position. The FastLexer instead looks up the next character in a
+   dispatch table, built from the lexer_first_chars attribute of the parser class, and tries an
+   anchored regex which combines just the rules that can start with that character, in their
+   original order. Other characters, such as the lead byte of a UTF-8 identifier, try all rules.
+   The FastLexer supports those parts of the PLY lexer interface used by the parser, by
+   StreamLexer and by the token rules.
+   """
+   def __init__(self, lexer, module) :
+      first_chars = getattr(module, 'lexer_first_chars', {})
+      self.lexreflags = lexer.lexreflags
+      self.lexliterals = lexer.lexliterals
+      self.lexstateignore = lexer.lexstateignore
+      self.lexmodule = module
+      self.rules = {}
+      self.errorfuncs = {}
+      self.tables = {}
+      for state, ritems in lexer.lexstatere.items() :
+         # recover the rules for this state, in order, from PLY's master regexes
+         rules = []
+         for cre, findex in ritems :
+            for name, index in sorted(cre.groupindex.items(), key=lambda x: x[1]) :
+               func, toktype = findex[index]
+               self.rules[name] = (func and getattr(module, func.__name__), toktype)
+               rules.append((name, toktype))
+         cache = {}
+         dispatch = {}
+         for i in range(128) :
+            c = chr(i)
+            names = tuple([name for name, toktype in rules if c in first_chars.get(toktype, c)])
+            if names not in cache : cache[names] = self.combine_rules(names)
+            dispatch[c] = cache[names]
+         self.tables[state] = (dispatch, self.combine_rules([name for name, toktype in rules]))
+      for state, ef in lexer.lexstateerrorf.items() :
+         self.errorfuncs[state] = getattr(module, ef.__name__)
+      self.lexdata = None
+      self.lexpos = 0
+      self.lexlen = 0
+      self.lineno = 1
+      self.begin('INITIAL')
+
+   def combine_rules(self, names) :
+      """Return a compiled regex matching any of the named token rules, or None for no names."""
+      if not names : return None
+      patterns = []
+      for name in names :
+         rule = getattr(self.lexmodule, name)
+         if not isinstance(rule, six.string_types) : rule = getattr(rule, 'regex', rule.__doc__)
+         patterns.append('(?P<%s>%s)' % (name, rule))
+      return re.compile('|'.join(patterns), self.lexreflags)
+
+   def clone(self, module) :
+      """Return a copy of this lexer whose token functions are bound to object module instead."""
+      newlexer = copy.copy(self)
+      newlexer.rules = dict((name, (func and getattr(module, func.__name__), toktype)) \
+         for name, (func, toktype) in self.rules.items())
+      newlexer.errorfuncs = dict((state, getattr(module, ef.__name__)) \
+         for state, ef in self.errorfuncs.items())
+      newlexer.lexmodule = module
+      newlexer.begin(self.lexstate)
+      return newlexer
+
+   def input(self, s) :
+      """Set the input string and reset the position to the start of it."""
+      self.lexdata = s
+      self.lexpos = 0
+      self.lexlen = len(s)
+
+   def begin(self, state) :
+      """Switch to lexer state state."""
+      self.lexstate = state
+      self.dispatch, self.default = self.tables[state]
+      self.lexignore = self.lexstateignore.get(state, '')
+      self.lexerrorf = self.errorfuncs.get(state)
+
+   def current_state(self) :
+      """Return the name of the current lexer state."""
+      return self.lexstate
+
+   def skip(self, n) :
+      """Skip n characters of input."""
+      self.lexpos += n
+
+   def token(self) :
+      """Return the next token, or None at the end of the input."""
+      lexdata, lexpos, lexlen = self.lexdata, self.lexpos, self.lexlen
+      lexignore, dispatch, default = self.lexignore, self.dispatch, self.default
+      rules = self.rules
+      while lexpos < lexlen :
+         c = lexdata[lexpos]
+         if c in lexignore :
+            lexpos += 1
+            continue
+         regex = dispatch.get(c, default)
+         m = regex.match(lexdata, lexpos) if regex else None
+         if m :
+            func, toktype = rules[m.lastgroup]
+            tok = LexToken()
+            tok.value = m.group()
+            tok.lineno = self.lineno
+            tok.lexpos = lexpos
+            tok.type = toktype
+            lexpos = m.end()
+            if func is None :
+               # string rules without a token type are ignored
+               if toktype is None : continue
+               self.lexpos = lexpos
+               return tok
+            tok.lexer = self
+            self.lexmatch = m
+            self.lexpos = lexpos
+            newtok = func(tok)
+            if newtok : return newtok
+            # the rule may have changed the position, the state or even the input
+            lexdata, lexpos, lexlen = self.lexdata, self.lexpos, self.lexlen
+            lexignore, dispatch, default = self.lexignore, self.dispatch, self.default
+            continue
+         if c in self.lexliterals :
+            tok = LexToken()
+            tok.value = tok.type = c
+            tok.lineno = self.lineno
+            tok.lexpos = lexpos
+            self.lexpos = lexpos + 1
+            return tok
+         if not self.lexerrorf :
+            self.lexpos = lexpos
+            raise lex.LexError("Illegal character '%s' at index %d" % (c, lexpos), lexdata[lexpos:])
+         tok = LexToken()
+         tok.value = lexdata[lexpos:]
+         tok.lineno = self.lineno
+         tok.type = 'error'
+         tok.lexer = self
+         tok.lexpos = lexpos
+         self.lexpos = lexpos
+         newtok = self.lexerrorf(tok)
+         if lexpos == self.lexpos :
+            raise lex.LexError("Scanning error. Illegal character '%s'" % c, lexdata[lexpos:])
+         lexdata, lexpos, lexlen = self.lexdata, self.lexpos, self.lexlen
+         lexignore, dispatch, default = self.lexignore, self.dispatch, self.default
+         if newtok : return newtok
+      self.lexpos = lexpos + 1
+      return None
+
+   def __iter__(self) :
+      return self
+
+   def __next__(self) :
+      tok = self.token()
+      if tok is None : raise StopIteration
+      return tok
+
+   next = __next__
+
+#---------------------------------------------------------------------------------------------------
+class DataBuffer(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A typed numpy buffer used to accumulate the data values for a single numeric variable. The buffer
+   is preallocated to the expected number of values and doubles its capacity whenever that number
+   is exceeded, as happens with record variables whose unlimited dimension has zero length.
+   Numeric constants appended as raw text are converted in bulk when the values are next needed.
+   """
+   def __init__(self, dtype, size=0) :
+      self.size = 0
+      self.data = np.empty(max(size, 1), dtype=dtype)
+      self.pending = {}
+
+   def __len__(self) :
+      return self.size
+
+   def __getitem__(self, index) :
+      return self.values()[index]
+
+   def append(self, value) :
+      """Append a single value to the buffer."""
+      if self.size == len(self.data) : self.reserve(self.size+1)
+      self.data[self.size] = value
+      self.size += 1
+
+   def append_literal(self, tag, text) :
+      """
+      Append a numeric constant, given as the raw text of a lexer token of type tag, to the buffer.
+      Conversion of the constant is deferred until convert_pending is called.
+      """
+      if self.size == len(self.data) : self.reserve(self.size+1)
+      pending = self.pending.get(tag)
+      if pending is None : pending = self.pending[tag] = ([], [])
+      pending[0].append(self.size)
+      pending[1].append(text)
+      self.size += 1
+
+   def convert_pending(self) :
+      """Convert all pending numeric constants in bulk and store them in the buffer."""
+      for tag, (indices, texts) in self.pending.items() :
+         self.data[indices] = convert_literals(tag, texts)
+      self.pending = {}
+
+   def extend(self, values) :
+      """Append a sequence of values to the buffer."""
+      values = np.asarray(values)
+      newsize = self.size + len(values)
+      if newsize > len(self.data) : self.reserve(newsize)
+      self.data[self.size:newsize] = values
+      self.size = newsize
+
+   def reserve(self, size) :
+      """Grow the buffer, by doubling, so that it can hold at least size values."""
+      capacity = len(self.data)
+      if size <= capacity : return
+      while capacity < size : capacity *= 2
+      data = np.empty(capacity, dtype=self.data.dtype)
+      data[:self.size] = self.data[:self.size]
+      self.data = data
+
+   def values(self) :
+      """Return a view of the values appended so far."""
+      if self.pending : self.convert_pending()
+      return self.data[:self.size]
+
+#---------------------------------------------------------------------------------------------------
+class RecordBuffer(DataBuffer) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A fixed-size DataBuffer for record variables which writes complete records to the netCDF
+   variable whenever the buffer fills up. The buffer holds the larger of one record or roughly
+   DEFAULT_BUFFER_SIZE values, so memory use does not grow with the number of records. Records
+   are written from index first_record onwards.
+   """
+   def __init__(self, var, reclen, first_record=0) :
+      dtype = object if var.dtype.kind == 'S' else var.dtype
+      super(RecordBuffer, self).__init__(dtype, max(reclen, DEFAULT_BUFFER_SIZE // reclen * reclen))
+      self.var = var
+      self.reclen = reclen
+      self.first_record = first_record
+      shape = var_layout(var)[1]
+      varlen = reduce(lambda x,y: x*y, shape[:-1] if var.dtype.kind == 'S' else shape, 1)
+      self.varlen = varlen - first_record * reclen
+      self.nwritten = 0
+      self.write_secs = 0.0
+
+   def __len__(self) :
+      return self.nwritten + self.size
+
+   def append(self, value) :
+      """Append a single value to the buffer, writing out its records if it is now full."""
+      self.data[self.size] = value
+      self.size += 1
+      if self.size == len(self.data) : self.flush()
+
+   def append_literal(self, tag, text) :
+      """Append a raw numeric constant, writing out the buffered records if it is now full."""
+      super(RecordBuffer, self).append_literal(tag, text)
+      if self.size == len(self.data) : self.flush()
+
+   def extend(self, values) :
+      """Append a sequence of values, writing out complete records as the buffer fills up."""
+      values = np.asarray(values)
+      while len(values) :
+         # bypass the buffer for complete records at the start of a large sequence
+         if self.size == 0 and len(values) >= len(self.data) :
+            n = len(values) // self.reclen * self.reclen
+            self.write(values[:n])
+         else :
+            n = min(len(self.data) - self.size, len(values))
+            self.data[self.size:self.size+n] = values[:n]
+            self.size += n
+            if self.size == len(self.data) : self.flush()
+         values = values[n:]
+
+   def flush(self) :
+      """Write any complete records held in the buffer to the netCDF variable."""
+      n = self.size // self.reclen * self.reclen
+      if not n : return
+      if self.pending : self.convert_pending()
+      self.write(self.data[:n])
+      self.data[:self.size-n] = self.data[n:self.size]
+      self.size -= n
+
+   def write(self, values) :
+      """Write values, which must make up complete records, after the records written so far."""
+      start = self.first_record + self.nwritten // self.reclen
+      t0 = time.time()
+      if self.var.dtype.kind == 'S' :
+         put_char_data(self.var, values, self.reclen, start)
+      else :
+         put_numeric_data(self.var, values, self.reclen, start)
+      self.write_secs += time.time() - t0
+      self.nwritten += len(values)
+
+#---------------------------------------------------------------------------------------------------
+class CharBuffer(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A buffer used to accumulate the strings for a character variable as the rows of one contiguous,
+   zero-filled byte array, each row being as long as the variable's last dimension. Strings are
+   encoded as UTF-8 straight into their row, truncated to fit if necessary, so that rows are padded
+   with null characters in place. Like a DataBuffer, the buffer doubles its capacity as required.
+   """
+   def __init__(self, rowlen, size=0) :
+      self.rowlen = rowlen
+      self.size = 0
+      self.data = bytearray(max(size, 1) * rowlen)
+
+   def __len__(self) :
+      return self.size
+
+   def append(self, value) :
+      """Append a single string, or the text form of any other value, to the buffer."""
+      if not isinstance(value, (six.text_type, six.binary_type)) : value = six.text_type(value)
+      value = encode_text(value)[:self.rowlen]
+      if self.size * self.rowlen == len(self.data) : self.reserve(self.size+1)
+      pos = self.size * self.rowlen
+      self.data[pos:pos+len(value)] = value
+      self.size += 1
+
+   def extend(self, values) :
+      """Append a sequence of values to the buffer."""
+      values = [value if isinstance(value, six.binary_type) else
+         six.text_type(value).encode('utf-8') for value in values]
+      self.reserve(self.size + len(values))
+      if values and self.rowlen :
+         # numpy truncates the strings to the row length, and pads them with nulls, in bulk
+         rows = np.array(values, dtype='S%d' % self.rowlen)
+         pos = self.size * self.rowlen
+         self.data[pos:pos+rows.nbytes] = rows.tobytes()
+      self.size += len(values)
+
+   def pad(self, size, value) :
+      """Pad the buffer out to size strings, each equal to value."""
+      if size <= self.size : return
+      self.reserve(size)
+      row = encode_text(value)[:self.rowlen]
+      # the rows are already filled with nulls
+      if row.strip(b'\0') :
+         row += b'\0' * (self.rowlen - len(row))
+         self.data[self.size*self.rowlen:size*self.rowlen] = row * (size - self.size)
+      self.size = size
+
+   def reserve(self, size) :
+      """Grow the buffer, by doubling, so that it can hold at least size strings."""
+      capacity = len(self.data) // self.rowlen
+      if size <= capacity : return
+      while capacity < size : capacity *= 2
+      data = bytearray(capacity * self.rowlen)
+      data[:self.size*self.rowlen] = self.data[:self.size*self.rowlen]
+      self.data = data
+
+   def values(self) :
+      """Return a view of the strings appended so far, as an array of type '|S1' with n rows."""
+      n = self.size * self.rowlen
+      return np.frombuffer(self.data, dtype='S1', count=n).reshape(self.size, self.rowlen)
+
+#---------------------------------------------------------------------------------------------------
+class CharRecordBuffer(CharBuffer) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A fixed-size CharBuffer for character record variables which, like a RecordBuffer, writes
+   complete records of reclen strings to the netCDF variable whenever the buffer fills up. Records
+   are written from index first_record onwards.
+   """
+   def __init__(self, var, reclen, first_record=0) :
+      shape = var_layout(var)[1]
+      super(CharRecordBuffer, self).__init__(shape[-1],
+         max(reclen, DEFAULT_BUFFER_SIZE // reclen * reclen))
+      self.capacity = len(self.data) // self.rowlen
+      self.var = var
+      self.reclen = reclen
+      self.first_record = first_record
+      self.varlen = reduce(lambda x,y: x*y, shape[:-1], 1) - first_record * reclen
+      self.nwritten = 0
+      self.write_secs = 0.0
+
+   def __len__(self) :
+      return self.nwritten + self.size
+
+   def append(self, value) :
+      """Append a single string, writing out the buffered records if the buffer is now full."""
+      super(CharRecordBuffer, self).append(value)
+      if self.size == self.capacity : self.flush()
+
+   def extend(self, values) :
+      """Append a sequence of values, writing out complete records as the buffer fills up."""
+      values = list(values)
+      pos = 0
+      while pos < len(values) :
+         n = min(self.capacity - self.size, len(values) - pos)
+         super(CharRecordBuffer, self).extend(values[pos:pos+n])
+         if self.size == self.capacity : self.flush()
+         pos += n
+
+   def pad(self, size, value) :
+      """Pad the strings given so far out to size strings, writing out records as required."""
+      while len(self) < size :
+         n = min(self.capacity - self.size, size - len(self))
+         super(CharRecordBuffer, self).pad(self.size + n, value)
+         if self.size == self.capacity : self.flush()
+
+   def flush(self) :
+      """Write any complete records held in the buffer to the netCDF variable."""
+      n = self.size // self.reclen * self.reclen
+      if not n : return
+      self.write(self.values()[:n])
+      # move any partial record to the start of the buffer, which is otherwise null-filled again
+      start, end = n * self.rowlen, self.size * self.rowlen
+      self.data[:end-start] = self.data[start:end]
+      self.data[end-start:] = bytes(len(self.data) - (end-start))
+      self.size -= n
+
+   def write(self, values) :
+      """Write values, an array of complete records, after the records written so far."""
+      start = self.first_record + self.nwritten // self.reclen
+      t0 = time.time()
+      put_char_data(self.var, values, self.reclen, start)
+      self.write_secs += time.time() - t0
+      self.nwritten += len(values)
+
+#---------------------------------------------------------------------------------------------------
+class LiteralRun(object) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A run of numeric constants and fill values from the data section, held as the raw text and the
+   token type of each constant. A run takes the place of a separate lexer token for each value, and
+   is converted to a numpy array in bulk, one constant type at a time, by the values method.
+   """
+   __slots__ = ('tags', 'texts', 'end')
+
+   def __init__(self, tags, texts, end) :
+      self.tags = tags
+      self.texts = texts
+      self.end = end
+
+   def __len__(self) :
+      return len(self.texts)
+
+   def items(self) :
+      """Return a list of the (type tag, raw text) pairs of the constants in the run."""
+      return list(zip(self.tags, self.texts))
+
+   def values(self, dtype, fill_value=None) :
+      """Convert the run to a numpy array of type dtype, with fill_value in place of fill values."""
+      values = np.empty(len(self.texts), dtype=dtype)
+      tagset = set(self.tags)
+      if len(tagset) == 1 :
+         masks = {self.tags[0]: slice(None)}
+      else :
+         tags = np.array(self.tags)
+         masks = dict((tag, tags == tag) for tag in tagset)
+      for tag, mask in masks.items() :
+         if tag == 'FILLVALUE' :
+            values[mask] = fill_value
+         elif isinstance(mask, slice) :
+            values[:] = convert_literals(tag, self.texts)
+         else :
+            values[mask] = convert_literals(tag, [x for x, m in zip(self.texts, mask) if m])
+      return values
+
+#---------------------------------------------------------------------------------------------------
+def put_numeric_data(var, arr, reclen=0, start=0) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Write numeric data array to netcdf variable. For record variables, reclen is the number of
+   values per record and start is the index of the first record to write.
+   """
+   if isinstance(arr, DataBuffer) : arr = arr.values()
+   nparr = np.asarray(arr, dtype=var.dtype)
+   with write_lock(var) : shape = list(var.shape)
+   if reclen : shape[0] = len(arr) // reclen
+   nparr = nparr.reshape(shape)
+   with write_lock(var) :
+      if reclen :
+         var[start:start+shape[0]] = nparr
+      else :
+         var[:] = nparr
+
+#---------------------------------------------------------------------------------------------------
+def put_data_prefix(var, arr) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Write data array arr, which holds fewer values than netcdf variable var, to the start of the
+   variable, leaving the remaining values untouched. The array may be a CharBuffer, whose strings
+   are written as whole rows of characters. The values are written as at most one hyperslab per
+   dimension: the complete slices along the first dimension, then the complete slices along the
+   second dimension of the next, partial, slice, and so on.
+   """
+   if isinstance(arr, (DataBuffer, CharBuffer)) : arr = arr.values()
+   values = np.asarray(arr, dtype=var.dtype).reshape(-1)
+   with write_lock(var) : shape = tuple(var.shape)
+   index = ()
+   pos = 0
+   for axis in range(len(shape)) :
+      rowshape = shape[axis+1:]
+      rowlen = reduce(lambda x,y: x*y, rowshape, 1)
+      nrows = (len(values) - pos) // rowlen
+      if nrows :
+         with write_lock(var) :
+            var[index + (slice(0, nrows),)] = \
+               values[pos:pos+nrows*rowlen].reshape((nrows,) + rowshape)
+         pos += nrows * rowlen
+      if pos == len(values) : break
+      index += (nrows,)
+
+#---------------------------------------------------------------------------------------------------
+def put_char_data(var, arr, reclen=0, start=0) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Write character data array to netcdf variable. For record variables, reclen is the number of
+   strings per record and start is the index of the first record to write. The array may be a
+   CharBuffer, or an array of type '|S1' with a row per string, whose contents are written as they
+   stand, or a sequence of strings.
+   """
+   with write_lock(var) : shape = list(var.shape)
+   if isinstance(arr, CharBuffer) :
+      nparr = arr.values()
+   elif isinstance(arr, np.ndarray) and arr.dtype == np.dtype('S1') :
+      nparr = arr
+   else :
+      nparr = str_list_to_char_arr(arr, shape[-1] if var.ndim > 0 else 1)
+   if reclen : shape[0] = len(arr) // reclen
+   nparr = nparr.reshape(shape)
+   with write_lock(var) :
+      if reclen :
+         var[start:start+shape[0]] = nparr
+      else :
+         var[:] = nparr
+
+#---------------------------------------------------------------------------------------------------
+def write_lock(var) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return the lock to hold while writing data to variable var, or querying its shape or attributes,
+   namely NETCDF_LOCK unless var is a PipelinedVariable. The latter's writer thread holds
+   NETCDF_LOCK while writing the queued data, so the data mustn't be queued with NETCDF_LOCK held in
+   case the parser has to wait for the queue. (A PipelinedVariable answers queries from the header.)
+   """
+   return var.lock if isinstance(var, PipelinedVariable) else NETCDF_LOCK
+
+#---------------------------------------------------------------------------------------------------
+def var_layout(var) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return the dimension names and shape of variable var as a pair of tuples. Both are looked up by
+   the netCDF library each time they're accessed, so they are fetched together under write_lock.
+   """
+   with write_lock(var) :
+      return tuple(var.dimensions), tuple(var.shape)
+
+#---------------------------------------------------------------------------------------------------
+def str_list_to_char_arr(slist, maxlen) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a list of regular python strings to a numpy character array of type '|S1', which is what
+   is required by the netCDF4 module. The maximum length of each string in the output netcdf array
+   is defined by maxlen. It's usually the last dimension in the variable declaration. Strings are
+   encoded as UTF-8, as in a CharBuffer.
+   """
+   stype = 'S%d' % maxlen
+   tarr = np.array([encode_text(x) for x in slist], dtype=stype)
+   # viewing the fixed-length strings as single characters avoids a copy
+   return tarr.view('S1').reshape(tarr.shape + (maxlen,))
+
+#---------------------------------------------------------------------------------------------------
+def pad_array(var, varlen, arr) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Pad out array arr with fill values if it contains fewer elements than are required by the host
+   variable.
+   """
+   arrlen = len(arr)
+   arr.extend([padding_value(var)]*(varlen-arrlen))
+
+#---------------------------------------------------------------------------------------------------
+def padding_value(var) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return the value used in place of any data values for variable var missing from the CDL source.
+   """
+   with write_lock(var) :
+      if '_FillValue' in var.ncattrs() :
+         return var._FillValue
+      elif 'missing_value' in var.ncattrs() :
+         return var.missing_value
+   return get_default_fill_value(var.dtype.char)
+
+#---------------------------------------------------------------------------------------------------
+def netcdf_fills(var) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return true if those values of variable var which are never written read as its padding value,
+   since the netCDF library fills them with the _FillValue attribute or else the default fill value.
+   This relies on the dataset being in fill mode, which is the netCDF library's default.
+   """
+   with write_lock(var) :
+      return '_FillValue' in var.ncattrs() or 'missing_value' not in var.ncattrs()
+
+# Regexes used to validate and split runs of numeric constants
+OCTAL_CONST_RE = re.compile(r'[\s,][+-]?0[0-9]+(?![0-9.eE])')
+LITERAL_ITEM_RE = re.compile(CDL3Parser.literal_item)
+
+# Regex used to split a run of strings into the strings themselves, minus their quotes
+STRING_ITEM_RE = re.compile(r'"([^"]*)"')
+
+# Lexer tokens which hold a run of data values and which always end at a delimiter
+RUN_TOKENS = ('NUMERIC_RUN', 'STRING_RUN')
+
+# Regex matching a complete CDL identifier
+IDENT_RE = re.compile('(?:%s)$' % CDL3Parser.ID)
+
+# Characters which can only appear in a run of numeric constants as part of a type suffix, a hex
+# constant or a fill value (testing for each of these in turn is much faster than a regex search)
+NON_PLAIN_CHARS = '_xXsSbBdDfF'
+NON_PLAIN_BYTES = [c.encode('ascii') for c in NON_PLAIN_CHARS]
+
+# Regex matching a run of numeric constants, and any whitespace before it, in a memory-mapped file
+MAPPED_RUN_RE = re.compile(('[ \t\r\f\n]*(%s)' % CDL3Parser.numeric_run).encode('ascii'))
+
+# Lookup tables, indexed by byte value, of the characters which can precede the first digit of a
+# numeric constant in a run, and of the exponent characters
+SEPARATOR_BYTES = np.zeros(256, dtype=bool)
+SEPARATOR_BYTES[[ord(c) for c in ', \t\n\r\f\v']] = True
+SIGN_BYTES = np.zeros(256, dtype=bool)
+SIGN_BYTES[[ord(c) for c in '+-']] = True
+EXPONENT_BYTES = np.zeros(256, dtype=bool)
+EXPONENT_BYTES[[ord(c) for c in 'eE']] = True
+
+# Lexer tokens whose values may need decoding as UTF-8 when lexed from a memory-mapped file
+MAPPED_TEXT_TOKENS = ('IDENT', 'TERMSTRING', 'NETCDF')
+NON_ASCII_RE = re.compile(u'[^\x00-\x7f]+')
+
+#---------------------------------------------------------------------------------------------------
+def parse_numeric_run(text) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a comma-separated run of plain (unsuffixed, decimal) numeric constants to a numpy array
+   in one step. Integer-only runs are range-checked and returned as int32 values, other runs as
+   float64 values. Returns None if the text contains anything other than plain constants, e.g. an
+   octal integer or a malformed number.
+   """
+   # suffixed, hex and octal constants and fill values are not plain constants
+   for c in NON_PLAIN_CHARS :
+      if c in text : return None
+   if OCTAL_CONST_RE.match(',' + text[:3]) or OCTAL_CONST_RE.search(text) : return None
+   values = fromstring_exact(text, np.float64)
+   if values is None : return None
+   is_real = '.' in text or 'e' in text or 'E' in text
+   out_of_range = (values < XDR_INT_MIN) | (values > XDR_INT_MAX)
+   if out_of_range.any() :
+      # any integers outside the valid range must be reported, as in t_INT_CONST
+      consts = [x.strip() for x in text.split(',')]
+      for i in np.nonzero(out_of_range)[0] :
+         if not ('.' in consts[i] or 'e' in consts[i] or 'E' in consts[i]) :
+            errmsg = "Integer constant outside valid range (%d -> %d): %s" \
+               % (XDR_INT_MIN, XDR_INT_MAX, consts[i])
+            raise CDLContentError(errmsg)
+   if not is_real : values = values.astype(np.int32)
+   return values
+
+#---------------------------------------------------------------------------------------------------
+def parse_numeric_bytes(data) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a run of plain numeric constants held as ASCII bytes, e.g. a range of a memory-mapped CDL
+   file, to a numpy array without first decoding it to text. The result is the same as that of
+   parse_numeric_run, but the search for octal constants is vectorized over the bytes. Returns None
+   if the run needs any other handling, including the reporting of out-of-range integers, in which
+   case it should be decoded and passed to parse_numeric_run or split_literal_run.
+   """
+   for c in NON_PLAIN_BYTES :
+      if c in data : return None
+   # a constant starting with a zero followed by another digit may be octal, but ignore zeros
+   # preceded by a digit, a decimal point, or the sign of an exponent
+   codes = np.frombuffer(data, dtype=np.uint8)
+   zeros = np.flatnonzero((codes[:-1] == ord('0')) & (codes[1:] - ord('0') < 10))
+   if len(zeros) :
+      before = np.where(zeros > 0, codes[zeros-1], ord(','))
+      before2 = np.where(zeros > 1, codes[zeros-2], ord(','))
+      if (SEPARATOR_BYTES[before] | (SIGN_BYTES[before] & ~EXPONENT_BYTES[before2])).any() :
+         return None
+   values = fromstring_exact(data, np.float64)
+   if values is None : return None
+   if ((values < XDR_INT_MIN) | (values > XDR_INT_MAX)).any() : return None
+   if not (b'.' in data or b'e' in data or b'E' in data) : values = values.astype(np.int32)
+   return values
+
+#---------------------------------------------------------------------------------------------------
+def decode_mapped_text(text) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Decode the UTF-8 sequences in a token value lexed from a memory-mapped file, in which each
+   character stands for a single byte. Each run of non-ASCII characters is decoded separately, and
+   is left unchanged if it is not valid UTF-8, e.g. because it was produced by an escape sequence.
+   """
+   def decode_match(match) :
+      try :
+         return match.group(0).encode('latin-1').decode('utf-8')
+      except UnicodeError :
+         return match.group(0)
+
+   return NON_ASCII_RE.sub(decode_match, text)
+
+#---------------------------------------------------------------------------------------------------
+def split_literal_run(text) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Split a comma-separated run of numeric constants and fill values into a LiteralRun. If the run
+   contains an invalid constant then it is cut back to the constants before it, in which case the
+   end attribute of the LiteralRun gives the length of the text used. Returns None if the first
+   constant is invalid.
+   """
+   tags = []
+   texts = []
+   pos = end = 0
+   while pos < len(text) :
+      m = LITERAL_ITEM_RE.match(text, pos)
+      if not m : break
+      tag = m.lastgroup
+      tags.append(tag)
+      texts.append(m.group(tag))
+      end = m.end(tag)
+      pos = m.end()
+   if not tags : return None
+   return LiteralRun(tags, texts, end if pos < len(text) else len(text))
+
+#---------------------------------------------------------------------------------------------------
+def fromstring_exact(text, dtype) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a comma-separated list of numbers, held as text or ASCII bytes, to a numpy array of type
+   dtype in one step. Returns None unless every item in text is a valid number.
+   """
+   # the trailing sentinel value only gets read if the whole of text was parsed successfully
+   sentinel = b',0' if isinstance(text, bytes) else ',0'
+   try :
+      # numpy warns whenever it stops short of the end of the text, which the length check below
+      # detects anyway (the warning filters are process-wide, hence the lock)
+      with WARNINGS_LOCK, warnings.catch_warnings() :
+         warnings.simplefilter('ignore', DeprecationWarning)
+         values = np.fromstring(text + sentinel, dtype=dtype, sep=',')
+   except ValueError :
+      return None
+   if len(values) != text.count(sentinel[:1]) + 2 : return None
+   return values[:-1]
+
+#---------------------------------------------------------------------------------------------------
+def convert_literals(tag, texts) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a list of numeric constants, given as the raw text of lexer tokens of type tag, to a
+   numpy array of the corresponding data type (see LITERAL_TYPES). Decimal constants are converted
+   in a single vectorized step, while octal, hex and quoted character constants are converted one
+   at a time. Raises a CDLContentError if any constant is malformed or out of range for its type.
+   """
+   dtype, name = LITERAL_TYPES[tag]
+   is_real = np.dtype(dtype).kind == 'f'
+   # strip the type suffix, if any
+   if tag == 'INT_CONST' :
+      consts = texts
+   elif tag == 'DOUBLE_CONST' :
+      consts = [x.rstrip('dD') for x in texts]
+   elif tag == 'BYTE_CONST' :
+      consts = [x if x[0] == "'" else x[:-1] for x in texts]
+   else :
+      consts = [x[:-1] for x in texts]
+   joined = ','.join(consts)
+   if is_real :
+      values = fromstring_exact(joined, np.float64)
+   elif OCTAL_CONST_RE.search(',' + joined) or 'x' in joined or 'X' in joined or "'" in joined :
+      values = None
+   else :
+      values = fromstring_exact(joined, np.int64)
+   if values is None :
+      # Python integers may be too big for int64, so range checks are done on an object array
+      values = np.array([parse_literal(tag, x, y) for x, y in zip(consts, texts)],
+         dtype=np.float64 if is_real else object)
+   if not is_real :
+      info = np.iinfo(dtype)
+      out_of_range = (values < info.min) | (values > info.max)
+      if out_of_range.any() :
+         errmsg = "%s constant outside valid range (%d -> %d): %s" \
+            % (name.capitalize(), info.min, info.max, texts[np.argmax(out_of_range)])
+         raise CDLContentError(errmsg)
+   return values.astype(dtype)
+
+#---------------------------------------------------------------------------------------------------
+def convert_literal(tag, text) :
+#---------------------------------------------------------------------------------------------------
+   """Convert one numeric constant of token type tag to a numpy scalar (see convert_literals)."""
+   return convert_literals(tag, [text])[0]
+
+#---------------------------------------------------------------------------------------------------
+def parse_literal(tag, const, text) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a single numeric constant, with any type suffix already removed, to a Python float or
+   integer. Integer constants may be decimal, octal (leading 0) or hex (leading 0x), or, in the case
+   of byte constants, a quoted character. The original token text is used in error messages.
+   """
+   try :
+      if LITERAL_TYPES[tag][1] in ('float', 'double') :
+         return float(const)
+      if const[0] == "'" :
+         return ord(expand_escapes(const[1:-1]))
+      if tag == 'BYTE_CONST' :
+         return int(const)
+      sign = -1 if const[0] == '-' else 1
+      digits = const.lstrip('+-')
+      if digits[:2] in ('0x', '0X') :
+         return sign * int(digits[2:], 16)
+      elif len(digits) > 1 and digits[0] == '0' :
+         return sign * int(digits, 8)
+      else :
+         return sign * int(digits)
+   except (ValueError, TypeError) :
+      raise CDLContentError("Bad %s constant: %s" % (LITERAL_TYPES[tag][1], text))
+
+#---------------------------------------------------------------------------------------------------
+def convert_attribute_values(attvallist) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert the numeric constants in a list of attribute values, each either a string or a (type
+   tag, raw text) pair, to numpy values. Consecutive constants of the same type are converted in
+   bulk and a list of numeric constants only is returned as a single numpy array.
+   """
+   if any(not isinstance(x, tuple) for x in attvallist) :
+      return [convert_literal(*x) if isinstance(x, tuple) else x for x in attvallist]
+   arrays = []
+   i = 0
+   while i < len(attvallist) :
+      tag = attvallist[i][0]
+      j = i + 1
+      while j < len(attvallist) and attvallist[j][0] == tag : j += 1
+      arrays.append(convert_literals(tag, [x[1] for x in attvallist[i:j]]))
+      i = j
+   return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+#---------------------------------------------------------------------------------------------------
+def nc3_name_size(name) :
+#---------------------------------------------------------------------------------------------------
+   """Return the size of a name as encoded in a netCDF-3 header, i.e. NFC-normalized UTF-8."""
+   nbytes = len(unicodedata.normalize('NFC', six.text_type(name)).encode('utf-8'))
+   return 4 + (nbytes + 3) // 4 * 4
+
+#---------------------------------------------------------------------------------------------------
+def nc3_attlist_size(attributes) :
+#---------------------------------------------------------------------------------------------------
+   """Return the size of a dictionary of attributes as encoded in a netCDF-3 header."""
+   size = 8
+   for name, value in attributes.items() :
+      if isinstance(value, six.text_type) :
+         nbytes = len(value.encode('utf-8'))
+      elif isinstance(value, bytes) :
+         nbytes = len(value)
+      else :
+         # netCDF-3 has no 64-bit integers so, like netCDF4, assume these are stored as ints
+         arr = np.asarray(value)
+         itemsize = 4 if arr.dtype.kind == 'i' and arr.dtype.itemsize == 8 else arr.dtype.itemsize
+         nbytes = arr.size * itemsize
+      size += nc3_name_size(name) + 8 + (nbytes + 3) // 4 * 4
+   return size
+
+#---------------------------------------------------------------------------------------------------
+def encode_text(text) :
+#---------------------------------------------------------------------------------------------------
+   """Return text encoded as UTF-8 bytes, or as is if it is already a byte string."""
+   return text.encode('utf-8') if isinstance(text, six.text_type) else text
+
+#---------------------------------------------------------------------------------------------------
+def deescapify(name) :
+#---------------------------------------------------------------------------------------------------
+   """
+   A Python version of ncgen's deescapify() function (see genlib.c). The code here is a fairly
+   literal translation of that function. I expect this could be recoded in a more pythonic way
+   using, say, regular expressions.
+   """
+   if '\\' not in name : return name
+   newname = ''
+   i = 0
+   # delete '\' chars, except change '\\' to '\'
+   while i < len(name) :
+      if name[i] == '\\' :
+         if name[i+1] == '\\' :
+            newname += '\\'
+            i += 1
       else :
          newname += name[i]
       i += 1
@@ -929,18 +3829,125 @@ def expand_escapes(tstring) :
 
    return ESCAPE_SEQUENCE_RE.sub(decode_match, tstring)
 
+# Regexes for finding the characters that must be escaped in CDL names and strings
+NAME_SPECIAL_CHARS_RE = re.compile(r'([ !"#$%&\'()*,:;<=>?\[\\\]^`{|}~])')
+STRING_SPECIAL_CHARS_RE = re.compile(r'[\\"\x00-\x1f\x7f]')
+
+# escape sequences for the special characters in CDL strings, other than those written as \xHH
+STRING_ESCAPES = {'\\': '\\\\', '"': '\\"', '\n': '\\n', '\t': '\\t', '\r': '\\r'}
+
+#---------------------------------------------------------------------------------------------------
+def escapify(name) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Escape the special characters in a netCDF name so that it can be used as a CDL identifier. This
+   is the inverse of the deescapify function.
+   """
+   name = NAME_SPECIAL_CHARS_RE.sub(r'\\\1', name)
+   if name[:1].isdigit() : name = '\\' + name
+   return name
+
+#---------------------------------------------------------------------------------------------------
+def escape_string(text) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Escape the backslashes, double quotes and control characters in text so that it can be used in a
+   CDL string. This is the inverse of the expand_escapes function.
+   """
+   def encode_match(match) :
+      char = match.group(0)
+      return STRING_ESCAPES.get(char) or '\\x%02x' % ord(char)
+
+   return STRING_SPECIAL_CHARS_RE.sub(encode_match, text)
+
+#---------------------------------------------------------------------------------------------------
+def cdl_name(name) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return a netCDF dimension, variable or attribute name as a CDL identifier. CDL3Parser keeps any
+   escapes in identifiers, so names which are already valid identifiers are returned as they are.
+   """
+   return name if IDENT_RE.match(name) else escapify(name)
+
+#---------------------------------------------------------------------------------------------------
+def format_numbers(values, fill_value=None, suffix='') :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return a numpy array of the CDL text of the numbers in array values, each in the shortest form
+   which converts back to the same value, with the type suffix appended. Elements equal to
+   fill_value are given as the fill value constant '_' instead. Non-finite floating-point values
+   are given as NaN or [-]Infinity, as by ncdump, although the CDL3Parser grammar lacks these.
+   """
+   texts = values.astype(str)
+   if values.dtype.kind == 'f' and not np.isfinite(values).all() :
+      texts = np.where(np.isnan(values), 'NaN', np.where(np.isinf(values),
+         np.where(values > 0, 'Infinity', '-Infinity'), texts))
+   if suffix : texts = np.char.add(texts, suffix)
+   if fill_value is not None :
+      if values.dtype.kind == 'f' and np.isnan(fill_value) :
+         mask = np.isnan(values)
+      else :
+         mask = values == fill_value
+      if mask.any() : texts = np.where(mask, FILL_STRING, texts)
+   return texts
+
+#---------------------------------------------------------------------------------------------------
+def cdl_type_name(dtype) :
+#---------------------------------------------------------------------------------------------------
+   """Return the CDL type name for numpy data type dtype, which must be a netCDF-3 data type."""
+   code = 'c' if dtype.kind == 'S' else dtype.char
+   if code not in CDL_TYPE_NAMES :
+      raise CDLContentError("Data type '%s' cannot be represented in CDL" % dtype)
+   return CDL_TYPE_NAMES[code]
+
 #---------------------------------------------------------------------------------------------------
-def fix_octal(octal_str) :
+def char_array_to_strings(chars) :
 #---------------------------------------------------------------------------------------------------
    """
-   Fixes anything octal, including +/- prefix and letter suffix to use "0o"
+   Return a list of the CDL strings, complete with quotes, held in array chars of type 'S1', along
+   its last dimension. Only strings containing special characters are escaped individually.
    """
-   m = re.match(r"([+-]?)0(\d+.*)", octal_str)
-   if m:
-      # Make octal python 3 compatible
-      return m.group(1) + "0o" + m.group(2)
-   else:
-      return octal_str
+   if chars.ndim == 0 : chars = chars.reshape(1)
+   strings = np.atleast_1d(nc4.chartostring(chars)).ravel().tolist()
+   if STRING_SPECIAL_CHARS_RE.search(u"".join(strings)) :
+      strings = [escape_string(x) for x in strings]
+   return [u'"%s"' % x for x in strings]
+
+#---------------------------------------------------------------------------------------------------
+def storage_rules(storage) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert the storage option of CDLParser to a list of (pattern, options) pairs, checking that only
+   the createVariable keyword arguments listed in STORAGE_OPTIONS are used.
+   """
+   if not storage : return []
+   if isinstance(storage, dict) : storage = [('*', storage)]
+   rules = []
+   for pattern, options in storage :
+      unknown = set(options) - set(STORAGE_OPTIONS)
+      if unknown :
+         raise ValueError("Unrecognised storage option(s): %s" % ', '.join(sorted(unknown)))
+      rules.append((pattern, dict(options)))
+   return rules
+
+#---------------------------------------------------------------------------------------------------
+def auto_chunksizes(shape, itemsize, recdim=None, target=CHUNK_TARGET_BYTES) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Return chunk sizes of about target bytes for a variable with the given shape and item size. The
+   slowest-varying dimensions are halved first, so that chunks span whole rows wherever possible.
+   If recdim is the index of the record dimension then the chunks hold as many records as fit in
+   the target size, up to RECORD_CHUNK_LEN, so that appending records touches few chunks.
+   """
+   chunks = [max(1, n) for n in shape]
+   if recdim is not None : chunks[recdim] = 1
+   nbytes = lambda: reduce(lambda x,y: x*y, chunks, itemsize)
+   for i in range(len(chunks)) :
+      while i != recdim and chunks[i] > 1 and nbytes() > target :
+         chunks[i] = (chunks[i] + 1) // 2
+   if recdim is not None :
+      chunks[recdim] = max(1, min(RECORD_CHUNK_LEN, target // nbytes()))
+   return tuple(chunks)
 
 #---------------------------------------------------------------------------------------------------
 def get_default_fill_value(datatype) :
@@ -948,7 +3955,7 @@ def get_default_fill_value(datatype) :
    """Returns the default netCDF fill value for the specified numpy dtype.char code."""
    if datatype == 'b' :
       return NC_FILL_BYTE
-   elif datatype in ('S','U') :
+   elif datatype in ('S','U','c') :
       return NC_FILL_CHAR
    elif datatype in ('h','s') :
       return NC_FILL_SHORT
@@ -961,28 +3968,146 @@ def get_default_fill_value(datatype) :
    else :
       raise CDLContentError("Unrecognised data type '%s'" % datatype)
 
+# parser instance used by the current batch conversion process (see init_worker)
+_worker_parser = None
+
 #---------------------------------------------------------------------------------------------------
-def main() :
+def init_worker(kwargs, cache_dir=None) :
 #---------------------------------------------------------------------------------------------------
-   """Rudimentary main function - primarily for testing purposes at this point in time."""
-   debug = 0
-   if len(sys.argv) < 2 :
-      print("usage: python cdlparser.py cdlfile [keyword=value, ...]")
-      sys.exit(1)
-   cdlfile = sys.argv[1]
-   kwargs = {}
-   if len(sys.argv) > 2 :
-      keys = [x.split('=')[0] for x in sys.argv[2:]]
-      vals = [eval(x.split('=')[1]) for x in sys.argv[2:]]
-      kwargs = dict(zip(keys,vals))
-   cdlparser = CDL3Parser(**kwargs)
-   ncdataset = cdlparser.parse_file(cdlfile)
+   """
+   Initialise a batch conversion process by creating the CDL3Parser instance, and hence building
+   the lexer and parser tables, that is then reused for every file converted by the process. If
+   cache_dir is specified then the parser uses a ConversionCache stored in that directory.
+   """
+   global _worker_parser
+   if cache_dir : kwargs = dict(kwargs, cache=ConversionCache(cache_dir))
+   _worker_parser = CDL3Parser(**kwargs)
+
+#---------------------------------------------------------------------------------------------------
+def convert_file(paths) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a single CDL file to netCDF using the current process's parser. The paths argument is a
+   (cdlfile, ncfile) tuple, where ncfile may be None. Returns a (cdlfile, ncfile, elapsed time,
+   error message) tuple, the last element of which is None if the conversion succeeded.
+   """
+   cdlfile, ncfile = paths
+   errmsg = None
+   start = time.time()
    try :
-      ncdataset.close()   # wrap in try block since dataset may get closed by parser
-   except :
-      pass
+      ncdataset = _worker_parser.parse_file(cdlfile, ncfile=ncfile)
+      ncfile = _worker_parser.ncfile
+      try :
+         ncdataset.close()   # wrap in try block since dataset may get closed by parser
+      except :
+         pass
+   except Exception as exc :
+      errmsg = "%s: %s" % (exc.__class__.__name__, str(exc).split('\n')[0])
+   return (cdlfile, ncfile, time.time() - start, errmsg)
+
+#---------------------------------------------------------------------------------------------------
+def expand_paths(patterns) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Expand a list of pathnames and/or glob patterns into a sorted list of unique pathnames. Patterns
+   that match nothing are retained as-is so that they get reported as failed conversions.
+   """
+   paths = []
+   for pattern in patterns :
+      paths.extend(glob.glob(pattern) or [pattern])
+   return sorted(set(paths))
+
+#---------------------------------------------------------------------------------------------------
+def parse_keyword_args(args) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Convert a list of 'keyword=value' strings to a dictionary of parser keyword arguments. Values are
+   evaluated as python literals where possible, otherwise they are retained as plain strings.
+   """
+   kwargs = {}
+   for arg in args :
+      key, val = arg.split('=', 1)
+      try :
+         kwargs[key] = ast.literal_eval(val)
+      except (ValueError, SyntaxError) :
+         kwargs[key] = val
+   return kwargs
+
+#---------------------------------------------------------------------------------------------------
+def main(argv=None) :
+#---------------------------------------------------------------------------------------------------
+   """
+   Command-line entry point. Converts one or more CDL files, specified as pathnames or glob
+   patterns, to netCDF files, optionally fanning the work out across a pool of worker processes.
+   Any trailing keyword=value arguments are passed to the CDL3Parser constructor. A per-file summary
+   of timings and failures is printed on completion. Returns the exit status, which is 1 if any
+   file failed to convert, 0 otherwise.
+   """
+   argparser = argparse.ArgumentParser(prog='cdlparser',
+      description="Convert CDL files to netCDF files.")
+   argparser.add_argument('inputs', nargs='+', metavar='cdlfile',
+      help="CDL file or glob pattern, optionally followed by keyword=value parser options")
+   argparser.add_argument('-o', '--outdir',
+      help="directory to receive the netCDF files, which are named after the CDL files "
+           "[default: named after each dataset and saved alongside its CDL file]")
+   argparser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+      help="number of worker processes to use [default: 1]")
+   argparser.add_argument('--cache-dir', metavar='DIR',
+      help="directory in which to cache the netCDF output so that unchanged CDL files need not be "
+           "parsed again [default: no caching]")
+   opts, extras = argparser.parse_known_args(argv)
+   args = opts.inputs + extras
+
+   patterns = [x for x in args if '=' not in x]
+   kwargs = parse_keyword_args([x for x in args if '=' in x])
+   options = [x for x in patterns if x.startswith('-')]
+   if options : argparser.error("unrecognized arguments: %s" % ' '.join(options))
+   if not patterns : argparser.error("no input CDL files specified")
+
+   tasks = []
+   for cdlfile in expand_paths(patterns) :
+      ncfile = None
+      if opts.outdir :
+         ncname = os.path.splitext(os.path.basename(cdlfile))[0] + '.nc'
+         ncfile = os.path.join(opts.outdir, ncname)
+      tasks.append((cdlfile, ncfile))
+   # CDL files with the same name in different directories would overwrite each other's output
+   targets = {}
+   for cdlfile, ncfile in tasks :
+      if ncfile : targets.setdefault(ncfile, []).append(cdlfile)
+   clashes = [(ncfile, cdlfiles) for ncfile, cdlfiles in targets.items() if len(cdlfiles) > 1]
+   if clashes :
+      argparser.error("output file(s) would be overwritten: %s" % '; '.join("%s from %s" \
+         % (ncfile, ', '.join(cdlfiles)) for ncfile, cdlfiles in clashes))
+   if opts.outdir and not os.path.isdir(opts.outdir) : os.makedirs(opts.outdir)
+
+   start = time.time()
+   if opts.jobs > 1 and len(tasks) > 1 :
+      pool = multiprocessing.Pool(min(opts.jobs, len(tasks)), init_worker, (kwargs, opts.cache_dir))
+      try :
+         chunksize = max(1, len(tasks) // (opts.jobs * 4))
+         results = list(pool.imap(convert_file, tasks, chunksize))
+      finally :
+         pool.close()
+         pool.join()
+   else :
+      init_worker(kwargs, opts.cache_dir)
+      results = [convert_file(task) for task in tasks]
+   elapsed = time.time() - start
+
+   nfailed = 0
+   for cdlfile, ncfile, secs, errmsg in results :
+      if errmsg :
+         nfailed += 1
+         print("FAILED %8.3fs  %s: %s" % (secs, cdlfile, errmsg))
+      else :
+         print("OK     %8.3fs  %s -> %s" % (secs, cdlfile, ncfile))
+   nprocs = max(1, min(opts.jobs, len(tasks)))
+   print("Converted %d of %d file(s) in %.3fs using %d process(es); %d failed" \
+      % (len(results) - nfailed, len(results), elapsed, nprocs, nfailed))
+   return 1 if nfailed else 0
 
 #---------------------------------------------------------------------------------------------------
 if __name__ == '__main__':
 #---------------------------------------------------------------------------------------------------
-   main()
+   sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Unit tests for the appending of CDL data fragments to existing netCDF files.
+"""
+import io
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestAppend(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.header = r"""netcdf append {
+         dimensions:
+            time = unlimited ;
+            x = 3 ;
+            len = 4 ;
+         variables:
+            int time(time) ;
+            float tas(time, x) ;
+               tas:_FillValue = -1.0e30f ;
+            short flag(time) ;
+               flag:missing_value = -9s ;
+            char label(time, len) ;
+            int fixed(x) ;
+         data:
+      """
+      self.tmpdir = tempfile.mkdtemp()
+      self.ncfile = os.path.join(self.tmpdir, 'append.nc')
+      self.reffile = os.path.join(self.tmpdir, 'reference.nc')
+      self.parser = cdlparser.CDL3Parser(close_on_completion=True)
+      self.parser.parse_text(self.header + "time = 1, 2 ; tas = 1, 2, 3, 4, 5, 6 ; }",
+         ncfile=self.ncfile)
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      shutil.rmtree(self.tmpdir)
+
+   def assert_matches(self, data) :
+      """Check that the appended file matches a file created from the header plus data."""
+      self.parser.parse_text(self.header + data + " }", ncfile=self.reffile)
+      with open(self.ncfile, 'rb') as f1, open(self.reffile, 'rb') as f2 :
+         self.assertTrue(f1.read() == f2.read())
+
+   def test_append_records(self) :
+      self.parser.append_text("time = 3 ; tas = 7, 8, 9 ;", self.ncfile)
+      self.parser.append_text("data: time = 4, 5 ; tas = 10 ; flag = 1 ;", self.ncfile)
+      self.assert_matches("time = 1, 2, 3, 4, 5 ;"
+         "tas = 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, _, _, _, _, _ ; flag = _, _, _, 1, -9 ;")
+
+   def test_char_records(self) :
+      self.parser.append_text('label = "abcd", "e" ; time = 3, 4 ;', self.ncfile)
+      self.assert_matches('time = 1, 2, 3, 4 ; tas = 1, 2, 3, 4, 5, 6 ;'
+         'label = "", "", "abcd", "e" ;')
+
+   def test_fixed_variable(self) :
+      self.parser.append_text("fixed = 1, 2, 3 ;", self.ncfile)
+      self.parser.append_text("fixed = 4 ; time = 3 ;", self.ncfile)
+      self.assert_matches("time = 1, 2, 3 ; tas = 1, 2, 3, 4, 5, 6 ; fixed = 4 ;")
+
+   def test_stream_records(self) :
+      parser = cdlparser.CDL3Parser(close_on_completion=True, stream_records=True, chunk_size=8)
+      parser.append_stream(io.StringIO(u"time = 3, 4 ; tas = 7, 8, 9, 10, 11, 12 ;"), self.ncfile)
+      self.assert_matches("time = 1, 2, 3, 4 ; tas = 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12 ;")
+
+   def test_open_dataset(self) :
+      dataset = cdlparser.nc4.Dataset(self.ncfile, 'a')
+      result = self.parser.append_text("time = 3 ;", dataset)
+      self.assertTrue(result is dataset and dataset.isopen())
+      self.assertTrue(np.array_equal(dataset.variables['time'][:], [1, 2, 3]))
+      # the caller's dataset is left open even if parsing fails
+      self.assertRaises(cdlparser.CDLContentError, self.parser.append_text, "nonesuch = 1 ;",
+         dataset)
+      self.assertTrue(dataset.isopen())
+      dataset.close()
+
+   def test_errors(self) :
+      self.assertRaises(cdlparser.CDLSyntaxError, self.parser.append_text,
+         "dimensions: y = 2 ;", self.ncfile)
+      self.assertRaises(cdlparser.CDLContentError, self.parser.append_text,
+         "tas = 1, 2 ;", self.ncfile)
+      # the file was closed after each failure, and so is unchanged
+      self.parser.append_text("", self.ncfile)
+      self.assert_matches("time = 1, 2 ; tas = 1, 2, 3, 4, 5, 6 ;")
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,144 @@
+"""
+Unit tests for the asyncio front end to the CDL parser, and for the cancellation of parsing.
+"""
+import asyncio
+import io
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class BlockingStream(io.StringIO) :
+#---------------------------------------------------------------------------------------------------
+   """A text stream whose reads after the first wait until the release event has been set."""
+   def __init__(self, text) :
+      super(BlockingStream, self).__init__(text)
+      self.started = threading.Event()
+      self.release = threading.Event()
+
+   def read(self, size=-1) :
+      if self.started.is_set() : self.release.wait(10)
+      self.started.set()
+      return super(BlockingStream, self).read(size)
+
+#---------------------------------------------------------------------------------------------------
+class TestAsync(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf asynctest {
+         dimensions:
+            x = 3 ;
+         variables:
+            int a(x) ;
+            int b(x) ;
+         data:
+            a = 1, 2, 3 ;
+            b = 4, 5, 6 ;
+      }"""
+      self.tmpdir = tempfile.mkdtemp()
+      self.loop = asyncio.new_event_loop()
+      asyncio.set_event_loop(self.loop)
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      asyncio.set_event_loop(None)
+      self.loop.close()
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      shutil.rmtree(self.tmpdir)
+
+   def ncfile(self, i) :
+      return os.path.join(self.tmpdir, '%d.nc' % i)
+
+   def start(self, submit) :
+      """Call submit, which starts parsing operations, in the event loop and return its result."""
+      async def call() :
+         return submit()
+      return self.loop.run_until_complete(call())
+
+   def test_concurrent_parses(self) :
+      aparser = cdlparser.AsyncCDLParser(max_concurrency=2)
+      futures = self.start(lambda: [aparser.parse_text(self.cdltext, ncfile=self.ncfile(i))
+         for i in range(6)])
+      datasets = self.loop.run_until_complete(asyncio.gather(*futures))
+      for i, dataset in enumerate(datasets) :
+         self.assertTrue(dataset.filepath() == self.ncfile(i))
+         self.assertTrue(np.array_equal(dataset.variables['b'][:], [4, 5, 6]))
+         dataset.close()
+      aparser.close()
+
+   def test_in_memory(self) :
+      parser = cdlparser.CDL3Parser(in_memory=True)
+      expected = bytes(parser.parse_text(self.cdltext))
+      aparser = cdlparser.AsyncCDLParser(parser, max_concurrency=1)
+      actual = self.loop.run_until_complete(self.start(lambda: aparser.parse_text(self.cdltext)))
+      self.assertTrue(bytes(actual) == expected)
+      aparser.close()
+
+   def test_cancel_queued(self) :
+      aparser = cdlparser.AsyncCDLParser(max_concurrency=1)
+      stream = BlockingStream(self.cdltext)
+      running = self.start(lambda: aparser.parse_stream(stream, ncfile=self.ncfile(0)))
+      queued = self.start(lambda: aparser.parse_text(self.cdltext, ncfile=self.ncfile(1)))
+      queued.cancel()
+      # let the loop pass the cancellation on to the executor before the first parse can finish
+      self.loop.run_until_complete(asyncio.sleep(0))
+      stream.release.set()
+      self.loop.run_until_complete(running).close()
+      self.assertRaises(asyncio.CancelledError, self.loop.run_until_complete, queued)
+      aparser.close()
+      self.assertFalse(os.path.exists(self.ncfile(1)))
+
+   def test_cancel_running(self) :
+      aparser = cdlparser.AsyncCDLParser(cdlparser.CDL3Parser(chunk_size=16), max_concurrency=1)
+      stream = BlockingStream(self.cdltext)
+      future = self.start(lambda: aparser.parse_stream(stream, ncfile=self.ncfile(0)))
+      self.assertTrue(stream.started.wait(10))
+      future.cancel()
+      self.assertRaises(asyncio.CancelledError, self.loop.run_until_complete, future)
+      stream.release.set()
+      aparser.close()
+      # parsing stopped at the first declaration read after the cancellation
+      self.assertFalse(os.path.exists(self.ncfile(0)))
+
+   def test_stats(self) :
+      parser = cdlparser.CDL3Parser(close_on_completion=True, collect_stats=True)
+      aparser = cdlparser.AsyncCDLParser(parser, max_concurrency=2)
+      futures = self.start(lambda: [aparser.parse_text(self.cdltext, ncfile=self.ncfile(i))
+         for i in range(2)])
+      self.loop.run_until_complete(asyncio.gather(*futures))
+      aparser.close()
+      # each operation's stats belong to the parser copy attached to its future
+      for future in futures :
+         self.assertTrue(future.parser.stats.values_written == {'a': 3, 'b': 3})
+      self.assertTrue(parser.stats is None)
+
+   def test_executor(self) :
+      import concurrent.futures
+      executor = concurrent.futures.ThreadPoolExecutor(1)
+      aparser = cdlparser.AsyncCDLParser(executor=executor)
+      future = self.start(lambda: aparser.parse_text(self.cdltext, ncfile=self.ncfile(0)))
+      self.loop.run_until_complete(future).close()
+      aparser.close()
+      self.assertTrue(os.path.exists(self.ncfile(0)))
+      # the executor's own limit applies, so a separate limit is rejected
+      self.assertRaises(ValueError, cdlparser.AsyncCDLParser, executor=executor, max_concurrency=2)
+      executor.shutdown()
+      # parsing operations can only be started from within the event loop
+      self.assertRaises(RuntimeError, cdlparser.AsyncCDLParser().parse_text, self.cdltext)
+
+   def test_cancel_event(self) :
+      event = threading.Event()
+      event.set()
+      parser = cdlparser.CDL3Parser(cancel_event=event)
+      self.assertRaises(cdlparser.CDLParseCancelled, parser.parse_text, self.cdltext,
+         ncfile=self.ncfile(0))
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,73 @@
+"""
+Unit tests for the batch conversion command-line interface.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import cdlparser
+import six
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class TestBatch(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.outdir = tempfile.mkdtemp()
+      self.stdout = sys.stdout
+      sys.stdout = six.StringIO()
+
+   def tearDown(self) :
+      sys.stdout = self.stdout
+      shutil.rmtree(self.outdir)
+
+   def test_parallel_conversion(self) :
+      pattern = os.path.join(TESTFILE_DIR, '[bc]*s.cdl')
+      status = cdlparser.main(['-j', '2', '-o', self.outdir, pattern, 'file_format=NETCDF3_64BIT'])
+      self.assertTrue(status == 0)
+      self.assertTrue(sorted(os.listdir(self.outdir)) ==
+         ['basics.nc', 'charvars.nc', 'constants.nc'])
+      ncdataset = cdlparser.nc4.Dataset(os.path.join(self.outdir, 'basics.nc'))
+      self.assertTrue(ncdataset.file_format == 'NETCDF3_64BIT_OFFSET')
+      ncdataset.close()
+      self.assertTrue("Converted 3 of 3 file(s)" in sys.stdout.getvalue())
+
+   def test_failures(self) :
+      cdlfiles = [os.path.join(TESTFILE_DIR, name)
+         for name in ('basics.cdl', 'bad_int.cdl', 'nosuchfile.cdl')]
+      status = cdlparser.main(['-o', self.outdir] + cdlfiles)
+      self.assertTrue(status == 1)
+      summary = sys.stdout.getvalue()
+      self.assertTrue("CDLSyntaxError" in summary)
+      self.assertTrue("nosuchfile.cdl" in summary)
+      self.assertTrue("Converted 1 of 3 file(s)" in summary)
+
+   def test_duplicate_outputs(self) :
+      indir = tempfile.mkdtemp()
+      stderr = sys.stderr
+      sys.stderr = six.StringIO()
+      try :
+         cdlfiles = []
+         for subdir in ('x', 'y') :
+            os.mkdir(os.path.join(indir, subdir))
+            cdlfiles.append(os.path.join(indir, subdir, 'a.cdl'))
+            shutil.copy(os.path.join(TESTFILE_DIR, 'basics.cdl'), cdlfiles[-1])
+         with self.assertRaises(SystemExit) as cm :
+            cdlparser.main(['-o', self.outdir] + cdlfiles)
+         self.assertTrue(cm.exception.code == 2)
+         self.assertTrue(os.path.join(self.outdir, 'a.nc') in sys.stderr.getvalue())
+         self.assertTrue(os.listdir(self.outdir) == [])
+      finally :
+         sys.stderr = stderr
+         shutil.rmtree(indir)
+
+   def test_keyword_args(self) :
+      kwargs = cdlparser.parse_keyword_args(['log_level=40', 'file_format=NETCDF4', "x='a=b'"])
+      self.assertTrue(kwargs == {'log_level': 40, 'file_format': 'NETCDF4', 'x': 'a=b'})
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
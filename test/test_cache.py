@@ -0,0 +1,100 @@
+"""
+Unit tests for the content-addressed cache of netCDF files generated from CDL input.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestConversionCache(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf cached {
+         dimensions:
+            x = 4 ;
+         variables:
+            float tas(x) ;
+               tas:units = "K" ;
+         data:
+            tas = 1, 2, 3, 4 ;
+      }"""
+      self.tmpdir = tempfile.mkdtemp()
+      self.cache = cdlparser.ConversionCache(os.path.join(self.tmpdir, 'cache'))
+      self.ncfile = os.path.join(self.tmpdir, 'out.nc')
+
+   def tearDown(self) :
+      shutil.rmtree(self.tmpdir)
+
+   def check_dataset(self, ncfile) :
+      dataset = cdlparser.nc4.Dataset(ncfile)
+      self.assertTrue(np.array_equal(dataset.variables['tas'][:], [1, 2, 3, 4]))
+      self.assertTrue(dataset.variables['tas'].units == "K")
+      dataset.close()
+
+   def test_hit_and_miss(self) :
+      parser = cdlparser.CDL3Parser(close_on_completion=True, cache=self.cache)
+      parser.parse_text(self.cdltext, ncfile=self.ncfile)
+      os.remove(self.ncfile)
+      parser.parse_text(self.cdltext, ncfile=self.ncfile)
+      self.check_dataset(self.ncfile)
+      stats = self.cache.stats()
+      self.assertTrue((stats['hits'], stats['misses'], stats['stores']) == (1, 1, 1))
+      self.assertTrue(stats['entries'] == 1)
+      # different output options give a different cache key
+      parser = cdlparser.CDL3Parser(close_on_completion=True, cache=self.cache,
+         file_format='NETCDF4_CLASSIC')
+      parser.parse_text(self.cdltext, ncfile=self.ncfile)
+      self.assertTrue(self.cache.stats()['misses'] == 2)
+
+   def test_file_and_text_share_key(self) :
+      cdlfile = os.path.join(self.tmpdir, 'cached.cdl')
+      with open(cdlfile, 'w') as f :
+         f.write(self.cdltext)
+      parser = cdlparser.CDL3Parser(cache=self.cache)
+      parser.parse_text(self.cdltext, ncfile=self.ncfile).close()
+      dataset = parser.parse_file(cdlfile)
+      self.assertTrue(self.cache.hits == 1)
+      self.assertTrue(parser.ncfile == os.path.join(self.tmpdir, 'cached.nc'))
+      self.assertTrue(dataset.variables['tas'][2] == 3)
+      dataset.close()
+
+   def test_in_memory(self) :
+      parser = cdlparser.CDL3Parser(in_memory=True, cache=self.cache)
+      expected = bytes(parser.parse_text(self.cdltext))
+      actual = bytes(parser.parse_text(self.cdltext))
+      self.assertTrue(actual == expected)
+      self.assertTrue(self.cache.hits == 1)
+
+   def test_hardlink(self) :
+      cache = cdlparser.ConversionCache(self.cache.cachedir, hardlink=True)
+      parser = cdlparser.CDL3Parser(close_on_completion=True, cache=cache)
+      parser.parse_text(self.cdltext, ncfile=self.ncfile)
+      dataset = cdlparser.CDL3Parser(cache=cache).parse_text(self.cdltext, ncfile=self.ncfile)
+      self.assertTrue(os.stat(self.ncfile).st_nlink == 2)
+      self.assertTrue(dataset.variables['tas'][0] == 1)
+      dataset.close()
+
+   def test_eviction(self) :
+      cache = cdlparser.ConversionCache(self.cache.cachedir, max_entries=2)
+      parser = cdlparser.CDL3Parser(close_on_completion=True, cache=cache)
+      for i in range(4) :
+         parser.parse_text(self.cdltext.replace('"K"', '"K%d"' % i), ncfile=self.ncfile)
+      stats = cache.stats()
+      self.assertTrue(stats['entries'] == 2)
+      self.assertTrue(stats['evictions'] == 2)
+      cache.clear()
+      self.assertTrue(cache.stats()['entries'] == 0)
+
+   def test_header_only_bypasses_cache(self) :
+      parser = cdlparser.CDL3Parser(header_only=True, cache=self.cache)
+      header = parser.parse_text(self.cdltext)
+      self.assertTrue(isinstance(header, cdlparser.CDLDataset))
+      self.assertTrue(self.cache.stats()['misses'] == 0)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
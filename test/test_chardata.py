@@ -0,0 +1,146 @@
+"""
+Unit tests for the data of character variables, which are accumulated in a CharBuffer and may be
+lexed as runs of strings.
+"""
+import io
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestCharData(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = u"""netcdf chardata {
+         dimensions:
+            rec = unlimited ;
+            n = 3 ;
+            len = 4 ;
+         variables:
+            int id(rec) ;
+            char code(rec, n, len) ;
+            char label(n, len) ;
+               label:_FillValue = "x" ;
+            int num(n) ;
+         data:
+            id = 1, 2 ;
+            code = "ACTG", "AC", "ATGCAT",
+                   "", "G\\tA", "TGCA" ;
+            label = "ab", "é" ;
+            num = 1, 2, 3 ;
+      }"""
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def parse(self, cdltext, **kwargs) :
+      parser = cdlparser.CDL3Parser(close_on_completion=True, **kwargs)
+      parser.parse_text(cdltext, ncfile=self.tmpfile)
+      dataset = cdlparser.nc4.Dataset(self.tmpfile)
+      dataset.set_auto_maskandscale(False)
+      return dataset
+
+   def test_string_runs(self) :
+      parser = cdlparser.CDL3Parser()
+      parser.lexer.input(u'data: v = "ab", "c d",\n "e" ; w = "f\\n", "g" ;')
+      tokens = [(tok.type, tok.value) for tok in iter(parser.lexer.token, None)]
+      self.assertTrue(('STRING_RUN', ['ab', 'c d', 'e']) in tokens)
+      # strings with escapes are lexed individually
+      self.assertTrue(('TERMSTRING', 'f\n') in tokens)
+      self.assertTrue(('TERMSTRING', 'g') in tokens)
+      self.assertTrue(parser.lexer.lineno == 2)
+
+   def test_char_data(self) :
+      for kwargs in ({}, {'stream_records': True}, {'write_queue_size': 2}) :
+         dataset = self.parse(self.cdltext, **kwargs)
+         code = cdlparser.nc4.chartostring(dataset.variables['code'][:])
+         self.assertTrue(code.tolist() == [['ACTG', 'AC', 'ATGC'], ['', 'G\tA', 'TGCA']])
+         label = dataset.variables['label'][:]
+         self.assertTrue(label.tobytes() == b'ab\0\0\xc3\xa9\0\0x\0\0\0')
+         dataset.close()
+
+   def test_matches_strings(self) :
+      # the same strings given one at a time, each followed by a comment
+      cdltext = self.cdltext.replace(u'",', u'", // comment\n')
+      self.parse(cdltext).close()
+      with open(self.tmpfile, 'rb') as f :
+         expected = f.read()
+      self.parse(self.cdltext).close()
+      with open(self.tmpfile, 'rb') as f :
+         self.assertTrue(f.read() == expected)
+
+   def test_memory_map(self) :
+      cdlfile = tempfile.mkstemp(suffix='.cdl')[1]
+      try :
+         with io.open(cdlfile, 'w', encoding='utf-8') as f :
+            f.write(self.cdltext.replace(u'"ab", "é"', u'"ab", "é", "ü"'))
+         parser = cdlparser.CDL3Parser(close_on_completion=True, memory_map=True)
+         parser.parse_file(cdlfile, ncfile=self.tmpfile)
+      finally :
+         os.remove(cdlfile)
+      dataset = cdlparser.nc4.Dataset(self.tmpfile)
+      dataset.set_auto_maskandscale(False)
+      label = dataset.variables['label'][:]
+      self.assertTrue(label.tobytes() == u'ab\0\0é\0\0ü\0\0'.encode('utf-8'))
+      dataset.close()
+
+   def test_fill_string(self) :
+      cdltext = self.cdltext.replace(u'"ab", "é"', u'"ab", "_", "c"')
+      dataset = self.parse(cdltext)
+      self.assertTrue(dataset.variables['label'][:].tobytes() == b'ab\0\0_\0\0\0c\0\0\0')
+      dataset.close()
+
+   def test_strings_in_numeric_variable(self) :
+      dataset = self.parse(self.cdltext.replace(u'1, 2, 3', u'"1", "2", "3"'))
+      self.assertTrue(np.array_equal(dataset.variables['num'][:], [1, 2, 3]))
+      dataset.close()
+      cdltext = self.cdltext.replace(u'1, 2, 3', u'"1", "two", "3"')
+      self.assertRaises(cdlparser.CDLContentError, self.parse, cdltext)
+
+   def test_stream_records(self) :
+      # enough strings to fill a CharRecordBuffer several times over, ending with a partial record
+      strings = [u'"s%d"' % i if i % 100 else u'"", "truncated", "é"' for i in range(1, 3002)]
+      cdltext = u"""netcdf streamchars {
+         dimensions:
+            rec = unlimited ;
+            n = 3 ;
+            len = 4 ;
+         variables:
+            int id(rec) ;
+            char code(rec, n, len) ;
+         data:
+            id = %s ;
+            code = %s ;
+      }""" % (u', '.join(str(i) for i in range(1100)), u', '.join(strings))
+      self.parse(cdltext).close()
+      with open(self.tmpfile, 'rb') as f :
+         expected = f.read()
+      for kwargs in ({'chunk_size': 256}, {'write_queue_size': 2}) :
+         dataset = self.parse(cdltext, stream_records=True, **kwargs)
+         code = dataset.variables['code'][:]
+         self.assertTrue(code[0].tobytes() == b's1\0\0s2\0\0s3\0\0')
+         self.assertTrue(code[33].tobytes() == b'\0\0\0\0trun\xc3\xa9\0\0')
+         self.assertTrue(code[34].tobytes() == b's101s102s103')
+         # the strings missing from the last records are null-filled
+         self.assertTrue(code[1020].tobytes() == b's300' + b'\0' * 8)
+         self.assertTrue(code[1099].tobytes() == b'\0' * 12)
+         dataset.close()
+         with open(self.tmpfile, 'rb') as f :
+            self.assertTrue(f.read() == expected)
+
+   def test_char_buffer(self) :
+      buf = cdlparser.CharBuffer(3)
+      buf.append(u'abcd')
+      buf.extend([u'', b'x', 7])
+      buf.pad(6, u'-')
+      self.assertTrue(len(buf) == 6)
+      self.assertTrue(buf.values().shape == (6, 3))
+      self.assertTrue(buf.values().tobytes() == b'abc\0\0\0x\0\x007\0\0-\0\0-\0\0')
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,104 @@
+"""
+Unit tests for concurrent use of a single parser instance from multiple threads.
+"""
+import os
+import logging
+import tempfile
+import threading
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestConcurrency(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.nfiles = 8
+      self.parser = cdlparser.CDL3Parser(close_on_completion=True)
+      self.tmpfiles = [tempfile.mkstemp(suffix='.nc')[1] for i in range(self.nfiles)]
+
+   def tearDown(self) :
+      for tmpfile in self.tmpfiles :
+         if os.path.exists(tmpfile) : os.remove(tmpfile)
+
+   def make_cdl(self, n) :
+      values = ", ".join([str(n*1000 + i) for i in range(200*(n+1))])
+      return r"""netcdf concurrency%d {
+         dimensions:
+            time = unlimited ;
+         variables:
+            int time(time) ;
+               time:index = %d ;
+         data:
+            time = %s ;
+      }""" % (n, n, values)
+
+   def test_thread_pool(self) :
+      errors = []
+      def worker(n) :
+         try :
+            self.parser.parse_text(self.make_cdl(n), ncfile=self.tmpfiles[n])
+         except Exception as exc :
+            errors.append(exc)
+      threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.nfiles)]
+      for thread in threads : thread.start()
+      for thread in threads : thread.join()
+      self.assertTrue(errors == [])
+      for n in range(self.nfiles) :
+         ncdataset = cdlparser.nc4.Dataset(self.tmpfiles[n])
+         var = ncdataset.variables['time']
+         self.assertTrue(var.getncattr('index') == n)
+         self.assertTrue(np.array_equal(var[:], np.arange(200*(n+1)) + n*1000))
+         ncdataset.close()
+
+   def test_open_datasets(self) :
+      # each thread must get back its own dataset, however its netCDF calls interleave with others
+      parser = cdlparser.CDL3Parser()
+      cdltexts = [self.make_cdl(n) for n in range(self.nfiles)]
+      for i in range(20) :
+         results = {}
+         def worker(n) :
+            results[n] = parser.parse_text(cdltexts[n], ncfile=self.tmpfiles[n])
+         threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.nfiles)]
+         for thread in threads : thread.start()
+         for thread in threads : thread.join()
+         for n in range(self.nfiles) :
+            self.assertTrue(results[n].filepath() == self.tmpfiles[n])
+            self.assertTrue(results[n].variables['time'].getncattr('index') == n)
+            results[n].close()
+
+   def test_fills_and_appends(self) :
+      # fill values, padding and appended records all query the variables' metadata
+      cdltexts = [self.make_cdl(n).replace("int time(time) ;",
+         "int time(time) ; float tas(time) ; tas:_FillValue = -1.0f ;").replace(
+         "data:", "data: tas = _, 1 ;") for n in range(self.nfiles)]
+      errors = []
+      def worker(n) :
+         try :
+            self.parser.parse_text(cdltexts[n], ncfile=self.tmpfiles[n])
+            for i in range(5) :
+               self.parser.append_text("time = %d ; tas = _ ;" % i, self.tmpfiles[n])
+         except Exception as exc :
+            errors.append(exc)
+      threads = [threading.Thread(target=worker, args=(n,)) for n in range(self.nfiles)]
+      for thread in threads : thread.start()
+      for thread in threads : thread.join()
+      self.assertTrue(errors == [])
+      for n in range(self.nfiles) :
+         ncdataset = cdlparser.nc4.Dataset(self.tmpfiles[n])
+         ncdataset.set_auto_mask(False)
+         tas = ncdataset.variables['tas'][:]
+         self.assertTrue(len(tas) == 200*(n+1) + 5)
+         self.assertTrue(tas[1] == 1 and np.all(tas[2:] == -1) and tas[0] == -1)
+         ncdataset.close()
+
+   def test_single_log_handler(self) :
+      for i in range(3) : cdlparser.CDL3Parser()
+      logger = logging.getLogger('cdlparser')
+      handlers = [h for h in logger.handlers if getattr(h, 'cdlparser_console', False)]
+      self.assertTrue(len(handlers) == 1)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
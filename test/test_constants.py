@@ -130,6 +130,58 @@ class TestConstants(unittest.TestCase) :
       self.assertTrue(data[1] == np.float32(2.0))
       self.assertTrue(data[2] is np.ma.masked)
 
+#---------------------------------------------------------------------------------------------------
+class TestLiteralConversion(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.parser = cdlparser.CDL3Parser()
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def parse_data(self, datatext) :
+      cdltext = r"""netcdf literals {
+         dimensions:
+            x = 0x4 ;
+         variables:
+            byte bvar(x) ;
+            short svar(x) ;
+            int ivar(x) ;
+            double dvar(x) ;
+         data:
+            %s
+      }""" % datatext
+      return self.parser.parse_text(cdltext, ncfile=self.tmpfile)
+
+   def test_data_constants(self) :
+      dataset = self.parse_data(r"""bvar = 1b, 'a', '\n', -128b ;
+            svar = 0xFs, 017s, -3s, 32767s ;
+            ivar = 010, 0x10, -10, 1s ;
+            dvar = 1, 2.5f, 3.0d, 017 ;""")
+      self.assertTrue(dataset.variables['bvar'][:].tolist() == [1, 97, 10, -128])
+      self.assertTrue(dataset.variables['svar'][:].tolist() == [15, 15, -3, 32767])
+      self.assertTrue(dataset.variables['ivar'][:].tolist() == [8, 16, -10, 1])
+      self.assertTrue(dataset.variables['dvar'][:].tolist() == [1.0, 2.5, 3.0, 15.0])
+      self.assertTrue(len(dataset.dimensions['x']) == 4)
+      dataset.close()
+
+   def test_out_of_range_constants(self) :
+      for datatext in ("bvar = 128b ;", "svar = -32769s ;", "ivar = 2147483648 ;",
+            "ivar = 0x1FFFFFFFFFFFFFFFF ;") :
+         self.assertRaises(cdlparser.CDLContentError, self.parse_data, datatext)
+
+   def test_bad_octal_constant(self) :
+      self.assertRaises(cdlparser.CDLContentError, self.parse_data, "ivar = 1, 2, 09 ;")
+
+   def test_convert_literals(self) :
+      values = cdlparser.convert_literals('SHORT_CONST', ['1s', '-0x10S', '010s'])
+      self.assertTrue(values.dtype == np.int16)
+      self.assertTrue(values.tolist() == [1, -16, 8])
+      values = cdlparser.convert_literals('FLOAT_CONST', ['1.5f', '2e3F'])
+      self.assertTrue(values.dtype == np.float32)
+      self.assertTrue(values.tolist() == [1.5, 2000.0])
+
 #---------------------------------------------------------------------------------------------------
 if __name__ == '__main__':
 #---------------------------------------------------------------------------------------------------
@@ -0,0 +1,141 @@
+"""
+Unit tests for the accumulation of large and partial data arrays.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestDataSections(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.nrecs = 1500
+      values = ", ".join(["%d.5" % i for i in range(self.nrecs*2)])
+      cdltext = r"""netcdf datasections {
+         dimensions:
+            x = 2 ;
+            y = 4 ;
+            time = unlimited ;
+         variables:
+            double time(time) ;
+            float tas(time, x) ;
+            short count(x, y) ;
+            int partial(y) ;
+         data:
+            tas = %s ;
+            count = 1s, 2s, 3s, 4s, 5s, 6s, 7s, 8s ;
+            partial = 1, 2 ;
+      }""" % values
+      parser = cdlparser.CDL3Parser()
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+      self.dataset = parser.parse_text(cdltext, ncfile=self.tmpfile)
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def test_growable_record_variable(self) :
+      self.assertTrue(len(self.dataset.dimensions['time']) == self.nrecs)
+      data = self.dataset.variables['tas'][:]
+      self.assertTrue(data.shape == (self.nrecs, 2))
+      expected = np.arange(self.nrecs*2, dtype=np.float32) + np.float32(0.5)
+      expected.shape = (self.nrecs, 2)
+      self.assertTrue(np.array_equal(data, expected))
+
+   def test_preallocated_variable(self) :
+      data = self.dataset.variables['count'][:]
+      self.assertTrue(data.dtype == np.int16)
+      expected = np.arange(1, 9, dtype=np.int16)
+      expected.shape = (2,4)
+      self.assertTrue(np.array_equal(data, expected))
+
+   def test_partial_variable(self) :
+      data = self.dataset.variables['partial'][:]
+      self.assertTrue(data[0] == 1 and data[1] == 2)
+      self.assertTrue(data[2] is np.ma.masked)
+      self.assertTrue(data[3] is np.ma.masked)
+
+   def test_data_buffer(self) :
+      buf = cdlparser.DataBuffer('f', 2)
+      buf.append(1.0)
+      buf.extend([2.0, 3.0, 4.0])
+      self.assertTrue(len(buf) == 4)
+      self.assertTrue(buf.values().dtype == np.float32)
+      self.assertTrue(np.array_equal(buf.values(), [1.0, 2.0, 3.0, 4.0]))
+
+#---------------------------------------------------------------------------------------------------
+class TestNumericRuns(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.parser = cdlparser.CDL3Parser()
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def test_mixed_data_values(self) :
+      cdltext = r"""netcdf numericruns {
+         dimensions:
+            x = 10 ;
+         variables:
+            double dvar(x) ;
+            int ivar(x) ;
+         data:
+            dvar = 1, 2,
+               // an embedded comment
+               3.5, _, 4.5f, 6e1, -7.25d, 8, 9, .5 ;
+            ivar = 0x10, 017, 1, 2, 3.9, _, -4, 5s, 6, 0 ;
+      }"""
+      dataset = self.parser.parse_text(cdltext, ncfile=self.tmpfile)
+      data = dataset.variables['dvar'][:]
+      self.assertTrue(data[3] is np.ma.masked)
+      expected = [1.0, 2.0, 3.5, 0.0, 4.5, 60.0, -7.25, 8.0, 9.0, 0.5]
+      for i in (0, 1, 2, 4, 5, 6, 7, 8, 9) :
+         self.assertTrue(data[i] == expected[i])
+      data = dataset.variables['ivar'][:]
+      self.assertTrue(data[5] is np.ma.masked)
+      expected = [16, 15, 1, 2, 3, 0, -4, 5, 6, 0]
+      for i in (0, 1, 2, 3, 4, 6, 7, 8, 9) :
+         self.assertTrue(data[i] == expected[i])
+
+   def test_integer_out_of_range(self) :
+      cdltext = r"""netcdf numericruns {
+         dimensions:
+            x = 3 ;
+         variables:
+            int ivar(x) ;
+         data:
+            ivar = 1, 2147483648, 3 ;
+      }"""
+      self.assertRaises(cdlparser.CDLContentError, self.parser.parse_text, cdltext,
+         ncfile=self.tmpfile)
+
+   def test_suffixed_run_tokens(self) :
+      lexer = self.parser.new_context().lexer
+      lexer.input("data: v = 1s, _, 0x10s, -2s ; w = 1.5f, 2e3F, 3.5d ;")
+      tokens = [tok for tok in iter(lexer.token, None)]
+      self.assertTrue([tok.type for tok in tokens] == ['DATA', 'IDENT', 'EQUALS', 'NUMERIC_RUN',
+         'EOL', 'IDENT', 'EQUALS', 'NUMERIC_RUN', 'EOL'])
+      run = tokens[3].value
+      self.assertTrue(run.tags == ['SHORT_CONST', 'FILLVALUE', 'SHORT_CONST', 'SHORT_CONST'])
+      self.assertTrue(run.values(np.int16, -1).tolist() == [1, -1, 16, -2])
+      self.assertTrue(tokens[7].value.values(np.float64).tolist() == [1.5, 2000.0, 3.5])
+
+   def test_invalid_constant_in_run(self) :
+      cdltext = r"""netcdf numericruns {
+         dimensions:
+            x = 3 ;
+         variables:
+            double dvar(x) ;
+         data:
+            dvar = 1s, 2s, 3q ;
+      }"""
+      with self.assertRaises(cdlparser.CDLSyntaxError) as cm :
+         self.parser.parse_text(cdltext, ncfile=self.tmpfile)
+      self.assertTrue("value = 'q'" in str(cm.exception))
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
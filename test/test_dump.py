@@ -0,0 +1,94 @@
+"""
+Unit tests for the CDLDumper class, which writes netCDF datasets as CDL text.
+"""
+import glob
+import logging
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class TestDump(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.tmpfiles = [tempfile.mkstemp(suffix='.nc')[1] for i in range(2)]
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      for tmpfile in self.tmpfiles :
+         if os.path.exists(tmpfile) : os.remove(tmpfile)
+
+   def round_trip(self, cdltext, **kwargs) :
+      """Check that dumping the dataset made from cdltext and parsing it gives the same file."""
+      parser = cdlparser.CDL3Parser(close_on_completion=True)
+      parser.parse_text(cdltext, ncfile=self.tmpfiles[0])
+      dumped = cdlparser.CDLDumper(**kwargs).dumps(self.tmpfiles[0])
+      parser.parse_text(dumped, ncfile=self.tmpfiles[1])
+      with open(self.tmpfiles[0], 'rb') as f1, open(self.tmpfiles[1], 'rb') as f2 :
+         self.assertTrue(f1.read() == f2.read(), dumped)
+      return dumped
+
+   def test_corpus(self) :
+      for filename in ('basics.cdl', 'charvars.cdl', 'constants.cdl', 'fillvalue.cdl',
+         'escaped_ncname.cdl', 'scalars.cdl', 'unlimdim.cdl') :
+         with open(os.path.join(TESTFILE_DIR, filename)) as f :
+            cdltext = f.read()
+         self.round_trip(cdltext)
+         self.round_trip(cdltext, block_size=8, values_per_line=3)
+
+   def test_fill_values(self) :
+      dumped = self.round_trip(r"""netcdf fills {
+         dimensions: x = 4 ;
+         variables:
+            float tas(x) ; tas:_FillValue = -1.0e30f ;
+            short s(x) ;
+            double d(x) ;
+         data: tas = 1, _, 0.1, _ ; s = 1, 2 ;
+      }""")
+      self.assertTrue("tas = 1.0, _, 0.1, _ ;" in dumped)
+      self.assertTrue("s = 1, 2, _, _ ;" in dumped)
+      self.assertTrue("d = _, _, _, _ ;" in dumped)
+
+   def test_attribute_types(self) :
+      dumped = self.round_trip(r"""netcdf atts {
+         variables:
+            int v ;
+            v:b = 1b, -2b ; v:s = 3s ; v:i = 4 ; v:f = 0.1f ; v:d = 1.0e-20, 2.5 ;
+         data: v = 1 ;
+      }""")
+      self.assertTrue("v:b = 1b, -2b ;" in dumped)
+      self.assertTrue("v:f = 0.1f ;" in dumped)
+      self.assertTrue("v:d = 1e-20, 2.5 ;" in dumped)
+
+   def test_escapes(self) :
+      dumped = self.round_trip(r"""netcdf escapes {
+         dimensions: d\ 1 = 2 ; n = 6 ;
+         variables:
+            char c\ x(d\ 1, n) ;
+            c\ x:note = "a \"quoted\" \\ string\n" ;
+         data: c\ x = "tab\t", "q\"" ;
+      }""")
+      self.assertTrue('c\\ x:note = "a \\"quoted\\" \\\\ string\\n" ;' in dumped)
+
+   def test_header_only(self) :
+      cdlparser.CDL3Parser(close_on_completion=True).parse_file(
+         os.path.join(TESTFILE_DIR, 'basics.cdl'), ncfile=self.tmpfiles[0])
+      dumped = cdlparser.CDLDumper(header_only=True).dumps(self.tmpfiles[0], name='basics')
+      self.assertTrue(dumped.startswith("netcdf basics {"))
+      self.assertTrue("data:" not in dumped)
+
+   def test_unsupported_type(self) :
+      dataset = cdlparser.nc4.Dataset(self.tmpfiles[0], 'w', format='NETCDF4')
+      dataset.createVariable('v', np.int64)
+      self.assertRaises(cdlparser.CDLContentError, cdlparser.CDLDumper().dumps, dataset)
+      dataset.close()
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
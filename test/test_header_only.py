@@ -0,0 +1,83 @@
+"""
+Unit tests for the metadata-only (header_only) parsing mode.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class TestHeaderOnly(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      # the data section deliberately contains invalid content, which should never be lexed
+      self.cdltext = r"""netcdf header_only {
+         dimensions:
+            lat = 2 ;
+            name_len = 8 ;
+            time = unlimited ;
+         variables:
+            float tas(time, lat) ;
+               tas:units = "K" ;
+               tas:valid_range = 200.0f, 330.0f ;
+            char name(lat, name_len) ;
+            int count ;
+         // global attributes
+            :title = "header only" ;
+         data:
+            tas = 1, 2, 3, ??? ;
+            no such variable = "abc" ;
+      }"""
+      self.parser = cdlparser.CDL3Parser(header_only=True)
+
+   def check_description(self, dataset) :
+      self.assertTrue(isinstance(dataset, cdlparser.CDLDataset))
+      self.assertTrue(dataset.name == "header_only")
+      self.assertTrue(list(dataset.dimensions) == ['lat', 'name_len', 'time'])
+      self.assertTrue(len(dataset.dimensions['lat']) == 2)
+      self.assertTrue(dataset.dimensions['time'].isunlimited())
+      self.assertTrue(list(dataset.variables) == ['tas', 'name', 'count'])
+      tas = dataset.variables['tas']
+      self.assertTrue(tas.dtype == np.float32)
+      self.assertTrue(tas.dimensions == ('time', 'lat'))
+      self.assertTrue(tas.shape == (0, 2))
+      self.assertTrue(tas.getncattr('units') == "K")
+      self.assertTrue(tas.ncattrs() == ['units', 'valid_range'])
+      self.assertTrue(dataset.variables['name'].dtype == np.dtype('S1'))
+      self.assertTrue(dataset.variables['count'].ndim == 0)
+      self.assertTrue(dataset.getncattr('title') == "header only")
+
+   def test_parse_text(self) :
+      cwd = os.getcwd()
+      tmpdir = tempfile.mkdtemp()
+      try :
+         os.chdir(tmpdir)
+         dataset = self.parser.parse_text(self.cdltext)
+         self.assertTrue(os.listdir(tmpdir) == [])
+      finally :
+         os.chdir(cwd)
+         os.rmdir(tmpdir)
+      self.check_description(dataset)
+
+   def test_parse_stream(self) :
+      tmpfile = tempfile.mkstemp(suffix='.cdl')[1]
+      try :
+         with open(tmpfile, 'w') as f :
+            f.write(self.cdltext)
+         self.parser.chunk_size = 16
+         self.check_description(self.parser.parse_file(tmpfile))
+      finally :
+         os.remove(tmpfile)
+
+   def test_test_files(self) :
+      dataset = self.parser.parse_file(os.path.join(TESTFILE_DIR, 'charvars.cdl'))
+      self.assertTrue(list(dataset.dimensions) == ['nreg', 'namelen'])
+      self.assertTrue(list(dataset.variables) == ['regcodes', 'regions', 'digits', 'letter'])
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
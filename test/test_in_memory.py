@@ -0,0 +1,67 @@
+"""
+Unit tests for building netCDF datasets in memory rather than on disk.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestInMemory(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      values = ", ".join([str(i) for i in range(5000)])
+      self.cdltext = r"""netcdf in_memory {
+         dimensions:
+            time = unlimited ;
+         variables:
+            int time(time) ;
+               time:units = "days since 2000-01-01" ;
+            char label(time) ;
+         // global attributes
+            :title = "in memory" ;
+         data:
+            time = %s ;
+      }""" % values
+
+   def check_buffer(self, ncbuffer) :
+      self.assertTrue(bytes(ncbuffer[:4]) == b"CDF\x01")
+      ncdataset = cdlparser.nc4.Dataset('in_memory.nc', memory=bytes(ncbuffer))
+      try :
+         self.assertTrue(ncdataset.title == "in memory")
+         self.assertTrue(len(ncdataset.dimensions['time']) == 5000)
+         self.assertTrue(np.array_equal(ncdataset.variables['time'][:], np.arange(5000)))
+      finally :
+         ncdataset.close()
+
+   def test_parse_text(self) :
+      cwd = os.getcwd()
+      tmpdir = tempfile.mkdtemp()
+      try :
+         os.chdir(tmpdir)
+         parser = cdlparser.CDL3Parser(in_memory=True)
+         ncbuffer = parser.parse_text(self.cdltext)
+         self.assertTrue(os.listdir(tmpdir) == [])
+      finally :
+         os.chdir(cwd)
+         os.rmdir(tmpdir)
+      self.assertTrue(parser.ncbuffer is ncbuffer)
+      self.check_buffer(ncbuffer)
+
+   def test_matches_file_output(self) :
+      tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+      try :
+         parser = cdlparser.CDL3Parser(close_on_completion=True)
+         parser.parse_text(self.cdltext, ncfile=tmpfile)
+         with open(tmpfile, 'rb') as f :
+            expected = f.read()
+      finally :
+         os.remove(tmpfile)
+      ncbuffer = cdlparser.CDL3Parser(in_memory=True).parse_text(self.cdltext)
+      self.assertTrue(bytes(ncbuffer) == expected)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,75 @@
+"""
+Unit tests comparing the token streams produced by the PLY and fast lexer backends.
+"""
+import glob
+import io
+import logging
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class TestLexers(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def tokens(self, backend, cdltext) :
+      lexer = cdlparser.CDL3Parser(lexer_backend=backend).new_context().lexer
+      lexer.input(cdltext)
+      tokens = []
+      for tok in iter(lexer.token, None) :
+         value = tok.value
+         if isinstance(value, np.ndarray) :
+            value = (value.dtype.str, value.tolist())
+         elif isinstance(value, cdlparser.LiteralRun) :
+            value = (value.tags, value.texts)
+         tokens.append((tok.type, value, tok.lineno, tok.lexpos))
+      return tokens
+
+   def compare_tokens(self, cdltext) :
+      expected = self.tokens('ply', cdltext)
+      actual = self.tokens('fast', cdltext)
+      self.assertTrue(len(actual) == len(expected))
+      for act, exp in zip(actual, expected) :
+         self.assertTrue(act == exp, "%r != %r" % (act, exp))
+
+   def test_corpus(self) :
+      for cdlfile in sorted(glob.glob(os.path.join(TESTFILE_DIR, '*.cdl'))) :
+         with io.open(cdlfile, encoding='utf-8') as f :
+            self.compare_tokens(f.read())
+
+   def test_awkward_input(self) :
+      self.compare_tokens(u"""netcdf awkward {
+         dimensions: d\\ 1 = 2 ; été = unlimited ;
+         variables: int e5f(d\\ 1) ; e5f:a = e5f, 'a', '\\n', .5, -.5e3f, 0x1Fs, 017 ; # @
+            double _x ; _x:b = "str\\"ing" ; // comment
+         data: e5f = 1s, _, 2b, 3 ; _x = _ ; été = 1.5e-5d, 7 ;
+      }""")
+
+   def test_parse_results(self) :
+      for filename in ('basics.cdl', 'charvars.cdl', 'constants.cdl', 'unlimdim.cdl') :
+         cdlfile = os.path.join(TESTFILE_DIR, filename)
+         for backend in cdlparser.LEXER_BACKENDS :
+            parser = cdlparser.CDL3Parser(lexer_backend=backend, in_memory=True)
+            if backend == 'ply' :
+               expected = bytes(parser.parse_file(cdlfile))
+            else :
+               self.assertTrue(bytes(parser.parse_file(cdlfile)) == expected)
+
+   def test_bad_backend(self) :
+      self.assertRaises(ValueError, cdlparser.CDL3Parser, lexer_backend='flex')
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
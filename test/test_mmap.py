@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Unit tests for the parsing of memory-mapped CDL files.
+"""
+import glob
+import io
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class TestMemoryMap(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.tmpdir = tempfile.mkdtemp()
+      self.cdlfile = os.path.join(self.tmpdir, 'mapped.cdl')
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      shutil.rmtree(self.tmpdir)
+
+   def write_cdl(self, cdltext) :
+      with io.open(self.cdlfile, 'w', encoding='utf-8') as f :
+         f.write(cdltext)
+
+   def compare(self, cdlfile, **kwargs) :
+      """Check that parsing cdlfile with and without the memory_map option gives the same result."""
+      outputs = []
+      for memory_map in (False, True) :
+         ncfile = os.path.join(self.tmpdir, 'out%d.nc' % len(outputs))
+         parser = cdlparser.CDL3Parser(close_on_completion=True, memory_map=memory_map, **kwargs)
+         try :
+            parser.parse_file(cdlfile, ncfile=ncfile)
+         except (cdlparser.CDLSyntaxError, cdlparser.CDLContentError) as exc :
+            outputs.append(type(exc))
+            continue
+         with open(ncfile, 'rb') as f :
+            outputs.append(f.read())
+      self.assertTrue(outputs[0] == outputs[1], cdlfile)
+
+   def test_corpus(self) :
+      for cdlfile in sorted(glob.glob(os.path.join(TESTFILE_DIR, '*.cdl'))) :
+         self.compare(cdlfile)
+         self.compare(cdlfile, chunk_size=16, lexer_backend='fast')
+         self.compare(cdlfile, stream_records=True)
+
+   def test_mixed_constants(self) :
+      self.write_cdl(u"""netcdf mixed {
+         dimensions: x = 6 ;
+         variables:
+            int i(x) ; short s(x) ; double d(x) ; float f(x) ;
+         data:
+            i = 1, 012, 0x1f, -0, _, 7 ;
+            s = 1s, 2, 3, 4, 5, 6 ;
+            d = 1.5e-05, -2.0E+010, 00.5, 3,
+                4, 5 ;
+            f = 1, 2, 3 ;
+      }""")
+      self.compare(self.cdlfile)
+      dataset = cdlparser.CDL3Parser(memory_map=True).parse_file(self.cdlfile,
+         ncfile=os.path.join(self.tmpdir, 'mixed.nc'))
+      self.assertTrue(np.array_equal(dataset.variables['i'][:4], [1, 10, 31, 0]))
+      self.assertTrue(np.array_equal(dataset.variables['d'][:], [1.5e-5, -2.0e10, 0.5, 3, 4, 5]))
+      dataset.close()
+
+   def test_non_ascii_names(self) :
+      self.write_cdl(u"""netcdf données {
+         dimensions: x = 2 ;
+         variables:
+            float température(x) ;
+               température:note = "café \\xe9" ;
+         data:
+            température = 1, 2 ;
+      }""")
+      parser = cdlparser.CDL3Parser(memory_map=True)
+      dataset = parser.parse_file(self.cdlfile, ncfile=os.path.join(self.tmpdir, 'utf8.nc'))
+      var = dataset.variables[u'température']
+      self.assertTrue(var.note == u'café \xe9')
+      self.assertTrue(np.array_equal(var[:], [1, 2]))
+      dataset.close()
+
+   def test_non_ascii_names_match(self) :
+      # the same names must be accepted whether or not the file is memory-mapped
+      self.write_cdl(u"""netcdf names {
+         dimensions: x = 2 ; \u0436 = 1 ;
+         variables:
+            double témp(x) ; int \u05d0\u05d1(\u0436) ; byte _\u6e29\u5ea6 ;
+            short \U0001d465 ;
+      }""")
+      self.compare(self.cdlfile)
+      names = []
+      for memory_map in (False, True) :
+         parser = cdlparser.CDL3Parser(close_on_completion=True, memory_map=memory_map)
+         parser.parse_file(self.cdlfile, ncfile=os.path.join(self.tmpdir, 'names.nc'))
+         dataset = cdlparser.nc4.Dataset(os.path.join(self.tmpdir, 'names.nc'))
+         names.append(list(dataset.variables))
+         dataset.close()
+      self.assertTrue(names[0] == names[1])
+      self.assertTrue(names[0] ==
+         [u'témp', u'\u05d0\u05d1', u'_\u6e29\u5ea6', u'\U0001d465'])
+
+   def test_error_line_number(self) :
+      self.write_cdl(u"netcdf lines {\ndimensions: x = 4 ;\nvariables: int v(x) ;\n" \
+         u"data:\n v = 1,\n 2,\n 3, 4 ;\n v = ; }")
+      parser = cdlparser.CDL3Parser(memory_map=True)
+      try :
+         parser.parse_file(self.cdlfile, ncfile=os.path.join(self.tmpdir, 'lines.nc'))
+         self.fail("CDLSyntaxError not raised")
+      except cdlparser.CDLSyntaxError as exc :
+         self.assertTrue("line number 8" in str(exc))
+
+   def test_out_of_range(self) :
+      self.write_cdl(u"netcdf range { variables: int v ; data: v = 2147483648 ; }")
+      parser = cdlparser.CDL3Parser(memory_map=True)
+      self.assertRaises(cdlparser.CDLContentError, parser.parse_file, self.cdlfile,
+         os.path.join(self.tmpdir, 'range.nc'))
+
+   def test_empty_file(self) :
+      self.write_cdl(u"")
+      parser = cdlparser.CDL3Parser(memory_map=True)
+      self.assertRaises(cdlparser.CDLSyntaxError, parser.parse_file, self.cdlfile)
+
+   def test_bytes_read(self) :
+      values = u", ".join([str(i) for i in range(1000)])
+      self.write_cdl(u"netcdf stats { dimensions: x = 1000 ; variables: int v(x) ; data: v = %s ; }"
+         % values)
+      size = os.path.getsize(self.cdlfile)
+      parser = cdlparser.CDL3Parser(close_on_completion=True, memory_map=True, chunk_size=64,
+         collect_stats=True)
+      parser.parse_file(self.cdlfile, os.path.join(self.tmpdir, 'stats.nc'))
+      self.assertTrue(parser.stats.bytes_read == size)
+      # with the header_only option, reading stops at the data section
+      parser = cdlparser.CDL3Parser(memory_map=True, chunk_size=64, header_only=True,
+         collect_stats=True)
+      parser.parse_file(self.cdlfile)
+      self.assertTrue(0 < parser.stats.bytes_read < size)
+
+   def test_parse_numeric_bytes(self) :
+      values = cdlparser.parse_numeric_bytes(b"1, -2,\n 30")
+      self.assertTrue(values.dtype == np.int32 and list(values) == [1, -2, 30])
+      values = cdlparser.parse_numeric_bytes(b"0.5, 1e-05, -1.0E+07")
+      self.assertTrue(values.dtype == np.float64 and list(values) == [0.5, 1e-5, -1e7])
+      for data in (b"1, 012", b"-012, 1", b"1, _", b"1s, 2", b"2147483648", b"1, 2a") :
+         self.assertTrue(cdlparser.parse_numeric_bytes(data) is None, data)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,139 @@
+"""
+Unit tests for the padding of data arrays holding fewer values than their variables.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class RecordingVariable(object) :
+#---------------------------------------------------------------------------------------------------
+   """A stand-in for a netCDF variable which records the shape of each assignment to it."""
+   def __init__(self, shape, dtype) :
+      self.shape = shape
+      self.dtype = np.dtype(dtype)
+      self.data = np.zeros(shape, dtype=dtype)
+      self.writes = []
+
+   def __setitem__(self, index, values) :
+      self.data[index] = values
+      self.writes.append(np.shape(values))
+
+#---------------------------------------------------------------------------------------------------
+class TestPadding(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf padding {
+         dimensions:
+            time = unlimited ;
+            y = 3 ;
+            x = 4 ;
+         variables:
+            int time(time) ;
+            float tas(time, x) ;
+               tas:_FillValue = -1.0e30f ;
+            short grid(y, x) ;
+            double miss(y, x) ;
+               miss:missing_value = -999.0 ;
+         data:
+            time = 1, 2, 3 ;
+            tas = 1, 2, 3, 4, 5 ;
+            grid = 1, 2, 3, 4, 5, 6 ;
+            miss = 1, 2 ;
+      }"""
+      self.tmpdir = tempfile.mkdtemp()
+      self.ncfile = os.path.join(self.tmpdir, 'padding.nc')
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      shutil.rmtree(self.tmpdir)
+
+   def check_dataset(self, dataset) :
+      dataset.set_auto_mask(False)
+      tas = dataset.variables['tas'][:]
+      self.assertTrue(np.array_equal(tas.flat[:5], [1, 2, 3, 4, 5]))
+      self.assertTrue((tas.flat[5:] == np.float32(-1.0e30)).all())
+      grid = dataset.variables['grid'][:]
+      self.assertTrue(np.array_equal(grid[:2], [[1, 2, 3, 4], [5, 6, -32767, -32767]]))
+      self.assertTrue((grid[2] == -32767).all())
+      miss = dataset.variables['miss'][:]
+      self.assertTrue(np.array_equal(miss.flat[:2], [1, 2]) and (miss.flat[2:] == -999).all())
+      dataset.close()
+
+   def test_padding(self) :
+      for file_format in ('NETCDF3_CLASSIC', 'NETCDF4') :
+         parser = cdlparser.CDL3Parser(file_format=file_format, collect_stats=True)
+         self.check_dataset(parser.parse_text(self.cdltext, ncfile=self.ncfile))
+         self.assertTrue(parser.stats.values_padded == {'tas': 7, 'grid': 6, 'miss': 10})
+
+   def test_padding_log(self) :
+      parser = cdlparser.CDL3Parser()
+      with self.assertLogs('cdlparser', logging.INFO) as cm :
+         parser.parse_text(self.cdltext, ncfile=self.ncfile).close()
+      messages = [record.getMessage() for record in cm.records if 'Padded' in record.getMessage()]
+      self.assertTrue(messages == [
+         "Padded input data array with 3 fill values, leaving 4 to the netCDF library's fill mode",
+         "Padded input data array with 0 fill values, leaving 6 to the netCDF library's fill mode",
+         "Padded input data array with 10 fill values"])
+
+   def test_large_variable(self) :
+      # only the values given are held in memory and written; the rest are left to fill mode
+      cdltext = r"""netcdf large {
+         dimensions:
+            x = 1000000000 ;
+            len = 4 ;
+         variables:
+            double v(x) ;
+            char s(x, len) ;
+         data:
+            v = 1, 2, 3 ;
+            s = "ab", "cd" ;
+      }"""
+      parser = cdlparser.CDL3Parser(file_format='NETCDF4', storage={'chunksizes': 'auto'})
+      dataset = parser.parse_text(cdltext, ncfile=self.ncfile)
+      dataset.set_auto_mask(False)
+      v = dataset.variables['v']
+      self.assertTrue(np.array_equal(v[:4], [1, 2, 3, cdlparser.nc4.default_fillvals['f8']]))
+      self.assertTrue((v[-10:] == cdlparser.nc4.default_fillvals['f8']).all())
+      s = dataset.variables['s']
+      self.assertTrue(s[:3].tobytes() == b'ab\0\0cd\0\0\0\0\0\0')
+      self.assertTrue(s[-1].tobytes() == b'\0\0\0\0')
+      dataset.close()
+
+   def test_stream_records(self) :
+      parser = cdlparser.CDL3Parser(stream_records=True, chunk_size=8)
+      self.check_dataset(parser.parse_text(self.cdltext, ncfile=self.ncfile))
+
+   def test_write_queue(self) :
+      parser = cdlparser.CDL3Parser(write_queue_size=2)
+      self.check_dataset(parser.parse_text(self.cdltext, ncfile=self.ncfile))
+
+   def test_update(self) :
+      cdltext = self.cdltext.replace("5, 6 ;", "5, 6, 7, 8, 9, 10, 11, 12 ;")
+      cdlparser.CDL3Parser(close_on_completion=True).parse_text(cdltext, ncfile=self.ncfile)
+      parser = cdlparser.CDL3Parser(update=True)
+      self.check_dataset(parser.parse_text(self.cdltext, ncfile=self.ncfile))
+      self.assertFalse(parser.update_report.rebuilt)
+      self.assertTrue(parser.update_report.changed == ['grid'])
+
+   def test_prefix_writes(self) :
+      var = RecordingVariable((4, 3, 5), 'i4')
+      cdlparser.put_data_prefix(var, np.arange(1, 24))
+      self.assertTrue(var.writes == [(1, 3, 5), (1, 5), (3,)])
+      self.assertTrue(np.array_equal(var.data.flat[:23], np.arange(1, 24)))
+      self.assertTrue((var.data.flat[23:] == 0).all())
+      var = RecordingVariable((4, 3), 'f8')
+      cdlparser.put_data_prefix(var, cdlparser.DataBuffer(np.float64, 6))
+      self.assertTrue(var.writes == [])
+      cdlparser.put_data_prefix(var, [1.5, 2.5])
+      self.assertTrue(var.writes == [(2,)])
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
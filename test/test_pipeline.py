@@ -0,0 +1,83 @@
+"""
+Unit tests for the pipelined writing of netCDF data by a writer thread.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestPipeline(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf pipeline {
+         dimensions:
+            time = unlimited ;
+            x = 3 ;
+            n = 4 ;
+         variables:
+            int time(time) ;
+            float tas(time, x) ;
+               tas:_FillValue = -1.0e30f ;
+            char label(x, n) ;
+            short flag ;
+            double grid(x) ;
+         data:
+            time = 1, 2, 3 ;
+            tas = 1, 2, 3, 4, 5, 6, 7 ;
+            label = "abc", "de", "f" ;
+            flag = 1 ;
+            grid = 0.5, 1.5 ;
+      }"""
+      self.tmpdir = tempfile.mkdtemp()
+      logging.getLogger('cdlparser').setLevel(logging.CRITICAL)
+
+   def tearDown(self) :
+      logging.getLogger('cdlparser').setLevel(cdlparser.DEFAULT_LOG_LEVEL)
+      shutil.rmtree(self.tmpdir)
+
+   def compare(self, **kwargs) :
+      """Check that pipelined writing gives the same file as writing in the parser thread."""
+      ncfile1 = os.path.join(self.tmpdir, 'direct.nc')
+      ncfile2 = os.path.join(self.tmpdir, 'pipelined.nc')
+      cdlparser.CDL3Parser(close_on_completion=True, **kwargs).parse_text(self.cdltext,
+         ncfile=ncfile1)
+      parser = cdlparser.CDL3Parser(close_on_completion=True, write_queue_size=2, **kwargs)
+      parser.parse_text(self.cdltext, ncfile=ncfile2)
+      self.assertFalse([t for t in threading.enumerate() if t.name == 'cdlparser-writer'])
+      with open(ncfile1, 'rb') as f1, open(ncfile2, 'rb') as f2 :
+         self.assertTrue(f1.read() == f2.read())
+
+   def test_identical_output(self) :
+      self.compare()
+
+   def test_stream_records(self) :
+      self.compare(stream_records=True, chunk_size=5)
+
+   def test_netcdf4(self) :
+      self.compare(file_format='NETCDF4_CLASSIC')
+
+   def test_dataset_contents(self) :
+      parser = cdlparser.CDL3Parser(write_queue_size=1)
+      dataset = parser.parse_text(self.cdltext, ncfile=os.path.join(self.tmpdir, 'out.nc'))
+      self.assertTrue(len(dataset.dimensions['time']) == 3)
+      tas = dataset.variables['tas'][:]
+      self.assertTrue(np.array_equal(tas[2].mask, [False, True, True]))
+      self.assertTrue(dataset.variables['flag'][:] == 1)
+      dataset.close()
+
+   def test_write_error(self) :
+      thread = cdlparser.WriterThread(1)
+      thread.start()
+      thread.submit(int, 'not a number')
+      self.assertRaises(cdlparser.CDLContentError, thread.finish)
+      self.assertFalse(thread.is_alive())
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
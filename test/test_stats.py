@@ -0,0 +1,63 @@
+"""
+Unit tests for the statistics collected by a parser created with the collect_stats option.
+"""
+import io
+import os
+import tempfile
+import unittest
+import cdlparser
+
+#---------------------------------------------------------------------------------------------------
+class TestStats(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = u"""netcdf stats {
+         dimensions:
+            x = 4 ;
+            time = unlimited ;
+         variables:
+            float tas(time, x) ;
+               tas:long_name = "température" ;
+            short partial(x) ;
+         data:
+            tas = 1, 2, 3, 4, 5, 6, 7, 8 ;
+            partial = 1s, 2s ;
+      }"""
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def check_stats(self, stats) :
+      self.assertTrue(stats.bytes_read == len(self.cdltext.encode('utf-8')))
+      self.assertTrue(stats.token_counts['TERMSTRING'] == 1)
+      self.assertTrue('SHORT_CONST' not in stats.token_counts)
+      self.assertTrue(stats.token_counts['NUMERIC_RUN'] == 2)
+      self.assertTrue(stats.ntokens == sum(stats.token_counts.values()))
+      self.assertTrue(dict(stats.values_written) == {'tas': 8, 'partial': 2})
+      self.assertTrue(dict(stats.values_padded) == {'partial': 2})
+      self.assertTrue(stats.total_secs > 0)
+      for secs in (stats.lex_secs, stats.netcdf_define_secs, stats.netcdf_write_secs) :
+         self.assertTrue(0 < secs < stats.total_secs)
+      self.assertTrue(stats.as_dict()['grammar_secs'] == stats.grammar_secs)
+
+   def test_parse_text(self) :
+      parser = cdlparser.CDL3Parser(collect_stats=True, close_on_completion=True)
+      parser.parse_text(self.cdltext, ncfile=self.tmpfile)
+      self.check_stats(parser.stats)
+
+   def test_parse_stream(self) :
+      parser = cdlparser.CDL3Parser(collect_stats=True, close_on_completion=True,
+         stream_records=True, chunk_size=32)
+      parser.parse_stream(io.StringIO(self.cdltext), ncfile=self.tmpfile)
+      self.check_stats(parser.stats)
+
+   def test_disabled(self) :
+      parser = cdlparser.CDL3Parser(close_on_completion=True)
+      parser.parse_text(self.cdltext, ncfile=self.tmpfile)
+      self.assertTrue(parser.stats is None)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,92 @@
+"""
+Unit tests for the compression and chunking options for variables in netCDF-4 output files.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+#---------------------------------------------------------------------------------------------------
+class TestStorage(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf storage {
+         dimensions:
+            time = unlimited ;
+            lat = 180 ;
+            lon = 360 ;
+         variables:
+            double time(time) ;
+            float tas(time, lat, lon) ;
+            float orog(lat, lon) ;
+            int level ;
+         data:
+            time = 1, 2 ;
+            level = 1 ;
+      }"""
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def parse(self, storage, file_format='NETCDF4_CLASSIC') :
+      parser = cdlparser.CDL3Parser(file_format=file_format, storage=storage)
+      return parser.parse_text(self.cdltext, ncfile=self.tmpfile)
+
+   def test_global_options(self) :
+      dataset = self.parse({'complevel': 4, 'shuffle': True})
+      for varname in ('time', 'tas', 'orog') :
+         filters = dataset.variables[varname].filters()
+         self.assertTrue(filters['zlib'] and filters['complevel'] == 4 and filters['shuffle'])
+      self.assertTrue(dataset.variables['level'].chunking() == 'contiguous')
+      self.assertTrue(np.array_equal(dataset.variables['time'][:], [1, 2]))
+      dataset.close()
+
+   def test_patterns(self) :
+      storage = [('*', {'zlib': True}), ('o*', {'zlib': False, 'contiguous': True})]
+      dataset = self.parse(storage)
+      self.assertTrue(dataset.variables['tas'].filters()['zlib'])
+      self.assertFalse(dataset.variables['orog'].filters()['zlib'])
+      self.assertTrue(dataset.variables['orog'].chunking() == 'contiguous')
+      dataset.close()
+
+   def test_auto_chunking(self) :
+      dataset = self.parse({'chunksizes': 'auto'})
+      self.assertTrue(dataset.variables['tas'].chunking() == [4, 180, 360])
+      self.assertTrue(dataset.variables['time'].chunking() == [1024])
+      self.assertTrue(dataset.variables['orog'].chunking() == [180, 360])
+      dataset.close()
+      self.assertTrue(cdlparser.auto_chunksizes((1000, 1000), 4) == (250, 1000))
+      self.assertTrue(cdlparser.auto_chunksizes((0, 1000, 1000), 4, 0) == (1, 250, 1000))
+
+   def test_default_record_chunking(self) :
+      dataset = self.parse(None)
+      self.assertTrue(dataset.variables['tas'].chunking() == [4, 180, 360])
+      self.assertTrue(dataset.variables['time'].chunking() == [1024])
+      self.assertTrue(dataset.variables['orog'].chunking() == 'contiguous')
+      dataset.close()
+
+   def test_record_variable_not_contiguous(self) :
+      dataset = self.parse({'contiguous': True})
+      self.assertTrue(dataset.variables['orog'].chunking() == 'contiguous')
+      self.assertTrue(dataset.variables['tas'].chunking() == [4, 180, 360])
+      dataset.close()
+
+   def test_netcdf3_ignores_options(self) :
+      dataset = self.parse({'zlib': True}, file_format='NETCDF3_CLASSIC')
+      self.assertTrue(dataset.variables['tas'].filters() is None)
+      dataset.close()
+
+   def test_bad_option(self) :
+      self.assertRaises(ValueError, cdlparser.CDL3Parser, storage={'compression': 'zlib'})
+
+   def test_cache_options(self) :
+      options1 = cdlparser.CDL3Parser().cache_options()
+      options2 = cdlparser.CDL3Parser(storage={'zlib': True}).cache_options()
+      self.assertTrue(options1 != options2)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
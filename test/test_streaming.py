@@ -0,0 +1,131 @@
+"""
+Unit tests for parsing CDL files streamed through the lexer in chunks.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class TestStreaming(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.tmpfiles = [tempfile.mkstemp(suffix='.nc')[1] for i in range(2)]
+
+   def tearDown(self) :
+      for tmpfile in self.tmpfiles :
+         if os.path.exists(tmpfile) : os.remove(tmpfile)
+
+   def compare_with_whole_file(self, filename, chunk_size) :
+      cdlfile = os.path.join(TESTFILE_DIR, filename)
+      parser = cdlparser.CDL3Parser(chunk_size=0)
+      expected = parser.parse_file(cdlfile, ncfile=self.tmpfiles[0])
+      parser = cdlparser.CDL3Parser(chunk_size=chunk_size)
+      dataset = parser.parse_file(cdlfile, ncfile=self.tmpfiles[1])
+      self.assertTrue(list(dataset.dimensions) == list(expected.dimensions))
+      for name in expected.dimensions :
+         self.assertTrue(len(dataset.dimensions[name]) == len(expected.dimensions[name]))
+      self.assertTrue(dataset.ncattrs() == expected.ncattrs())
+      for name in expected.ncattrs() :
+         self.assertTrue(np.array_equal(dataset.getncattr(name), expected.getncattr(name)))
+      self.assertTrue(list(dataset.variables) == list(expected.variables))
+      for name, var in expected.variables.items() :
+         self.assertTrue(dataset.variables[name].ncattrs() == var.ncattrs())
+         self.assertTrue(np.array_equal(dataset.variables[name][:], var[:]))
+      expected.close()
+      dataset.close()
+
+   def test_basics(self) :
+      for chunk_size in (1, 16, 100) :
+         self.compare_with_whole_file('basics.cdl', chunk_size)
+
+   def test_charvars(self) :
+      for chunk_size in (1, 16, 100) :
+         self.compare_with_whole_file('charvars.cdl', chunk_size)
+
+   def test_escaped_ncname(self) :
+      for chunk_size in (1, 16, 100) :
+         self.compare_with_whole_file('escaped_ncname.cdl', chunk_size)
+
+   def test_unlimdim(self) :
+      for chunk_size in (1, 16, 100) :
+         self.compare_with_whole_file('unlimdim.cdl', chunk_size)
+
+   def test_bigdata(self) :
+      for chunk_size in (100, 1000) :
+         self.compare_with_whole_file('bigdata.cdl', chunk_size)
+
+   def test_error_position(self) :
+      cdlfile = os.path.join(TESTFILE_DIR, 'bad_int.cdl')
+      parser = cdlparser.CDL3Parser(chunk_size=0)
+      with self.assertRaises(cdlparser.CDLSyntaxError) as expected :
+         parser.parse_file(cdlfile, ncfile=self.tmpfiles[0])
+      parser = cdlparser.CDL3Parser(chunk_size=10)
+      with self.assertRaises(cdlparser.CDLSyntaxError) as actual :
+         parser.parse_file(cdlfile, ncfile=self.tmpfiles[1])
+      self.assertTrue(str(actual.exception) == str(expected.exception))
+
+#---------------------------------------------------------------------------------------------------
+class TestRecordStreaming(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.nrecs = 2500
+      values = ", ".join([str(i) for i in range(self.nrecs*3)])
+      self.cdltext = r"""netcdf recstreaming {
+         dimensions:
+            x = 3 ;
+            namelen = 4 ;
+            time = unlimited ;
+         variables:
+            int time(time) ;
+            float tas(time, x) ;
+            char code(time, namelen) ;
+            short partial(time, x) ;
+         data:
+            tas = %s ;
+            code = "ab", "cdef", "g" ;
+            partial = 1s, 2s, 3s, 4s ;
+      }""" % values
+      self.parser = cdlparser.CDL3Parser(stream_records=True)
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def test_record_variables(self) :
+      dataset = self.parser.parse_text(self.cdltext, ncfile=self.tmpfile)
+      self.assertTrue(len(dataset.dimensions['time']) == self.nrecs)
+      data = dataset.variables['tas'][:]
+      expected = np.arange(self.nrecs*3, dtype=np.float32)
+      expected.shape = (self.nrecs, 3)
+      self.assertTrue(np.array_equal(data, expected))
+      data = dataset.variables['code'][:]
+      self.assertTrue(data.shape == (self.nrecs, 4))
+      self.assertTrue(data[1].tobytes() == b"cdef")
+      self.assertTrue(np.ma.getdata(data[3]).tobytes() == b"\0\0\0\0")
+      data = dataset.variables['partial'][:]
+      self.assertTrue(data.shape == (self.nrecs, 3))
+      self.assertTrue(data[1,0] == 4)
+      self.assertTrue(data[1,1] is np.ma.masked)
+      self.assertTrue(data[-1,-1] is np.ma.masked)
+
+   def test_bad_record_length(self) :
+      cdltext = r"""netcdf recstreaming {
+         dimensions:
+            x = 3 ;
+            time = unlimited ;
+         variables:
+            float tas(time, x) ;
+         data:
+            tas = 1, 2, 3, 4 ;
+      }"""
+      self.assertRaises(cdlparser.CDLContentError, self.parser.parse_text, cdltext,
+         ncfile=self.tmpfile)
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
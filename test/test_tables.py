@@ -0,0 +1,73 @@
+"""
+Unit tests for the sharing of lexer and parser tables between parser instances.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+
+#---------------------------------------------------------------------------------------------------
+class TestTables(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf tables {
+         dimensions:
+            x = 2 ;
+         variables:
+            int ivar(x) ;
+               ivar:name = "ivar" ;
+         data:
+            ivar = 1, 2 ;
+      }"""
+      self.tmpfiles = [tempfile.mkstemp(suffix='.nc')[1] for i in range(2)]
+
+   def tearDown(self) :
+      for tmpfile in self.tmpfiles :
+         if os.path.exists(tmpfile) : os.remove(tmpfile)
+
+   def test_shared_tables(self) :
+      parser1 = cdlparser.CDL3Parser()
+      parser2 = cdlparser.CDL3Parser()
+      self.assertTrue(parser1.parser is not parser2.parser)
+      self.assertTrue(parser1.parser.action is parser2.parser.action)
+      self.assertTrue(parser1.lexer.lexre[0][0] is parser2.lexer.lexre[0][0])
+
+   def test_cloned_lexer_states(self) :
+      parser = cdlparser.CDL3Parser()
+      lexer = parser.new_context().lexer
+      lexer.input("data: v = 1.5, 2.5, 3 ;")
+      tokens = [tok.type for tok in iter(lexer.token, None)]
+      self.assertTrue(tokens == ['DATA', 'IDENT', 'EQUALS', 'NUMERIC_RUN', 'EOL'])
+
+   def test_rebound_callables(self) :
+      parser1 = cdlparser.CDL3Parser()
+      parser2 = cdlparser.CDL3Parser()
+      ds1 = parser1.parse_text(self.cdltext, ncfile=self.tmpfiles[0])
+      ds2 = parser2.parse_text(self.cdltext.replace('"ivar"', '"other"'), ncfile=self.tmpfiles[1])
+      self.assertTrue(parser1.ncdataset is ds1 and parser2.ncdataset is ds2)
+      self.assertTrue(ds1.variables['ivar'].name == "ivar")
+      self.assertTrue(ds2.variables['ivar'].getncattr('name') == "other")
+      ds1.close()
+      ds2.close()
+
+   def test_no_table_files_in_cwd(self) :
+      cwd = os.getcwd()
+      tmpdir = tempfile.mkdtemp()
+      try :
+         os.chdir(tmpdir)
+         cdlparser.CDL3Parser()
+         self.assertTrue(os.listdir(tmpdir) == [])
+      finally :
+         os.chdir(cwd)
+         os.rmdir(tmpdir)
+
+   def test_cache_file(self) :
+      cdlparser.CDL3Parser()
+      picklefile = os.path.join(cdlparser.TABLE_CACHE_DIR, "cdl3parser-%s.pickle" \
+         % cdlparser.__version__)
+      self.assertTrue(os.path.exists(picklefile))
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
@@ -0,0 +1,125 @@
+"""
+Unit tests for the in-place update of existing netCDF files.
+"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import cdlparser
+
+#---------------------------------------------------------------------------------------------------
+class TestUpdate(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.cdltext = r"""netcdf update {
+         dimensions:
+            time = unlimited ;
+            x = 3 ;
+         variables:
+            int time(time) ;
+               time:units = "days since 2000-01-01" ;
+            float tas(time, x) ;
+               tas:_FillValue = -1.0e30f ;
+            char label(x) ;
+            short flag ;
+            :title = "update test" ;
+         data:
+            time = 1, 2 ;
+            tas = 1, 2, 3, 4, 5, 6 ;
+            label = "abc" ;
+            flag = 1 ;
+      }"""
+      self.tmpdir = tempfile.mkdtemp()
+      self.ncfile = os.path.join(self.tmpdir, 'update.nc')
+      self.reffile = os.path.join(self.tmpdir, 'reference.nc')
+      cdlparser.CDL3Parser(close_on_completion=True).parse_text(self.cdltext, ncfile=self.ncfile)
+
+   def tearDown(self) :
+      shutil.rmtree(self.tmpdir)
+
+   def update(self, cdltext, **kwargs) :
+      """Update the test file from cdltext, checking the result against a newly created file."""
+      parser = cdlparser.CDL3Parser(close_on_completion=True, update=True, **kwargs)
+      parser.parse_text(cdltext, ncfile=self.ncfile)
+      cdlparser.CDL3Parser(close_on_completion=True).parse_text(cdltext, ncfile=self.reffile)
+      with open(self.ncfile, 'rb') as f1, open(self.reffile, 'rb') as f2 :
+         self.assertTrue(f1.read() == f2.read())
+      return parser.update_report
+
+   def test_unchanged(self) :
+      inode = os.stat(self.ncfile).st_ino
+      report = self.update(self.cdltext)
+      self.assertTrue(os.stat(self.ncfile).st_ino == inode)
+      self.assertFalse(report.rebuilt)
+      self.assertTrue(report.changed == [])
+      self.assertTrue(report.unchanged == ['time', 'tas', 'label', 'flag'])
+      self.assertTrue(report.bytes_written == 0)
+
+   def test_changed_data(self) :
+      cdltext = self.cdltext.replace("4, 5, 6", "4, 5, 7").replace('"abc"', '"abd"')
+      report = self.update(cdltext)
+      self.assertFalse(report.rebuilt)
+      self.assertTrue(report.changed == ['tas', 'label'])
+      self.assertTrue(report.blocks_written == 2)
+
+   def test_changed_scalar(self) :
+      report = self.update(self.cdltext.replace("flag = 1", "flag = 2"))
+      self.assertTrue(report.changed == ['flag'])
+
+   def test_missing_data(self) :
+      report = self.update(self.cdltext.replace("tas = 1, 2, 3, 4, 5, 6 ;", ""))
+      self.assertFalse(report.rebuilt)
+      self.assertTrue(report.changed == ['tas'])
+
+   def test_more_records(self) :
+      cdltext = self.cdltext.replace("1, 2 ;", "1, 2, 3 ;").replace("6 ;", "6, 7, 8, 9 ;")
+      report = self.update(cdltext)
+      self.assertFalse(report.rebuilt)
+      self.assertTrue(report.changed == ['time', 'tas'])
+
+   def test_fewer_records(self) :
+      cdltext = self.cdltext.replace("1, 2 ;", "1 ;").replace("3, 4, 5, 6", "3")
+      report = self.update(cdltext)
+      self.assertTrue(report.rebuilt)
+      self.assertTrue("record" in report.reason)
+
+   def test_rebuild_report(self) :
+      cdltext = self.cdltext.replace("1, 2 ;", "1 ;").replace("3, 4, 5, 6", "3")
+      report = self.update(cdltext.replace('"abc"', '"abd"'))
+      self.assertTrue(report.rebuilt)
+      self.assertTrue(report.changed == [])
+      self.assertTrue(report.bytes_written == 0)
+
+   def test_stream_records(self) :
+      cdltext = self.cdltext.replace("4, 5, 6", "4, 5, 7")
+      report = self.update(cdltext, stream_records=True)
+      self.assertTrue(report.changed == ['tas'])
+
+   def test_changed_header(self) :
+      report = self.update(self.cdltext.replace('"update test"', '"new title"'))
+      self.assertTrue(report.rebuilt)
+      self.assertTrue("global attributes" in report.reason)
+      report = self.update(self.cdltext.replace("x = 3", "x = 4"))
+      self.assertTrue(report.rebuilt)
+
+   def test_stream(self) :
+      cdltext = self.cdltext.replace("1, 2 ;", "1 ;").replace("3, 4, 5, 6", "3")
+      parser = cdlparser.CDL3Parser(close_on_completion=True, update=True)
+      parser.parse_stream(io.StringIO(cdltext), ncfile=self.ncfile)
+      self.assertTrue(parser.update_report.rebuilt)
+      dataset = cdlparser.nc4.Dataset(self.ncfile)
+      self.assertTrue(len(dataset.dimensions['time']) == 1)
+      dataset.close()
+
+   def test_new_file(self) :
+      os.remove(self.ncfile)
+      parser = cdlparser.CDL3Parser(close_on_completion=True, update=True)
+      parser.parse_text(self.cdltext, ncfile=self.ncfile)
+      self.assertTrue(parser.update_report is None)
+      self.assertTrue(os.path.exists(self.ncfile))
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()
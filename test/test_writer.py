@@ -0,0 +1,110 @@
+"""
+Unit tests for the two-phase build of netCDF datasets via a header description and output backend.
+"""
+import os
+import tempfile
+import unittest
+import cdlparser
+import numpy as np
+
+TESTFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'testfiles')
+
+#---------------------------------------------------------------------------------------------------
+class RecordingWriter(cdlparser.NetCDFWriter) :
+#---------------------------------------------------------------------------------------------------
+   """Output backend that records the header descriptions passed to it."""
+   def __init__(self) :
+      self.headers = []
+
+   def define(self, header, ncfile, file_format='NETCDF3_CLASSIC', **kwargs) :
+      self.headers.append(header)
+      return cdlparser.NetCDFWriter.define(self, header, ncfile, file_format, **kwargs)
+
+#---------------------------------------------------------------------------------------------------
+class TestWriter(unittest.TestCase) :
+#---------------------------------------------------------------------------------------------------
+   def setUp(self) :
+      self.tmpfile = tempfile.mkstemp(suffix='.nc')[1]
+
+   def tearDown(self) :
+      if os.path.exists(self.tmpfile) : os.remove(self.tmpfile)
+
+   def data_size(self, header) :
+      return sum([(v.size * v.dtype.itemsize + 3) // 4 * 4 for v in header.variables.values()])
+
+   def test_header_size(self) :
+      for name in ('basics', 'charvars', 'constants', 'fillvalue', 'scalars') :
+         cdlfile = os.path.join(TESTFILE_DIR, name + '.cdl')
+         header = cdlparser.CDL3Parser(header_only=True).parse_file(cdlfile)
+         for file_format in ('NETCDF3_CLASSIC', 'NETCDF3_64BIT_OFFSET') :
+            parser = cdlparser.CDL3Parser(close_on_completion=True, file_format=file_format)
+            parser.parse_file(cdlfile, ncfile=self.tmpfile)
+            if name == 'fillvalue' : continue   # contains record variables
+            expected = os.path.getsize(self.tmpfile) - self.data_size(header)
+            self.assertTrue(header.header_size(file_format) == expected)
+      self.assertTrue(header.header_size('NETCDF4') is None)
+
+   def check_header_pad(self, parser) :
+      cdlfile = os.path.join(TESTFILE_DIR, 'basics.cdl')
+      header = cdlparser.CDL3Parser(header_only=True).parse_file(cdlfile)
+      ncdataset = parser.parse_file(cdlfile, ncfile=self.tmpfile)
+      ncdataset.close()
+      expected = header.header_size() + 1000 + self.data_size(header)
+      self.assertTrue(os.path.getsize(self.tmpfile) == expected)
+      # adding an attribute should then fit in the reserved space
+      ncdataset = cdlparser.nc4.Dataset(self.tmpfile, 'a')
+      self.assertTrue(cdlparser.HEADER_PAD_ATTNAME not in ncdataset.ncattrs())
+      ncdataset.history = "x" * 500
+      ncdataset.close()
+      self.assertTrue(os.path.getsize(self.tmpfile) == expected)
+      ncdataset = cdlparser.nc4.Dataset(self.tmpfile)
+      self.assertTrue(np.array_equal(ncdataset.variables['tas'][:].flatten(), np.arange(6)))
+      ncdataset.close()
+
+   def test_header_pad(self) :
+      self.check_header_pad(cdlparser.CDL3Parser(header_pad=1000))
+      # the private netCDF4 members used to call nc__enddef must still be available
+      ncdataset = cdlparser.nc4.Dataset(self.tmpfile, 'a')
+      self.assertTrue(callable(cdlparser.netcdf_enddef(ncdataset)))
+      ncdataset.close()
+
+   def test_header_pad_fallback(self) :
+      # without access to nc__enddef the same space is reserved by a placeholder attribute
+      from unittest import mock
+      unavailable = mock.Mock(side_effect=AttributeError("no _grpid"))
+      with mock.patch.object(cdlparser, 'netcdf_enddef', unavailable) :
+         self.check_header_pad(cdlparser.CDL3Parser(header_pad=1000))
+      self.assertTrue(unavailable.called)
+
+   def test_fill_value(self) :
+      cdltext = r"""netcdf writer {
+         dimensions:
+            x = 3 ;
+         variables:
+            short svar(x) ;
+               svar:long_name = "short variable" ;
+               svar:_FillValue = -1s ;
+         data:
+            svar = 1s, _ ;
+      }"""
+      ncdataset = cdlparser.CDL3Parser().parse_text(cdltext, ncfile=self.tmpfile)
+      var = ncdataset.variables['svar']
+      self.assertTrue(var._FillValue == -1 and var._FillValue.dtype == np.int16)
+      self.assertTrue(var.long_name == "short variable")
+      var.set_auto_mask(False)
+      self.assertTrue(np.array_equal(var[:], [1, -1, -1]))
+      ncdataset.close()
+
+   def test_custom_writer(self) :
+      writer = RecordingWriter()
+      parser = cdlparser.CDL3Parser(writer=writer)
+      ncdataset = parser.parse_file(os.path.join(TESTFILE_DIR, 'basics.cdl'), ncfile=self.tmpfile)
+      ncdataset.close()
+      self.assertTrue(len(writer.headers) == 1)
+      self.assertTrue(isinstance(writer.headers[0], cdlparser.CDLDataset))
+      self.assertTrue(list(writer.headers[0].variables) == list(ncdataset.variables))
+
+#---------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+#---------------------------------------------------------------------------------------------------
+   unittest.main()